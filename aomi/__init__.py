@@ -1,4 +1 @@
 """The Tool Known as aomi"""
-# These are loaded here because metaprogramming
-# pylint: disable=unused-import
-import aomi.model
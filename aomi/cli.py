@@ -3,22 +3,17 @@ from __future__ import print_function
 import os
 import sys
 import logging
+from importlib import import_module
 from argparse import ArgumentParser
-import aomi.vault
-import aomi.render
-import aomi.template
-import aomi.validation
-import aomi.util
-import aomi.filez
-import aomi.seed_action
-from aomi.helpers import VERSION as version
-from aomi.util import token_file, appid_file, approle_file
+import aomi.trace
 from aomi.error import unhandled
 LOG = logging.getLogger(__name__)
 
 
 def help_me(parser, opt):
     """Handle display of help and whatever diagnostics"""
+    from aomi.helpers import VERSION as version
+    from aomi.util import token_file, appid_file, approle_file
     print("aomi v%s" % version)
     print('Get started with aomi'
           ' https://autodesk.github.io/aomi/quickstart')
@@ -204,6 +199,58 @@ def base_args(parser):
                         help='Whether to reuse the existing token. Note'
                         ' this will cause metadata to not be preserved',
                         action='store_true')
+    parser.add_argument('--stats',
+                        dest='stats',
+                        help='Display a summary of Vault requests on exit',
+                        action='store_true')
+    parser.add_argument('--stats-file',
+                        dest='stats_file',
+                        help='Write a JSON summary of Vault requests'
+                        ' to this file on exit')
+    parser.add_argument('--trace',
+                        dest='trace',
+                        help='Write a trace of this aomi run to this file')
+    parser.add_argument('--trace-format',
+                        dest='trace_format',
+                        help='Format of the trace file',
+                        choices=sorted(aomi.trace.EXPORTERS.keys()),
+                        default='jsonl')
+    parser.add_argument('--profile',
+                        dest='profile',
+                        help='Write per phase cProfile data into'
+                        ' this directory')
+    parser.add_argument('--memory-report',
+                        dest='memory_report',
+                        help='Display peak memory and allocation sites'
+                        ' per phase, and memory held per resource type,'
+                        ' on exit',
+                        action='store_true')
+    parser.add_argument('--max-retries',
+                        dest='max_retries',
+                        help='Maximum retries for idempotent Vault requests',
+                        type=int,
+                        default=5)
+    parser.add_argument('--max-write-retries',
+                        dest='max_write_retries',
+                        help='Maximum retries for Vault writes',
+                        type=int,
+                        default=2)
+    parser.add_argument('--retry-budget',
+                        dest='retry_budget',
+                        help='Maximum seconds to spend retrying'
+                        ' any one Vault request',
+                        type=float,
+                        default=60.0)
+    parser.add_argument('--concurrency',
+                        dest='concurrency',
+                        help='Maximum Vault requests in flight',
+                        type=int,
+                        default=16)
+    parser.add_argument('--mount-concurrency',
+                        dest='mount_concurrency',
+                        help='Maximum Vault requests in flight per mount',
+                        type=int,
+                        default=8)
 
 
 def export_args(subparsers):
@@ -211,6 +258,15 @@ def export_args(subparsers):
     export_parser = subparsers.add_parser('export')
     export_parser.add_argument('directory',
                                help='Path where secrets will be exported into')
+    export_parser.add_argument('--icefile',
+                               dest='icefile',
+                               action='store_true',
+                               help='Export into an icefile within the path '
+                               'rather than as plain text files')
+    export_parser.add_argument('--icefile-prefix',
+                               dest='icefile_prefix',
+                               help='Prefix of icefilename')
+    compression_args(export_parser)
     secretfile_args(export_parser)
     vars_args(export_parser)
     base_args(export_parser)
@@ -228,6 +284,15 @@ def render_args(subparsers):
     thaw_from_args(render_parser)
 
 
+def timings_args(parser):
+    """Add the timings report option to a parser"""
+    parser.add_argument('--timings',
+                        dest='timings',
+                        help='Display time spent per phase and per'
+                        ' resource on exit',
+                        action='store_true')
+
+
 def diff_args(subparsers):
     """Add command line options for the diff operation"""
     diff_parser = subparsers.add_parser('diff')
@@ -235,6 +300,27 @@ def diff_args(subparsers):
     vars_args(diff_parser)
     base_args(diff_parser)
     thaw_from_args(diff_parser)
+    timings_args(diff_parser)
+    diff_parser.add_argument('--format',
+                             dest='format',
+                             choices=['text', 'jsonl'],
+                             default='text',
+                             help='Human readable text, or a JSON object '
+                             'per line for every backend and resource')
+    diff_parser.add_argument('--show-values',
+                             dest='show_values',
+                             action='store_true',
+                             help='Include secret values when '
+                             'describing changes as JSON')
+    diff_parser.add_argument('--exit-code',
+                             dest='exit_code',
+                             action='store_true',
+                             help='Exit with 1 if there are differences')
+    diff_parser.add_argument('--check',
+                             dest='check',
+                             action='store_true',
+                             help='Stop at the first difference, '
+                             'exiting with 1')
 
 
 def seed_args(subparsers):
@@ -251,9 +337,17 @@ def seed_args(subparsers):
     seed_parser.add_argument('--remove-unknown',
                              dest='remove_unknown',
                              action='store_true',
-                             help='Remove mountpoints that are not '
+                             help='Remove mountpoints, auth backends, '
+                             'audit logs and policies that are not '
                              'defined in the Secretfile')
+    seed_parser.add_argument('--remove-unknown-secrets',
+                             dest='remove_unknown_secrets',
+                             action='store_true',
+                             help='Remove secrets within mountpoints '
+                             'defined in the Secretfile that are not '
+                             'themselves defined')
     base_args(seed_parser)
+    timings_args(seed_parser)
 
 
 def thaw_from_args(parser):
@@ -274,6 +368,19 @@ def archive_args(parser):
                         'file of frozen secrets')
 
 
+def compression_args(parser):
+    """Add the command line options for compressing icefiles"""
+    parser.add_argument('--compression',
+                        dest='compression',
+                        choices=['stored', 'deflate', 'bzip2', 'lzma'],
+                        default='stored',
+                        help='How secrets are compressed within icefiles')
+    parser.add_argument('--compression-level',
+                        dest='compression_level',
+                        type=int,
+                        help='Level of deflate or bzip2 compression')
+
+
 def thaw_args(subparsers):
     """Add command line options for the thaw operation"""
     thaw_parser = subparsers.add_parser('thaw')
@@ -298,6 +405,7 @@ def freeze_args(subparsers):
     freeze_parser.add_argument('--icefile-prefix',
                                dest='icefile_prefix',
                                help='Prefix of icefilename')
+    compression_args(freeze_parser)
     secretfile_args(freeze_parser)
     archive_args(freeze_parser)
     vars_args(freeze_parser)
@@ -341,30 +449,71 @@ def token_args(subparsers):
     base_args(token_parser)
 
 
+# Every operation, the function which adds it's command line options,
+# and the modules it needs. Modules are only imported once we know
+# which operation is being run, keeping startup time down.
+OPERATIONS = (
+    ('extract_file', extract_file_args, ('aomi.vault', 'aomi.render')),
+    ('environment', environment_args, ('aomi.vault', 'aomi.render')),
+    ('aws_environment', aws_env_args, ('aomi.vault', 'aomi.render')),
+    ('seed', seed_args, ('aomi.vault', 'aomi.validation',
+                         'aomi.seed_action')),
+    ('render', render_args, ('aomi.seed_action',)),
+    ('diff', diff_args, ('aomi.vault', 'aomi.seed_action')),
+    ('freeze', freeze_args, ('aomi.filez',)),
+    ('thaw', thaw_args, ('aomi.vault', 'aomi.filez')),
+    ('template', template_args, ('aomi.vault', 'aomi.template',
+                                 'aomi.render')),
+    ('set_password', password_args, ('aomi.vault', 'aomi.util')),
+    ('token', token_args, ('aomi.vault',)),
+    ('help', help_args, ()),
+    ('export', export_args, ('aomi.vault', 'aomi.seed_action'))
+)
+# Operations which always talk to Vault
+VAULT_OPERATIONS = ('extract_file', 'environment', 'aws_environment',
+                    'seed', 'diff', 'template', 'set_password',
+                    'token', 'export')
+
+
+def requested_operation(args):
+    """Returns the operation named on the command line, if it
+    is a known one"""
+    operations = [x[0] for x in OPERATIONS]
+    for arg in args:
+        if arg.startswith('-'):
+            continue
+
+        if arg in operations:
+            return arg
+
+        break
+
+    return None
+
+
 def parser_factory(fake_args=None):
-    """Return a proper contextual OptionParser"""
+    """Return a proper contextual OptionParser. When an operation
+    other than help is specified only the options for it are
+    assembled."""
+    args = sys.argv[1:] if fake_args is None else fake_args
+    operation = requested_operation(args)
     parser = ArgumentParser(description='aomi')
     subparsers = parser.add_subparsers(dest='operation',
                                        help='Specify the data '
                                        ' or extraction operation')
-    extract_file_args(subparsers)
-    environment_args(subparsers)
-    aws_env_args(subparsers)
-    seed_args(subparsers)
-    render_args(subparsers)
-    diff_args(subparsers)
-    freeze_args(subparsers)
-    thaw_args(subparsers)
-    template_args(subparsers)
-    password_args(subparsers)
-    token_args(subparsers)
-    help_args(subparsers)
-    export_args(subparsers)
-
-    if fake_args is None:
-        return parser, parser.parse_args()
-
-    return parser, parser.parse_args(fake_args)
+    for name, parser_fun, _modules in OPERATIONS:
+        if operation in (None, 'help') or operation == name:
+            parser_fun(subparsers)
+
+    return parser, parser.parse_args(args)
+
+
+def load_operation(operation):
+    """Imports the modules needed by an operation"""
+    for name, _parser_fun, modules in OPERATIONS:
+        if name == operation:
+            for module in modules:
+                import_module(module)
 
 
 def template_runner(client, parser, args):
@@ -400,12 +549,12 @@ def ux_actions(parser, args):
         help_me(parser, args)
 
 
-def do_thaw(client, args):
+def do_thaw(args):
     """Execute the thaw operation, pulling in an actual Vault
     client if neccesary"""
     vault_client = None
     if args.gpg_pass_path:
-        vault_client = client.connect(args)
+        vault_client = aomi.vault.Client(args).connect(args)
 
     aomi.filez.thaw(vault_client, args.icefile, args)
     sys.exit(0)
@@ -415,7 +564,29 @@ def action_runner(parser, args):
     """Run appropriate action, or throw help"""
 
     ux_actions(parser, args)
-    client = aomi.vault.Client(args)
+    if args.operation is None:
+        parser.print_usage()
+        sys.exit(2)
+
+    if args.stats or args.stats_file:
+        import_module('aomi.stats').enable(args)
+
+    if args.trace:
+        aomi.trace.enable(args)
+
+    if args.profile:
+        import_module('aomi.profile').enable(args)
+
+    if args.memory_report:
+        import_module('aomi.profile').enable_memory()
+
+    if getattr(args, 'timings', False):
+        import_module('aomi.timings').enable()
+
+    load_operation(args.operation)
+    client = None
+    if args.operation in VAULT_OPERATIONS:
+        client = aomi.vault.Client(args)
 
     if args.operation == 'extract_file':
         aomi.render.raw_file(client.connect(args),
@@ -440,8 +611,8 @@ def action_runner(parser, args):
         aomi.seed_action.export(client.connect(args), args)
         sys.exit(0)
     elif args.operation == 'diff':
-        aomi.seed_action.diff(client.connect(args), args)
-        sys.exit(0)
+        drift = aomi.seed_action.diff(client.connect(args), args)
+        sys.exit(1 if drift and (args.exit_code or args.check) else 0)
     elif args.operation == 'template':
         template_runner(client.connect(args), parser, args)
     elif args.operation == 'token':
@@ -454,7 +625,7 @@ def action_runner(parser, args):
         aomi.filez.freeze(args.icefile, args)
         sys.exit(0)
     elif args.operation == 'thaw':
-        do_thaw(client, args)
+        do_thaw(args)
 
     parser.print_usage()
     sys.exit(2)
@@ -0,0 +1,218 @@
+"""Structural comparison of what aomi would write against what
+is already in Vault. Values are compared as they are walked, rather
+than by first building unicode copies of both sides, and differences
+are described as Change records. Values may also be reduced to a
+Fingerprint, so they can be compared without being kept around."""
+import sys
+import hashlib
+import binascii
+from numbers import Integral
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
+# Python 2/3 compat
+from future.utils import iteritems  # pylint: disable=E0401
+STRINGS = ("".__class__, u"".__class__)
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+
+class Change(object):
+    """A single key which differs between what is to be written
+    and what exists in Vault"""
+    __slots__ = ('action', 'key', 'old', 'new')
+
+    def __init__(self, action, key, old=None, new=None):
+        self.action = action
+        self.key = key
+        self.old = old
+        self.new = new
+
+    def __eq__(self, other):
+        return isinstance(other, Change) and \
+            (self.action, self.key, self.old, self.new) == \
+            (other.action, other.key, other.old, other.new)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Change(%r, %r, %r, %r)" % (self.action, self.key,
+                                           self.old, self.new)
+
+
+def unicodeize(val):
+    """A string as unicode. Only Python 2 needs any conversion."""
+    if sys.version_info < (3, 0) and isinstance(val, str):
+        return val.decode('utf-8')
+
+    return val
+
+
+def same(val_a, val_b):
+    """Whether two values are the same, treating byte and unicode
+    strings as equivalent at any depth"""
+    if isinstance(val_a, STRINGS) and isinstance(val_b, STRINGS):
+        return unicodeize(val_a) == unicodeize(val_b)
+    elif isinstance(val_a, Mapping) and isinstance(val_b, Mapping):
+        return not differs(val_a, val_b)
+    elif isinstance(val_a, (list, tuple)) and type(val_a) is type(val_b):
+        if len(val_a) != len(val_b):
+            return False
+
+        for index, item in enumerate(val_a):
+            if not same(item, val_b[index]):
+                return False
+
+        return True
+
+    return val_a == val_b
+
+
+def normalize_val(val):
+    """Normalize JSON/YAML derived values as they pertain
+    to Vault resources and comparison operations """
+    val = unicodeize(val)
+    if isinstance(val, STRINGS) and val.isdigit():
+        return int(val)
+    elif isinstance(val, list):
+        return ','.join(val)
+    elif val is None:
+        return ''
+
+    return val
+
+
+def raw_val(val):
+    """Values as they are, for exact comparison"""
+    return val
+
+
+def differs(dict1, dict2, ignore_missing=False):
+    """Whether two dicts differ. When ignoring missing keys the
+    second dict is expected to hold more than the first. Stops at the
+    first difference found."""
+    if ((not ignore_missing) and (len(dict1) != len(dict2))) or \
+       (ignore_missing and (len(dict1) >= len(dict2))):
+        return True
+
+    for comp_k, comp_v in iteritems(dict1):
+        if comp_k not in dict2 or not same(comp_v, dict2[comp_k]):
+            return True
+
+    return False
+
+
+def changes(obj, existing, ignore_missing=False, normalize=raw_val,
+            ignore=()):
+    """Generates a Change for every key which is changed, removed from
+    or added to an existing dict. Keys in the existing dict but not
+    the new one are not changes when ignoring missing keys. Keys to
+    ignore are skipped in the existing dict. Values are compared, and
+    given in the Change, after normalizing."""
+    for ex_k, ex_v in iteritems(existing):
+        if ex_k in ignore:
+            continue
+
+        if ex_k in obj:
+            og_value = normalize(ex_v)
+            new_value = normalize(obj[ex_k])
+            if not same(og_value, new_value):
+                yield Change(CHANGED, ex_k, og_value, new_value)
+        elif not ignore_missing:
+            yield Change(REMOVED, ex_k, old=normalize(ex_v))
+
+    for ob_k, ob_v in iteritems(obj):
+        if ob_k not in existing or ob_k in ignore:
+            yield Change(ADDED, ob_k, new=normalize(ob_v))
+
+
+def changed(obj, existing, ignore_missing=False, ignore=()):
+    """Whether there are any changes between two dicts"""
+    for _change in changes(obj, existing, ignore_missing, ignore=ignore):
+        return True
+
+    return False
+
+
+def sort_key(key):
+    """Orders dict keys of any type"""
+    if isinstance(key, STRINGS):
+        return unicodeize(key)
+
+    return u"%s" % key
+
+
+def feed_mapping(hasher, val, ignore=()):
+    """Feeds a dict into a hash, in key order"""
+    keys = sorted([x for x in val.keys() if x not in ignore], key=sort_key)
+    hasher.update(b'd%d:' % len(keys))
+    for key in keys:
+        feed(hasher, key)
+        feed(hasher, val[key])
+
+
+def feed(hasher, val):
+    """Feeds a value into a hash in a canonical form. Byte and
+    unicode strings hash the same, as do dicts regardless of order,
+    in keeping with how values are compared."""
+    if isinstance(val, STRINGS):
+        val = unicodeize(val).encode('utf-8')
+        hasher.update(b's%d:' % len(val))
+        hasher.update(val)
+    elif isinstance(val, Mapping):
+        feed_mapping(hasher, val)
+    elif isinstance(val, (list, tuple)):
+        hasher.update((b'l%d:' if isinstance(val, list) else b't%d:')
+                      % len(val))
+        for item in val:
+            feed(hasher, item)
+    elif val is None:
+        hasher.update(b'v:')
+    elif isinstance(val, float) and not val.is_integer():
+        hasher.update(b'n%s:' % repr(val).encode('utf-8'))
+    elif isinstance(val, (Integral, float)):
+        # as True == 1 == 1.0
+        hasher.update(b'n%d:' % int(val))
+    else:
+        hasher.update(b'o%s:' % repr(val).encode('utf-8'))
+
+
+def fingerprint(val, ignore=()):
+    """A stable hash of a value. Keys to ignore are
+    skipped at the top level of a dict."""
+    hasher = hashlib.sha256()
+    if isinstance(val, Mapping):
+        feed_mapping(hasher, val, ignore)
+    else:
+        feed(hasher, val)
+
+    return hasher.digest()
+
+
+class Fingerprint(object):
+    """Stands in for a value which is no longer kept around,
+    but which may still be compared against"""
+    __slots__ = ('digest',)
+
+    def __init__(self, val, ignore=()):
+        self.digest = fingerprint(val, ignore)
+
+    def matches(self, val):
+        """Whether a value is the same as the one fingerprinted"""
+        return self.digest == fingerprint(val)
+
+    def __eq__(self, other):
+        return isinstance(other, Fingerprint) and self.digest == other.digest
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __repr__(self):
+        return "Fingerprint(%s)" % \
+            binascii.hexlify(self.digest[0:8]).decode('ascii')
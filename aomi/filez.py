@@ -1,21 +1,39 @@
 """Handle various kinds of import/export of secrets"""
 from __future__ import print_function
 import os
-import shutil
+import io
+import sys
 import time
 import logging
 import datetime
 import zipfile
+import subprocess  # nosec
+from contextlib import contextmanager
 from cryptorito import key_from_keybase, has_gpg_key, \
-    import_gpg_key, encrypt, decrypt
+    import_gpg_key, decrypt, flatten, gnupg_bin, gnupg_home, \
+    gnupg_verbose, recipients_args, stderr_handle
 
-from aomi.helpers import subdir_path, ensure_dir, ensure_tmpdir
+from aomi.helpers import ensure_dir, ensure_tmpdir, extract_file
 from aomi.template import get_secretfile
 from aomi.validation import gpg_fingerprint \
     as validate_gpg_fingerprint
 import aomi.exceptions
 from aomi.model import Context
+from aomi.profile import phase
 LOG = logging.getLogger(__name__)
+# Compression which may be used within icefiles. Each archive member
+# records how it was compressed, so thawing needs no options.
+COMPRESSION = {
+    'stored': zipfile.ZIP_STORED,
+    'deflate': zipfile.ZIP_DEFLATED,
+    'bzip2': getattr(zipfile, 'ZIP_BZIP2', None),
+    'lzma': getattr(zipfile, 'ZIP_LZMA', None)
+}
+# Levels supported by each kind of compression, where it has levels
+LEVELS = {
+    'deflate': range(0, 10),
+    'bzip2': range(1, 10)
+}
 
 
 def from_keybase(username):
@@ -52,24 +70,8 @@ def grok_keys(config):
     return key_ids
 
 
-def freeze_archive(tmp_dir, dest_prefix):
-    """Generates a ZIP file of secrets"""
-    zip_filename = "%s/aomi-blah.zip" % tmp_dir
-    archive = zipfile.ZipFile(zip_filename, 'w')
-    for root, _dirnames, filenames in os.walk(dest_prefix):
-        for filename in filenames:
-            relative_path = subdir_path(root, dest_prefix).split(os.sep)[1:]
-            relative_path = os.sep.join(relative_path)
-            archive.write("%s/%s" % (root, filename),
-                          "%s/%s" % (relative_path, filename))
-
-    archive.close()
-    return zip_filename
-
-
-def freeze_encrypt(dest_dir, zip_filename, config, opt):
-    """Encrypts the zip file"""
-    pgp_keys = grok_keys(config)
+def icefile_name(dest_dir, opt):
+    """Where a new icefile will be written"""
     icefile_prefix = "aomi-%s" % \
                      os.path.basename(os.path.dirname(opt.secretfile))
     if opt.icefile_prefix:
@@ -77,25 +79,109 @@ def freeze_encrypt(dest_dir, zip_filename, config, opt):
 
     timestamp = time.strftime("%H%M%S-%m-%d-%Y",
                               datetime.datetime.now().timetuple())
-    ice_file = "%s/%s-%s.ice" % (dest_dir, icefile_prefix, timestamp)
-    if not encrypt(zip_filename, ice_file, pgp_keys):
-        raise aomi.exceptions.GPG("Unable to encrypt zipfile")
-
-    return ice_file
+    return "%s/%s-%s.ice" % (dest_dir, icefile_prefix, timestamp)
+
+
+@contextmanager
+def encrypted_stream(ice_file, pgp_keys):
+    """A file handle which is encrypted into an icefile as it is
+    written to, so nothing is written to disk in the clear. This
+    is the same as cryptorito.encrypt but reading from stdin."""
+    cmd = flatten([gnupg_bin(), "--armor", "--output", ice_file,
+                   gnupg_verbose(), gnupg_home(), recipients_args(pgp_keys),
+                   "--encrypt"])
+    handle, gpg_stderr = stderr_handle()
+    gpg_proc = subprocess.Popen(cmd,  # nosec
+                                stdin=subprocess.PIPE,
+                                stderr=gpg_stderr)
+    try:
+        yield gpg_proc.stdin
+        gpg_proc.stdin.close()
+    except Exception as exception:
+        gpg_proc.kill()
+        gpg_proc.wait()
+        if os.path.exists(ice_file):
+            os.remove(ice_file)
+
+        # most likely gpg having gone away
+        if isinstance(exception, (IOError, OSError)):
+            raise aomi.exceptions.GPG("Unable to encrypt %s: %s" %
+                                      (ice_file, exception))
+
+        raise
+    finally:
+        if handle:
+            handle.close()
+
+    if gpg_proc.wait() != 0:
+        if os.path.exists(ice_file):
+            os.remove(ice_file)
+
+        raise aomi.exceptions.GPG("Unable to encrypt %s" % ice_file)
+
+
+def compression(opt):
+    """The kind and level of compression to use in an icefile"""
+    name = getattr(opt, 'compression', None) or 'stored'
+    level = getattr(opt, 'compression_level', None)
+    if COMPRESSION.get(name) is None:
+        raise aomi.exceptions.AomiError("%s compression is not "
+                                        "supported by this Python" % name)
+
+    if level is not None and level not in LEVELS.get(name, []):
+        raise aomi.exceptions.AomiError("Invalid %s compression level %s" %
+                                        (name, level))
+
+    return COMPRESSION[name], level
+
+
+def open_archive(handle, kind=zipfile.ZIP_STORED, level=None):
+    """Opens a zip archive for writing. Only Python 3.7 and
+    later support compression levels."""
+    if level is not None and sys.version_info >= (3, 7):
+        return zipfile.ZipFile(handle, 'w', kind, compresslevel=level)
+
+    return zipfile.ZipFile(handle, 'w', kind)
+
+
+@contextmanager
+def zip_archive(handle, kind=zipfile.ZIP_STORED, level=None):
+    """A zip archive written out to a file handle as it is built.
+    Only Python 3.5 and later can write zips to a pipe, so older
+    Pythons assemble the archive in memory first."""
+    if sys.version_info >= (3, 5):
+        archive = open_archive(handle, kind, level)
+        yield archive
+        archive.close()
+    else:
+        buf = io.BytesIO()
+        archive = open_archive(buf, kind, level)
+        yield archive
+        archive.close()
+        handle.write(buf.getvalue())
 
 
 def freeze(dest_dir, opt):
     """Iterates over the Secretfile looking for secrets to freeze"""
-    tmp_dir = ensure_tmpdir()
-    dest_prefix = "%s/dest" % tmp_dir
+    with phase('freeze'):
+        freeze_secrets(dest_dir, opt)
+
+
+def freeze_secrets(dest_dir, opt):
+    """Actually freeze secrets into an icefile. Each secret is
+    read straight into the archive, which is itself written
+    straight into gpg, so there are no copies on disk."""
     ensure_dir(dest_dir)
-    ensure_dir(dest_prefix)
     config = get_secretfile(opt)
-    Context.load(config, opt) \
-           .freeze(dest_prefix)
-    zip_filename = freeze_archive(tmp_dir, dest_prefix)
-    ice_file = freeze_encrypt(dest_dir, zip_filename, config, opt)
-    shutil.rmtree(tmp_dir)
+    frozen = Context.load(config, opt).frozen()
+    kind, level = compression(opt)
+    ice_file = icefile_name(dest_dir, opt)
+    with encrypted_stream(ice_file, grok_keys(config)) as handle, \
+            zip_archive(handle, kind, level) as archive:
+        for sfile, src_file in frozen:
+            archive.write(src_file, sfile)
+            LOG.debug("Froze %s", sfile)
+
     LOG.debug("Generated file is %s", ice_file)
 
 
@@ -135,18 +221,32 @@ def thaw_decrypt(vault_client, src_file, tmp_dir, opt):
 def thaw(vault_client, src_file, opt):
     """Given the combination of a Secretfile and the output of
     a freeze operation, will restore secrets to usable locations"""
+    with phase('thaw'):
+        thaw_secrets(vault_client, src_file, opt)
+
+
+def archive_members(archive):
+    """The members of an icefile, by the name of the secret they
+    hold. Older icefiles have a leading slash on some members."""
+    return dict([(x.lstrip('/'), x) for x in archive.namelist()])
+
+
+def thaw_secrets(vault_client, src_file, opt):
+    """Actually thaw secrets from an icefile. Only the secrets
+    needed by the, possibly filtered, Secretfile are extracted
+    and they are extracted straight to where they belong."""
     if not os.path.exists(src_file):
         raise aomi.exceptions.AomiFile("%s does not exist" % src_file)
 
+    config = get_secretfile(opt)
+    ctx = Context.load(config, opt)
     tmp_dir = ensure_tmpdir()
     zip_file = thaw_decrypt(vault_client, src_file, tmp_dir, opt)
     archive = zipfile.ZipFile(zip_file, 'r')
-    for archive_file in archive.namelist():
-        archive.extract(archive_file, tmp_dir)
-        os.chmod("%s/%s" % (tmp_dir, archive_file), 0o640)
-        LOG.debug("Extracted %s from archive", archive_file)
-
     LOG.info("Thawing secrets into %s", opt.secrets)
-    config = get_secretfile(opt)
-    Context.load(config, opt) \
-           .thaw(tmp_dir)
+    members = archive_members(archive)
+    for sfile in ctx.thawed(members):
+        extract_file(archive, members[sfile], "%s/%s" % (opt.secrets, sfile))
+        LOG.debug("Thawed %s", sfile)
+
+    archive.close()
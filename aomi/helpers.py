@@ -4,22 +4,27 @@ import sys
 import os
 import atexit
 import tempfile
-import collections
-from shutil import rmtree
+from shutil import rmtree, copyfileobj
 from random import SystemRandom
+from array import array
+try:
+    from sys import intern
+except ImportError:  # python 2 has it as a builtin
+    pass
 from getpass import getpass
 import logging
-from pkg_resources import resource_string, resource_filename
 # Python 2/3 compat
 from future.utils import iteritems  # pylint: disable=E0401
+import aomi.registry
 import aomi.exceptions
 LOG = logging.getLogger(__name__)
 
 
 def my_version():
     """Return the version, checking both packaged and development locations"""
-    if os.path.exists(resource_filename(__name__, 'version')):
-        return resource_string(__name__, 'version')
+    packaged = os.path.join(os.path.dirname(__file__), 'version')
+    if os.path.exists(packaged):
+        return open(packaged).read()
 
     return open(os.path.join(os.path.dirname(__file__),
                              "..", "version")).read()
@@ -162,25 +167,53 @@ def backend_type(path, client):
     return backends[vault_path]['type']
 
 
-def load_word_file(filename):
-    """Loads a words file as a list of lines"""
-    words_file = resource_filename(__name__, "words/%s" % filename)
-    handle = open(words_file, 'r')
-    words = handle.readlines()
-    handle.close()
-    return words
+class WordList(object):
+    """A word list held as a single string, along with the offset
+    each word starts at, rather than as a list of strings"""
+    def __init__(self, text):
+        words = [x.strip() for x in text.splitlines() if x.strip()]
+        self.text = "".join(["%s\n" % x for x in words])
+        self.offsets = array('L', [0])
+        offset = 0
+        for word in words:
+            offset = offset + len(word) + 1
+            self.offsets.append(offset)
 
+    def __len__(self):
+        return len(self.offsets) - 1
 
-def choose_one(things):
+    def __getitem__(self, index):
+        if index < 0:
+            index = index + len(self)
+
+        if index < 0 or index >= len(self):
+            raise IndexError("word index out of range")
+
+        return self.text[self.offsets[index]:self.offsets[index + 1] - 1]
+
+
+_WORD_LISTS = {}
+
+
+def word_list(filename):
+    """Returns a bundled word list, only loading it the first time"""
+    if filename not in _WORD_LISTS:
+        _WORD_LISTS[filename] = WordList(aomi.registry.words(filename))
+
+    return _WORD_LISTS[filename]
+
+
+def choose_one(things, rand=None):
     """Returns a random entry from a list of things"""
-    choice = SystemRandom().randint(0, len(things) - 1)
+    choice = (rand or SystemRandom()).randint(0, len(things) - 1)
     return things[choice].strip()
 
 
-def random_word():
+def random_word(rand=None):
     """Returns a random word string"""
-    animal = choose_one(load_word_file("animals.txt"))
-    academic = choose_one(load_word_file("academic.txt"))
+    rand = rand or SystemRandom()
+    animal = choose_one(word_list("animals.txt"), rand)
+    academic = choose_one(word_list("academic.txt"), rand)
     return "%s-%s" % (academic, animal)
 
 
@@ -218,6 +251,40 @@ def ensure_dir(path):
         os.mkdir(path)
 
 
+def write_atomic(filename, data, mode=0o600):
+    """Writes a file such that it is either entirely there, with the
+    given permissions, or not there at all"""
+    handle, tmp_filename = tempfile.mkstemp(prefix='.aomi',
+                                            dir=os.path.dirname(filename))
+    try:
+        with os.fdopen(handle, 'w') as tmp_handle:
+            tmp_handle.write(data)
+
+        os.chmod(tmp_filename, mode)
+        os.rename(tmp_filename, filename)
+    except Exception:
+        os.remove(tmp_filename)
+        raise
+
+
+def extract_file(archive, member, filename, mode=0o640):
+    """Extracts a single member of a zip archive straight
+    to where it belongs, with the given permissions"""
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    handle = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(handle, 'wb') as dest_handle:
+        src_handle = archive.open(member)
+        try:
+            copyfileobj(src_handle, dest_handle)
+        finally:
+            src_handle.close()
+
+    os.chmod(filename, mode)
+
+
 def clean_tmpdir(path):
     """Invoked atexit, this removes our tmpdir"""
     if os.path.exists(path) and \
@@ -232,40 +299,13 @@ def ensure_tmpdir():
     return path
 
 
-def dict_unicodeize(some_dict):
-    """Ensure that every string in a dict is properly represented
-    by unicode strings"""
-
-    # some python 2/3 compat
-    if isinstance(some_dict, ("".__class__, u"".__class__)):
-        if sys.version_info >= (3, 0):
-            return some_dict
-
-        return some_dict.decode('utf-8')
-    elif isinstance(some_dict, collections.Mapping):
-        return dict(map(dict_unicodeize, iteritems(some_dict)))
-    elif isinstance(some_dict, collections.Iterable):
-        return type(some_dict)(map(dict_unicodeize, some_dict))
-
-    return some_dict
-
-
-def diff_dict(dict1, dict2, ignore_missing=False):
-    """Performs a base type comparison between two dicts"""
-    unidict1 = dict_unicodeize(dict1)
-    unidict2 = dict_unicodeize(dict2)
-    if ((not ignore_missing) and (len(unidict1) != len(unidict2))) or \
-       (ignore_missing and (len(unidict1) >= len(unidict2))):
-        return True
-
-    for comp_k, comp_v in iteritems(unidict1):
-        if comp_k not in unidict2:
-            return True
-        else:
-            if comp_v != unidict2[comp_k]:
-                return True
+def intern_string(string):
+    """Interns a string, such as a mount, which is repeated
+    across many resources"""
+    if isinstance(string, str):
+        return intern(string)
 
-    return False
+    return string
 
 
 def normalize_vault_path(path):
@@ -0,0 +1,150 @@
+"""Adaptive client side concurrency limiting for Vault requests.
+Requests in flight are capped both globally and per mount. Each
+cap is adjusted AIMD style, growing slowly while Vault is healthy
+and halving when Vault is rate limiting us, erroring, or when
+latency climbs well above what we have previously seen."""
+import time
+import threading
+import logging
+LOG = logging.getLogger(__name__)
+# Latency this many times the best we have seen is taken as congestion
+LATENCY_TOLERANCE = 4.0
+# Latency below this is never taken as congestion
+LATENCY_FLOOR = 0.1
+
+
+def mount_key(path):
+    """Returns the portion of a Vault path which identifies the mount
+    it is on. Auth mounts keep their second component."""
+    path_bits = path.split('/')
+    if path_bits[0] == 'auth' and len(path_bits) > 1:
+        return '/'.join(path_bits[0:2])
+
+    return path_bits[0]
+
+
+def overloaded(status):
+    """Whether or not a HTTP status indicates Vault is struggling"""
+    return status is None or status == 429 or status >= 500
+
+
+class Limit(object):
+    """A single AIMD adjusted concurrency limit"""
+    def __init__(self, initial, minimum, maximum):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self.best_latency = None
+        self.last_decrease = 0.0
+        self.waited = 0.0
+        self.max_wait = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Blocks until there is room under the limit, returning
+        the number of seconds spent waiting"""
+        start = time.time()
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+
+            self.in_flight = self.in_flight + 1
+            wait = time.time() - start
+            self.waited = self.waited + wait
+            self.max_wait = max(self.max_wait, wait)
+
+        return wait
+
+    def release(self, latency, status):
+        """Frees up a slot and adjusts the limit based on
+        how the request went"""
+        with self._cond:
+            self.in_flight = self.in_flight - 1
+            if self.best_latency is None or latency < self.best_latency:
+                self.best_latency = latency
+
+            congested = latency > LATENCY_FLOOR and \
+                latency > self.best_latency * LATENCY_TOLERANCE
+            if overloaded(status) or congested:
+                self.decrease(latency)
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+            self._cond.notify_all()
+
+    def decrease(self, latency):
+        """Multiplicative decrease, at most once per round trip so
+        a burst of failures only halves the limit once"""
+        now = time.time()
+        if now - self.last_decrease < latency:
+            return
+
+        self.last_decrease = now
+        self.limit = max(float(self.minimum), self.limit / 2)
+        LOG.debug("Reduced Vault concurrency limit to %s", int(self.limit))
+
+    def snapshot(self):
+        """Current state of this limit"""
+        with self._cond:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'queue_seconds': self.waited,
+                'max_queue_seconds': self.max_wait
+            }
+
+
+class Limiter(object):
+    """Caps requests in flight globally and per mount"""
+    def __init__(self, concurrency=16, mount_concurrency=8, initial=4):
+        self.mount_concurrency = mount_concurrency
+        self.initial = initial
+        self.limit = Limit(initial, 1, concurrency)
+        self.mounts = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_opt(opt):
+        """Builds a limiter from command line options"""
+        return Limiter(concurrency=opt.concurrency,
+                       mount_concurrency=opt.mount_concurrency)
+
+    def mount_limit(self, path):
+        """Returns the limit for the mount a path lives on"""
+        key = mount_key(path)
+        with self._lock:
+            if key not in self.mounts:
+                self.mounts[key] = Limit(self.initial, 1,
+                                         self.mount_concurrency)
+
+            return self.mounts[key]
+
+    def acquire(self, path):
+        """Waits for room under both the mount and global limit.
+        Mount limits are always acquired first so no two requests
+        can wait on each other. Returns the limits held and the
+        time spent waiting."""
+        limits = [self.mount_limit(path), self.limit]
+        wait = 0.0
+        for limit in limits:
+            wait = wait + limit.acquire()
+
+        return limits, wait
+
+    @staticmethod
+    def release(limits, latency, status):
+        """Releases previously acquired limits"""
+        for limit in reversed(limits):
+            limit.release(latency, status)
+
+    def snapshot(self):
+        """Current state of every limit"""
+        with self._lock:
+            mounts = dict(self.mounts)
+
+        return {
+            'global': self.limit.snapshot(),
+            'mounts': dict([(key, limit.snapshot())
+                            for key, limit in mounts.items()])
+        }
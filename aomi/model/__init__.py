@@ -1,11 +1,4 @@
 """A Model definition of Vault resources"""
 
-#  Ensure every defined model is loaded I guess
-import aomi.model.backend
-import aomi.model.resource
-import aomi.model.auth
-import aomi.model.aws
-import aomi.model.ssh
-import aomi.model.generic
-
+# Resource models are imported by the Context as they are needed
 from aomi.model.context import Context
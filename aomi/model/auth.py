@@ -17,20 +17,23 @@ from aomi.template import load_vars, render, load_var_file
 from aomi.model.resource import Auth, Resource
 from aomi.model.backend import NOOP, ADD
 from aomi.validation import secret_file, sanitize_mount
+from aomi.trace import traced
 LOG = logging.getLogger(__name__)
 
 
 class DUOAccess(Resource):
     """DUO API
     Access Credentials"""
+    __slots__ = ('backend', 'filename', 'host', 'secret')
     child = True
 
-    def export(self, _directory):
-        pass
+    def exports(self):
+        return []
 
     def secrets(self):
         return [self.secret]
 
+    @traced('obj')
     def obj(self):
         filename = hard_path(self.filename, self.opt.secrets)
         aomi.validation.secret_file(filename)
@@ -41,6 +44,7 @@ class DUOAccess(Resource):
             'ikey': obj['key']
         }
 
+    @traced('diff')
     def diff(self, obj=None):
         return Resource.diff_write_only(self)
 
@@ -66,6 +70,7 @@ class DUOAccess(Resource):
 class DUO(Auth):
     """DUO MFA
     Authentication Backend Decorator"""
+    __slots__ = ('access', 'host')
     required_fields = ['host', 'creds', 'backend']
     resource = 'DUO MFA'
     config_key = 'duo'
@@ -84,6 +89,7 @@ class DUO(Auth):
 
 class AppUser(Resource):
     """App User"""
+    __slots__ = ()
     required_fields = ['id']
     child = True
 
@@ -99,6 +105,7 @@ class AppUser(Resource):
 
 class AppRoleSecret(Resource):
     """Approle Secret"""
+    __slots__ = ('filename', 'role_name', 'secret_name')
     child = True
 
     def __str__(self):
@@ -111,12 +118,18 @@ class AppRoleSecret(Resource):
         self.opt = opt
         super(AppRoleSecret, self).__init__(obj, opt)
 
+    @traced('diff')
     def diff(self, obj=None):
         if self.existing and 'secret_id_accessor' in self.existing:
             return NOOP
 
         return ADD
 
+    def discard(self):
+        """The secret accessor is needed to diff"""
+        return
+
+    @traced('obj')
     def obj(self):
         filename = hard_path(self.filename, self.opt.secrets)
         aomi.validation.secret_file(filename)
@@ -168,6 +181,7 @@ class AppRoleSecret(Resource):
 
 class AppRole(Auth):
     """AppRole"""
+    __slots__ = ('app_name', 'secret_ids')
     required_fields = ['name', 'policies']
     config_key = 'approles'
 
@@ -210,6 +224,7 @@ class AppRole(Auth):
             secret_obj['role_name'] = self.app_name
             self.secret_ids.append(AppRoleSecret(secret_obj, opt))
 
+    @traced('diff')
     def diff(self, obj=None):
         obj = dict(self.obj())
         obj['policies'] = obj['policies'].split(',')
@@ -234,6 +249,7 @@ class AppRole(Auth):
 
 class TokenRole(Auth):
     """TokenRole"""
+    __slots__ = ('role_name', 'secret_ids')
     required_fields = ['name']
     config_key = 'tokenroles'
 
@@ -263,6 +279,7 @@ class TokenRole(Auth):
 
         self._obj = role_obj
 
+    @traced('diff')
     def diff(self, obj=None):
         obj = dict(self.obj())
 
@@ -290,6 +307,7 @@ class TokenRole(Auth):
 
 class LDAP(Auth):
     """LDAP Authentication"""
+    __slots__ = ('secret',)
     required_fields = ['url']
     config_key = 'ldap_auth'
 
@@ -323,6 +341,7 @@ class LDAP(Auth):
 
         return []
 
+    @traced('obj')
     def obj(self):
         ldap_obj = self._obj
         if self.secret:
@@ -337,6 +356,7 @@ class LDAP(Auth):
 
 class LDAPGroup(Resource):
     """LDAP Group Policy Mapping"""
+    __slots__ = ('group',)
     required_fields = ['policies', 'group']
     config_key = 'ldap_groups'
 
@@ -356,6 +376,7 @@ class LDAPGroup(Resource):
             s_policies = sorted(self.existing['policies'].split(','))
             self.existing['policies'] = s_policies
 
+    @traced('obj')
     def obj(self):
         return {
             'policies': sorted(self._obj.get('policies', []))
@@ -369,6 +390,7 @@ class LDAPGroup(Resource):
 
 class LDAPUser(Resource):
     """LDAP User Membership"""
+    __slots__ = ()
     required_fields = ['user']
     config_key = 'ldap_users'
 
@@ -380,6 +402,7 @@ class LDAPUser(Resource):
         map_val(self._obj, obj, 'groups', [])
         map_val(self._obj, obj, 'policies', [])
 
+    @traced('obj')
     def obj(self):
         return {
             'groups': ','.join(sorted(self._obj.get('groups', []))),
@@ -389,6 +412,7 @@ class LDAPUser(Resource):
 
 class UserPass(Auth):
     """UserPass Authentication Backend"""
+    __slots__ = ()
     config_key = 'userpass'
     no_resource = True
 
@@ -401,11 +425,12 @@ class UserPass(Auth):
 
 class UserPassUser(Auth):
     """UserPass User Account"""
+    __slots__ = ('filename', 'secret', 'username')
     required_fields = ['username', 'password_file', 'policies']
     config_key = 'users'
 
-    def export(self, _directory):
-        pass
+    def exports(self):
+        return []
 
     def __init__(self, obj, opt):
         super(UserPassUser, self).__init__('userpass', obj, opt)
@@ -423,9 +448,11 @@ class UserPassUser(Auth):
     def secrets(self):
         return [self.secret]
 
+    @traced('diff')
     def diff(self, obj=None):
         return Resource.diff_write_only(self)
 
+    @traced('obj')
     def obj(self):
         filename = hard_path(self.filename, self.opt.secrets)
         secret_file(filename)
@@ -438,6 +465,7 @@ class UserPassUser(Auth):
 
 class Policy(Resource):
     """Vault Policy"""
+    __slots__ = ('filename',)
     required_fields = ['file', 'name']
     config_key = 'policies'
 
@@ -454,6 +482,7 @@ class Policy(Resource):
         if 'vars' in obj and not isinstance(obj['vars'], dict):
             raise aomi.exceptions.Validation('policy vars must be dicts')
 
+    @traced('obj')
     def obj(self):
         return render(hard_path(self.filename, self.opt.policies), self._obj) \
             .lstrip() \
@@ -7,6 +7,7 @@ from aomi.model.resource import Secret, Resource
 from aomi.helpers import hard_path, merge_dicts
 from aomi.template import load_vars, render, load_var_file
 from aomi.validation import sanitize_mount, secret_file, check_obj
+from aomi.trace import traced
 LOG = logging.getLogger(__name__)
 
 
@@ -31,6 +32,7 @@ def grok_ttl(secret):
 
 class AWSRole(Resource):
     """AWS Role"""
+    __slots__ = ('filename',)
     required_fields = ['name', ['policy', 'arn']]
     child = True
 
@@ -45,14 +47,13 @@ class AWSRole(Resource):
             if 'policy' in self._obj:
                 self._obj['policy'] = hard_path(self.filename, opt.policies)
 
-    def export(self, directory):
+    def exports(self):
         if not hasattr(self, 'filename'):
-            return
+            return []
 
-        secret_h = self.export_handle(directory)
-        secret_h.write(self.obj()['policy'])
-        secret_h.close()
+        return [(self.filename, self.obj()['policy'])]
 
+    @traced('obj')
     def obj(self):
         s_obj = {}
         if 'policy' in self._obj:
@@ -70,6 +71,7 @@ class AWSRole(Resource):
 
 class AWSTTL(Resource):
     """AWS Lease"""
+    __slots__ = ()
     child = True
 
     def __init__(self, mount, obj, opt):
@@ -80,6 +82,7 @@ class AWSTTL(Resource):
 
 class AWS(Secret):
     """AWS Backend"""
+    __slots__ = ('mount', 'roles', 'ttl')
     resource_key = 'aws_file'
     required_fields = [['aws_file', 'aws'], 'mount',
                        'region', 'roles']
@@ -92,6 +95,7 @@ class AWS(Secret):
 
         return pieces
 
+    @traced('diff')
     def diff(self, obj=None):
         return Resource.diff_write_only(self)
 
@@ -109,6 +113,7 @@ class AWS(Secret):
             LOG.info("Removing AWS root at %s", self.path)
             self.delete(vault_client)
 
+    @traced('obj')
     def obj(self):
         _secret, filename, region = self._obj
         actual_filename = hard_path(filename, self.opt.secrets)
@@ -2,10 +2,12 @@
 import re
 import logging
 import hvac.exceptions
-from aomi.helpers import map_val, diff_dict, normalize_vault_path
+from aomi.helpers import map_val, normalize_vault_path
+from aomi.diff import differs
 from aomi.vault import is_mounted, get_backend
 import aomi.exceptions as aomi_excep
 from aomi.validation import sanitize_mount
+from aomi.trace import traced
 LOG = logging.getLogger(__name__)
 MOUNT_TUNABLES = [
     ('default_lease_ttl', int),
@@ -22,7 +24,8 @@ CONFLICT = 5
 
 class VaultBackend(object):
     """The abstract concept of a Vault backend"""
-    backend = None
+    __slots__ = ('path', 'backend', 'existing', 'present', 'config', 'managed',
+                 'opt')
     list_fun = None
     mount_fun = None
     unmount_fun = None
@@ -59,6 +62,7 @@ class VaultBackend(object):
 
         self.opt = opt
 
+    @traced('diff')
     def diff(self):
         """Determines if changes are needed for the Vault backend"""
 
@@ -70,8 +74,7 @@ class VaultBackend(object):
 
         is_diff = NOOP
         if self.present and self.existing:
-            a_obj = self.config.copy()
-            if self.config and diff_dict(a_obj, self.existing, True):
+            if self.config and differs(self.config, self.existing, True):
                 is_diff = CHANGED
 
             if self.description != self.existing.get('description'):
@@ -202,6 +205,7 @@ class VaultBackend(object):
 
 class SecretBackend(VaultBackend):
     """Secret Backends for actual Vault resources"""
+    __slots__ = ()
     list_fun = 'list_secret_backends'
     mount_fun = 'enable_secret_backend'
     unmount_fun = 'disable_secret_backend'
@@ -209,6 +213,7 @@ class SecretBackend(VaultBackend):
 
 class AuthBackend(VaultBackend):
     """Authentication backends for Vault access"""
+    __slots__ = ()
     list_fun = 'list_auth_backends'
     mount_fun = 'enable_auth_backend'
     unmount_fun = 'disable_auth_backend'
@@ -231,6 +236,7 @@ class AuthBackend(VaultBackend):
 
 class LogBackend(VaultBackend):
     """Audit Log backends"""
+    __slots__ = ('obj',)
     list_fun = 'list_audit_backends'
     mount_fun = 'enable_audit_backend'
     unmount_fun = 'disable_audit_backend'
@@ -1,19 +1,61 @@
 """A Context contains a set of Vault resources which may
 or may not end up written to the HCV instance. This
 context may be filtered, or pre/post processed."""
-import sys
-import inspect
 import logging
-from future.utils import iteritems  # pylint: disable=E0401
+import threading
+from importlib import import_module
 from aomi.helpers import normalize_vault_path
+from aomi.trace import span, resource_span
+from aomi.profile import phase, measure
+from aomi.pool import Pool
 import aomi.exceptions as aomi_excep
 from aomi.model.resource import Resource, Mount, Secret, \
     Auth, AuditLog
-from aomi.model.aws import AWS
-from aomi.model.auth import Policy, UserPass, LDAP
 from aomi.model.backend import LogBackend, AuthBackend, \
     SecretBackend
 LOG = logging.getLogger(__name__)
+# Every resource model, by the Secretfile section it is defined in and,
+# for secrets, the field which identifies the type of secret. Models
+# are only imported once a Secretfile actually makes use of them.
+MODELS = {
+    ('mounts', None): 'aomi.model.resource:Mount',
+    ('audit_logs', None): 'aomi.model.resource:AuditLog',
+    ('userpass', None): 'aomi.model.auth:UserPass',
+    ('users', None): 'aomi.model.auth:UserPassUser',
+    ('policies', None): 'aomi.model.auth:Policy',
+    ('approles', None): 'aomi.model.auth:AppRole',
+    ('tokenroles', None): 'aomi.model.auth:TokenRole',
+    ('ldap_auth', None): 'aomi.model.auth:LDAP',
+    ('ldap_groups', None): 'aomi.model.auth:LDAPGroup',
+    ('ldap_users', None): 'aomi.model.auth:LDAPUser',
+    ('duo', None): 'aomi.model.auth:DUO',
+    ('secrets', 'var_file'): 'aomi.model.generic:VarFile',
+    ('secrets', 'files'): 'aomi.model.generic:Files',
+    ('secrets', 'generated'): 'aomi.model.generic:Generated',
+    ('secrets', 'aws_file'): 'aomi.model.aws:AWS',
+    ('secrets', 'ssh_creds'): 'aomi.model.ssh:SSHRole',
+    ('secrets', 'latent_file'): 'aomi.model.resource:Latent'
+}
+# Backends are loaded first so that they exist before the
+# resources which live within them
+SEED_KEYS = ['mounts', 'audit_logs', 'userpass', 'users', 'policies',
+             'approles', 'tokenroles', 'ldap_auth', 'ldap_groups',
+             'ldap_users', 'duo', 'secrets']
+RESOURCE_KEYS = dict([(config_key, [r_key for c_key, r_key in MODELS
+                                    if c_key == config_key and r_key])
+                      for config_key in SEED_KEYS])
+_CLASSES = {}
+POLICY = ('policies', None)
+LDAP = ('ldap_auth', None)
+USERPASS = ('userpass', None)
+AWS = ('secrets', 'aws_file')
+GENERATED = ('secrets', 'generated')
+# Things Vault provides on it's own, which are never pruned
+BUILTIN_MOUNTS = frozenset(['cubbyhole', 'identity'])
+BUILTIN_AUTHS = frozenset(['token'])
+BUILTIN_POLICIES = frozenset(['root', 'default'])
+# Backends which may be walked for unknown secrets
+KV_BACKENDS = frozenset(['generic', 'kv'])
 
 
 def filtered_context(context):
@@ -23,6 +65,7 @@ def filtered_context(context):
     options to make determination."""
 
     ctx = Context(context.opt)
+    ctx.unfiltered = context
     for resource in context.resources():
         if resource.child:
             continue
@@ -67,62 +110,94 @@ def ensure_backend(resource, backend, backends, opt, managed=True):
     return existing_mount
 
 
-def find_model(config, obj, mods):
-    """Given a list of mods (as returned by py_resources) attempts to
-    determine if a given Python obj fits one of the models"""
-    for mod in mods:
-        if mod[0] != config:
-            continue
+def token_auth(vault_client, auths):
+    """The auth backends our tokens came from. The operational token
+    is usually made from the initial token, so the backend the initial
+    token logged in with is the one which matters. It is never pruned,
+    as that would revoke the tokens doing the pruning."""
+    client = vault_client.cubbyhole or vault_client
+    token = client.lookup_token()
+    path = normalize_vault_path(((token or {}).get('data') or {})
+                                .get('path') or '')
+    if not path.startswith('auth/'):
+        return set()
+
+    path = path[len('auth/'):]
+    return set([x for x in [normalize_vault_path(y) for y in auths]
+                if path.startswith("%s/" % x)])
+
+
+def unknown(existing, known, builtin=frozenset()):
+    """Paths in a listing from Vault which are neither
+    known to the context nor provided by Vault"""
+    paths = set([normalize_vault_path(x) for x in existing])
+    return sorted(paths - known - builtin)
+
+
+def list_keys(vault_client, path):
+    """The keys directly beneath a path in Vault"""
+    resp = vault_client.list(path)
+    if resp and 'data' in resp:
+        return resp['data'].get('keys') or []
+
+    return []
+
+
+def walk_secrets(vault_client, mounts, opt):
+    """Every secret path within some mounts. Each level of the tree
+    is listed as soon as it is found, concurrently."""
+    found = []
+    lock = threading.Lock()
+    with Pool.from_opt(opt) as pool:
+        def walk(path):
+            """Lists a single level of the tree"""
+            for key in list_keys(vault_client, path):
+                key_path = "%s/%s" % (path, key.rstrip('/'))
+                if key.endswith('/'):
+                    pool.submit(walk, key_path)
+                else:
+                    with lock:
+                        found.append(key_path)
+
+        for mount in mounts:
+            pool.submit(walk, mount)
+
+    return sorted(found)
+
+
+def remove(func, path, kind):
+    """Removes a single thing from Vault"""
+    LOG.info("removed unknown %s %s", kind, path)
+    func(path)
+
+
+def model_class(model_key):
+    """Returns the class for a model, importing it the first time"""
+    if model_key not in _CLASSES:
+        module, name = MODELS[model_key].split(':')
+        _CLASSES[model_key] = getattr(import_module(module), name)
+
+    return _CLASSES[model_key]
+
 
-        if len(mod) == 2:
-            return mod[1]
+def find_model(config_key, obj):
+    """Determines the model for an entry in a given
+    section of a Secretfile"""
+    if not RESOURCE_KEYS[config_key]:
+        return model_class((config_key, None))
 
-        if len(mod) == 3 and mod[1] in obj:
-            return mod[2]
+    for resource_key in RESOURCE_KEYS[config_key]:
+        if resource_key in obj:
+            return model_class((config_key, resource_key))
 
     return None
 
 
-def py_resources():
-    """Discovers all aomi Vault resource models. This includes
-    anything extending aomi.model.Mount or aomi.model.Resource."""
-    aomi_mods = [m for
-                 m, _v in iteritems(sys.modules)
-                 if m.startswith('aomi.model')]
-    mod_list = []
-    mod_map = []
-    for amod in [sys.modules[m] for m in aomi_mods]:
-        for _mod_bit, model in inspect.getmembers(amod):
-            if str(model) in mod_list:
-                continue
-
-            if model == Mount:
-                mod_list.append(str(model))
-                mod_map.append((model.config_key, model))
-            elif (inspect.isclass(model) and
-                  issubclass(model, Resource) and
-                  model.config_key):
-                mod_list.append(str(model))
-                if model.resource_key:
-                    mod_map.append((model.config_key,
-                                    model.resource_key,
-                                    model))
-                elif model.config_key != 'secrets':
-                    mod_map.append((model.config_key, model))
-
-    return mod_map
-
-
-def resource_sort(seed_key):
-    """A sorting function based on which resources
-    need to be first, in order to ensure that backends
-    are properly created."""
-    if seed_key == 'mounts' or \
-       seed_key == 'userpass' or\
-       seed_key == 'audit_logs':
-        return False
-
-    return True
+def is_model(resource, *model_keys):
+    """Whether a resource is one of the given models. Only models
+    which have been imported can have any instances."""
+    classes = tuple([_CLASSES[x] for x in model_keys if x in _CLASSES])
+    return bool(classes) and isinstance(resource, classes)
 
 
 class Context(object):
@@ -131,38 +206,50 @@ class Context(object):
     @staticmethod
     def load(config, opt):
         """Loads and returns a full context object based on the Secretfile"""
-        ctx = Context(opt)
-        seed_map = py_resources()
-        seed_keys = sorted(set([m[0] for m in seed_map]), key=resource_sort)
-        for config_key in seed_keys:
-            if config_key not in config:
-                continue
-            for resource_config in config[config_key]:
-                mod = find_model(config_key, resource_config, seed_map)
-                if not mod:
-                    LOG.warning("unable to find mod for %s", resource_config)
+        with span('context.load'), phase('load'):
+            ctx = Context(opt)
+            for config_key in SEED_KEYS:
+                if config_key not in config:
                     continue
-
-                ctx.add(mod(resource_config, opt))
-
-        for config_key in config.keys():
-            if config_key != 'pgp_keys' and \
-               config_key not in seed_keys:
-                LOG.warning("missing model for %s", config_key)
-
-        return filtered_context(ctx)
-
-    def thaw(self, tmp_dir):
-        """Will thaw every secret into an appropriate temporary location"""
+                for resource_config in config[config_key]:
+                    mod = find_model(config_key, resource_config)
+                    if not mod:
+                        LOG.warning("unable to find mod for %s",
+                                    resource_config)
+                        continue
+
+                    ctx.add(mod(resource_config, opt))
+
+            for config_key in config.keys():
+                if config_key != 'pgp_keys' and \
+                   config_key not in SEED_KEYS:
+                    LOG.warning("missing model for %s", config_key)
+
+            ctx = filtered_context(ctx)
+            measure('load', ctx)
+            return ctx
+
+    def thawed(self, members):
+        """Every secret to be thawed, from those within an icefile.
+        Secrets used by more than one resource are only included once."""
+        files = set()
         for resource in self.resources():
             if resource.present:
-                resource.thaw(tmp_dir)
+                files.update(resource.thawed(members))
+
+        return sorted(files)
 
-    def freeze(self, dest_dir):
-        """Freezes every resource within a context"""
+    def frozen(self):
+        """Every secret to be frozen, as pairs of their name within
+        an icefile and where they are now. Secrets used by more than
+        one resource are only included once."""
+        files = {}
         for resource in self.resources():
             if resource.present:
-                resource.freeze(dest_dir)
+                for sfile, src_file in resource.frozen():
+                    files[sfile] = src_file
+
+        return sorted(files.items())
 
     def __init__(self, opt):
         self._mounts = []
@@ -170,6 +257,7 @@ class Context(object):
         self._auths = []
         self._logs = []
         self.opt = opt
+        self.unfiltered = None
 
     def mounts(self):
         """Secret backends within context"""
@@ -187,7 +275,7 @@ class Context(object):
         """Vault resources within context"""
         res = []
         for resource in self._resources:
-            res = res + resource.resources()
+            res.extend(resource.resources())
 
         return res
 
@@ -222,12 +310,13 @@ class Context(object):
     def sync_policies(self, vault_client):
         """Synchronizes policies only"""
         p_resources = [x for x in self.resources()
-                       if isinstance(x, Policy)]
+                       if is_model(x, POLICY)]
         for resource in p_resources:
-            resource.sync(vault_client)
+            with resource_span('sync', resource):
+                resource.sync(vault_client)
 
         return [x for x in self.resources()
-                if not isinstance(x, Policy)]
+                if not is_model(x, POLICY)]
 
     def sync_auth(self, vault_client, resources):
         """Synchronizes auth mount wrappers. These happen
@@ -235,15 +324,18 @@ class Context(object):
         are proper. They may also be used to set mount
         tuning"""
         for auth in self.auths():
-            auth.sync(vault_client)
+            with resource_span('sync', auth):
+                auth.sync(vault_client)
 
         auth_resources = [x for x in resources
-                          if isinstance(x, (LDAP, UserPass))]
+                          if is_model(x, LDAP, USERPASS)]
         for resource in auth_resources:
-            resource.sync(vault_client)
+            with resource_span('sync', resource):
+                resource.sync(vault_client)
 
         return [x for x in resources
-                if not isinstance(x, (LDAP, UserPass, AuditLog))]
+                if not (is_model(x, LDAP, USERPASS) or
+                        isinstance(x, AuditLog))]
 
     def actually_mount(self, vault_client, resource, active_mounts):
         """Handle the actual (potential) mounting of a secret backend.
@@ -258,7 +350,8 @@ class Context(object):
         if not active_mount:
             actual_mount = find_backend(resource.mount, self._mounts)
             a_mounts.append(actual_mount)
-            actual_mount.sync(vault_client)
+            with resource_span('sync', actual_mount):
+                actual_mount.sync(vault_client)
 
         return a_mounts
 
@@ -268,7 +361,7 @@ class Context(object):
         # Create a resource set that is only explicit mounts
         # and sort so removals are first
         mounts = [x for x in resources
-                  if isinstance(x, (Mount, AWS))]
+                  if (isinstance(x, Mount) or is_model(x, AWS))]
 
         s_resources = sorted(mounts, key=absent_sort)
         # Iterate over explicit mounts only
@@ -299,62 +392,155 @@ class Context(object):
         has the effect of updating every resource which is
         in the context and has changes pending."""
         active_mounts = []
-        for audit_log in self.logs():
-            audit_log.sync(vault_client)
+        with span('sync.audit_logs'):
+            for audit_log in self.logs():
+                with resource_span('sync', audit_log):
+                    audit_log.sync(vault_client)
 
         # Handle policies only on the first pass. This allows us
         # to ensure that ACL's are in place prior to actually
         # making any changes.
-        not_policies = self.sync_policies(vault_client)
+        with span('sync.policies'):
+            not_policies = self.sync_policies(vault_client)
+
         # Handle auth wrapper resources on the next path. The resources
         # may update a path on their own. They may also provide mount
         # tuning information.
-        not_auth = self.sync_auth(vault_client, not_policies)
+        with span('sync.auth'):
+            not_auth = self.sync_auth(vault_client, not_policies)
+
         # Handle mounts only on the next pass. This allows us to
         # ensure that everything is in order prior to actually
         # provisioning secrets. Note we handle removals before
         # anything else, allowing us to address mount conflicts.
-        active_mounts, not_mounts = self.sync_mounts(active_mounts,
-                                                     not_auth,
-                                                     vault_client)
+        with span('sync.mounts'):
+            active_mounts, not_mounts = self.sync_mounts(active_mounts,
+                                                         not_auth,
+                                                         vault_client)
+
         # Now handle everything else. If "best practices" are being
         # adhered to then every generic mountpoint should exist by now.
         # We handle "child" resources after the first batch
         sorted_resources = sorted(not_mounts, key=childless_first)
-        for resource in sorted_resources:
-            resource.sync(vault_client)
-
-        for mount in self.mounts():
-            if not find_backend(mount.path, active_mounts):
-                mount.unmount(vault_client)
-
-        if opt.remove_unknown:
-            self.prune(vault_client)
+        with span('sync.resources'):
+            generated = [x for x in sorted_resources
+                         if is_model(x, GENERATED)]
+            if generated:
+                generic = import_module('aomi.model.generic')
+                generic.generate_secrets(generated)
+
+            for resource in [x for x in sorted_resources if not x.child]:
+                with resource_span('sync', resource):
+                    resource.sync(vault_client)
+
+        with span('sync.children'):
+            for resource in [x for x in sorted_resources if x.child]:
+                with resource_span('sync', resource):
+                    resource.sync(vault_client)
+
+        with span('sync.unmount'):
+            for mount in self.mounts():
+                if not find_backend(mount.path, active_mounts):
+                    with resource_span('sync', mount):
+                        mount.unmount(vault_client)
+
+        if opt.remove_unknown or \
+           getattr(opt, 'remove_unknown_secrets', False):
+            with span('sync.prune'):
+                self.prune(vault_client)
+
+    def known(self):
+        """The context everything defined in the Secretfile is
+        in, whether or not it was filtered out of this one"""
+        return self.unfiltered or self
 
     def prune(self, vault_client):
-        """Will remove any mount point which is not actually defined
-        in this context. """
-        existing = getattr(vault_client,
-                           SecretBackend.list_fun)()['data'].items()
-        for mount_name, _values in existing:
-            # ignore system paths and cubbyhole
-            mount_path = normalize_vault_path(mount_name)
-            if mount_path.startswith('sys') or mount_path == 'cubbyhole':
-                continue
-
-            exists = [resource.path
-                      for resource in self.mounts()
-                      if normalize_vault_path(resource.path) == mount_path]
-
-            if not exists:
-                LOG.info("removed unknown mount %s", mount_path)
-                getattr(vault_client, SecretBackend.unmount_fun)(mount_path)
-
-    def fetch(self, vault_client):
+        """Will remove any secret backend, auth backend, audit log
+        or policy which is not defined in the Secretfile and, if asked
+        to, any secret within a managed generic mount which is not
+        defined. Resources filtered out by tags or paths still count
+        as defined. Everything is removed concurrently."""
+        removals = []
+        if self.opt.remove_unknown:
+            removals = self.unknown_backends(vault_client) + \
+                self.unknown_policies(vault_client)
+
+        if getattr(self.opt, 'remove_unknown_secrets', False):
+            removals = removals + self.unknown_secrets(vault_client)
+
+        with Pool.from_opt(self.opt) as pool:
+            for func, path, kind in removals:
+                pool.submit(remove, func, path, kind)
+
+    def unknown_backends(self, vault_client):
+        """Secret backends, auth backends and audit logs which are
+        in Vault but not defined in the Secretfile"""
+        removals = []
+        defined = self.known()
+        mounts = getattr(vault_client, SecretBackend.list_fun)()['data']
+        known = set([normalize_vault_path(x.path)
+                     for x in defined.mounts()])
+        for path in unknown(mounts, known, BUILTIN_MOUNTS):
+            # ignore system paths
+            if not path.startswith('sys'):
+                removals.append((getattr(vault_client,
+                                         SecretBackend.unmount_fun),
+                                 path, 'mount'))
+
+        auths = getattr(vault_client, AuthBackend.list_fun)()['data']
+        known = set([normalize_vault_path(x.path) for x in defined.auths()])
+        for path in unknown(auths, known,
+                            BUILTIN_AUTHS | token_auth(vault_client, auths)):
+            removals.append((getattr(vault_client, AuthBackend.unmount_fun),
+                             path, 'auth backend'))
+
+        logs = getattr(vault_client, LogBackend.list_fun)()['data']
+        known = set([normalize_vault_path(x.obj['name'])
+                     for x in defined.logs()])
+        for path in unknown(logs, known):
+            removals.append((getattr(vault_client, LogBackend.unmount_fun),
+                             path, 'audit log'))
+
+        return removals
+
+    def unknown_policies(self, vault_client):
+        """Policies which are in Vault but not defined in the Secretfile"""
+        known = set([x.path for x in self.known().resources()
+                     if is_model(x, POLICY)])
+        return [(vault_client.delete_policy, path, 'policy')
+                for path in unknown(vault_client.list_policies(), known,
+                                    BUILTIN_POLICIES)]
+
+    def unknown_secrets(self, vault_client):
+        """Secrets which are in Vault, within a generic mount defined
+        in this context, but which are not defined in the Secretfile"""
+        mounts = [x.path for x in self.mounts()
+                  if x.managed and x.present and x.backend in KV_BACKENDS]
+        known = set([x.path for x in self.known().resources()
+                     if isinstance(x, Secret)])
+        return [(vault_client.delete, path, 'secret')
+                for path in walk_secrets(vault_client, mounts, self.opt)
+                if path not in known]
+
+    def fetch(self, vault_client, discard=False):
         """Updates the context based on the contents of the Vault
         server. Note that some resources can not be read after
         they have been written to and it is up to those classes
-        to handle that case properly."""
+        to handle that case properly. When discarding, only a
+        fingerprint of each secret is kept."""
+        with span('context.fetch'), phase('fetch'):
+            self.fetch_backends(vault_client)
+            for rsc in self.resources():
+                self.fetch_resource(vault_client, rsc, discard)
+
+            measure('fetch', self)
+
+        return self
+
+    def fetch_backends(self, vault_client):
+        """Updates every backend within the context based on what
+        is actually mounted. This must happen before any resources
+        are fetched."""
         backends = [(self.mounts, SecretBackend),
                     (self.auths, AuthBackend),
                     (self.logs, LogBackend)]
@@ -363,9 +549,14 @@ class Context(object):
             if backend_list:
                 existing = getattr(vault_client, b_class.list_fun)()
                 for backend in backend_list:
-                    backend.fetch(vault_client, existing)
-
-        for rsc in self.resources():
+                    with resource_span('fetch', backend):
+                        backend.fetch(vault_client, existing)
+
+    def fetch_resource(self, vault_client, rsc, discard=False):
+        """Updates a single resource based on the contents of the
+        Vault server, taking into account whether or not the
+        backend it lives in is actually present"""
+        with resource_span('fetch', rsc):
             if issubclass(type(rsc), Secret):
                 nc_exists = (rsc.mount != 'cubbyhole' and
                              find_backend(rsc.mount, self._mounts).existing)
@@ -380,4 +571,5 @@ class Context(object):
             else:
                 rsc.fetch(vault_client)
 
-        return self
+            if discard:
+                rsc.discard()
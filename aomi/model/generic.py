@@ -5,7 +5,9 @@ Generic Vault Resources
 * Generated/Random Secrets
 """
 import os
-from copy import deepcopy
+import binascii
+from base64 import b64encode
+from random import SystemRandom
 from uuid import uuid4
 import logging
 from future.utils import iteritems  # pylint: disable=E0401
@@ -17,11 +19,13 @@ from aomi.helpers import random_word, hard_path, \
 from aomi.template import load_vars, load_var_file
 from aomi.validation import sanitize_mount, secret_file, check_obj, \
     is_unicode_string
+from aomi.trace import traced
 LOG = logging.getLogger(__name__)
 
 
 class Generic(Secret):
     """Generic Secrets"""
+    __slots__ = ('mount',)
     backend = 'generic'
 
     def __init__(self, obj, opt):
@@ -32,6 +36,7 @@ class Generic(Secret):
 
 class VarFile(Generic):
     """Generic VarFile"""
+    __slots__ = ('secret', 'filename')
     required_fields = ['path', 'mount', 'var_file']
     resource_key = 'var_file'
 
@@ -43,6 +48,7 @@ class VarFile(Generic):
         self.secret = obj['var_file']
         self.filename = obj['var_file']
 
+    @traced('obj')
     def obj(self):
         filename = hard_path(self.filename, self.opt.secrets)
         secret_file(filename)
@@ -52,6 +58,7 @@ class VarFile(Generic):
 
 class Files(Generic):
     """Generic File"""
+    __slots__ = ('secret_format',)
     required_fields = ['path', 'mount', 'files']
     resource_key = 'files'
 
@@ -60,23 +67,21 @@ class Files(Generic):
 
     def __init__(self, obj, opt):
         super(Files, self).__init__(obj, opt)
+        self.secret_format = Generic.secret_format
         s_obj = {}
         for sfile in obj['files']:
             s_obj[sfile['name']] = sfile['source']
 
         self._obj = s_obj
 
-    def export(self, directory):
-        for name, filename in iteritems(self._obj):
-            dest_file = "%s/%s" % (directory, filename)
-            dest_dir = os.path.dirname(dest_file)
-            if not os.path.isdir(dest_dir):
-                os.mkdir(dest_dir, 0o700)
+    def exports(self):
+        if not self.existing:
+            return []
 
-            secret_h = open(dest_file, 'w')
-            secret_h.write(self.existing[name])
-            secret_h.close()
+        return [(filename, self.existing[name])
+                for name, filename in iteritems(self._obj)]
 
+    @traced('obj')
     def obj(self):
         s_obj = {}
         for name, filename in iteritems(self._obj):
@@ -98,28 +103,84 @@ class Files(Generic):
             check_obj(['source', 'name'], self.name(), fileobj)
 
 
-def generated_key(key):
-    """Create the proper generated key value"""
-    key_name = key['name']
-    if key['method'] == 'uuid':
-        LOG.debug("Setting %s to a uuid", key_name)
-        return str(uuid4())
-    elif key['method'] == 'words':
-        LOG.debug("Setting %s to random words", key_name)
-        return random_word()
-    elif key['method'] == 'static':
+# Methods which take the number of random bytes, i.e. hex:32
+SIZED_METHODS = ['hex', 'base64']
+METHODS = ['uuid', 'words', 'static'] + SIZED_METHODS
+
+
+def parse_method(method):
+    """Splits a generated secret method into it's name and size"""
+    name, _sep, size = str(method).partition(':')
+    if name not in METHODS:
+        raise aomi.exceptions.AomiData("Unexpected generated secret method %s"
+                                       % method)
+
+    if name not in SIZED_METHODS:
+        if size:
+            raise aomi.exceptions.AomiData("Generated secret method %s "
+                                           "does not take a size" % name)
+
+        return name, None
+
+    if not size.isdigit() or int(size) < 1:
+        raise aomi.exceptions.AomiData("Generated secret method %s requires "
+                                       "a number of bytes i.e. %s:32"
+                                       % (method, name))
+
+    return name, int(size)
+
+
+class SecretGenerator(object):
+    """Generates the values of generated secrets. A single
+    SystemRandom and the word lists are shared by every key."""
+    def __init__(self):
+        self.rand = SystemRandom()
+
+    def random_bytes(self, size):
+        """Random bytes from the same source SystemRandom uses"""
+        return os.urandom(size)
+
+    def value(self, key):
+        """Create the proper generated key value"""
+        key_name = key['name']
+        method, size = parse_method(key['method'])
+        if method == 'uuid':
+            LOG.debug("Setting %s to a uuid", key_name)
+            return str(uuid4())
+        elif method == 'words':
+            LOG.debug("Setting %s to random words", key_name)
+            return random_word(self.rand)
+        elif method == 'hex':
+            LOG.debug("Setting %s to %s random bytes as hex", key_name, size)
+            return binascii.hexlify(self.random_bytes(size)).decode('ascii')
+        elif method == 'base64':
+            LOG.debug("Setting %s to %s random bytes as base64",
+                      key_name, size)
+            return b64encode(self.random_bytes(size)).decode('ascii')
+
         if 'value' not in key.keys():
             raise aomi.exceptions.AomiData("Missing static value")
 
         LOG.debug("Setting %s to a static value", key_name)
         return key['value']
-    else:
-        raise aomi.exceptions.AomiData("Unexpected generated secret method %s"
-                                       % key['method'])
+
+    def generate(self, resources):
+        """Generates every key of a set of generated
+        secrets in one pass"""
+        for resource in resources:
+            resource.generated_obj(resource.generate_obj(self))
+
+
+def generate_secrets(resources):
+    """Generates the contents of any generated secrets which
+    are to be written to Vault"""
+    SecretGenerator().generate([x for x in resources
+                                if isinstance(x, Generated) and x.present])
 
 
 class Generated(Generic):
     """Generic Generated"""
+    __slots__ = ('keys', 'generated')
     required_fields = ['mount', 'path', 'keys']
     resource_key = 'generated'
     # why are generated generics stored slight differently
@@ -128,14 +189,24 @@ class Generated(Generic):
         super(Generated, self).__init__(obj['generated'], opt)
         for key in obj['generated']['keys']:
             check_obj(['name', 'method'], 'generated secret entry', key)
+            parse_method(key['method'])
+
         self.keys = obj['generated']['keys']
+        self.generated = False
+
+    def generated_obj(self, obj):
+        """Sets the secret object to generated contents"""
+        self._obj = obj
+        self.generated = True
 
-    def generate_obj(self):
+    def generate_obj(self, generator=None):
         """Generates the secret object, respecting existing information
         and user specified options"""
+        generator = generator or SecretGenerator()
         secret_obj = {}
         if self.existing:
-            secret_obj = deepcopy(self.existing)
+            # only top level keys are ever replaced
+            secret_obj = dict(self.existing)
 
         for key in self.keys:
             key_name = key['name']
@@ -145,10 +216,11 @@ class Generated(Generic):
                 LOG.debug("Not overwriting %s/%s", self.path, key_name)
                 continue
             else:
-                secret_obj[key_name] = generated_key(key)
+                secret_obj[key_name] = generator.value(key)
 
         return secret_obj
 
+    @traced('diff')
     def diff(self, obj=None):
         if self.present and not self.existing:
             return aomi.model.resource.ADD
@@ -162,6 +234,7 @@ class Generated(Generic):
         return aomi.model.resource.NOOP
 
     def sync(self, vault_client):
-        gen_obj = self.generate_obj()
-        self._obj = gen_obj
+        if not self.generated:
+            self.generated_obj(self.generate_obj())
+
         super(Generated, self).sync(vault_client)
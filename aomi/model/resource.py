@@ -1,19 +1,24 @@
 """Base Vault Resources"""
 import os
-import shutil
 import logging
 import yaml
 import hvac.exceptions
 from aomi.util import vault_time_to_s
 from aomi.vault import wrap_hvac as wrap_vault
-from aomi.helpers import is_tagged, hard_path, diff_dict, map_val, \
+from aomi.helpers import is_tagged, hard_path, map_val, \
     open_maybe_binary
+from aomi.diff import changed, Fingerprint
 from aomi.model.backend import MOUNT_TUNABLES, NOOP, CHANGED, ADD, \
     DEL, OVERWRITE
 import aomi.exceptions as aomi_excep
 from aomi.validation import check_obj, specific_path_check, is_unicode, \
     is_vault_time, secret_file
+from aomi.trace import traced
 LOG = logging.getLogger(__name__)
+# Shared by every resource without tags
+NO_TAGS = ()
+# Keys Vault adds to what it returns, which are not compared
+IGNORED_KEYS = ('refresh_interval',)
 
 
 class Resource(object):
@@ -21,6 +26,7 @@ class Resource(object):
     All aomi derived Vault resources should extend this
     class. It provides functionality for validation and
     API CRUD operations."""
+    __slots__ = ('present', 'path', 'existing', '_obj', 'tags', 'opt', 'tune')
     required_fields = []
     config_key = None
     resource_key = None
@@ -28,13 +34,13 @@ class Resource(object):
     no_resource = False
     secret_format = 'data'
 
-    def thaw(self, tmp_dir):
-        """Will perform some validation and copy a
-        decrypted secret to it's final location"""
+    def thawed(self, members):
+        """The secrets to be thawed, from those within an icefile.
+        Missing secrets are an error unless they may be ignored."""
+        files = []
         for sfile in self.secrets():
-            src_file = "%s/%s" % (tmp_dir, sfile)
-            err_msg = "%s secret missing from icefile" % (self)
-            if not os.path.exists(src_file):
+            if sfile not in members:
+                err_msg = "%s secret missing from icefile" % (self)
                 if hasattr(self.opt, 'ignore_missing') and \
                    self.opt.ignore_missing:
                     LOG.warning(err_msg)
@@ -42,13 +48,9 @@ class Resource(object):
                 else:
                     raise aomi_excep.IceFile(err_msg)
 
-            dest_file = "%s/%s" % (self.opt.secrets, sfile)
-            dest_dir = os.path.dirname(dest_file)
-            if not os.path.exists(dest_dir):
-                os.mkdir(dest_dir)
+            files.append(sfile)
 
-            shutil.copy(src_file, dest_file)
-            LOG.debug("Thawed %s %s", self, sfile)
+        return files
 
     def tunable(self, obj):
         """A tunable resource maps against a backend..."""
@@ -65,43 +67,33 @@ class Resource(object):
         if 'description'in obj:
             self.tune['description'] = obj['description']
 
-    def export_handle(self, directory):
-        """Get a filehandle for exporting"""
-        filename = getattr(self, 'filename')
-        dest_file = "%s/%s" % (directory, filename)
-        dest_dir = os.path.dirname(dest_file)
-        if not os.path.isdir(dest_dir):
-            os.mkdir(dest_dir, 0o700)
-
-        return open(dest_file, 'w')
-
-    def export(self, directory):
-        """Export exportable resources decoding as needed"""
+    def exports(self):
+        """What is to be exported, as pairs of filenames relative
+        to the export directory and their contents"""
         if not self.existing or not hasattr(self, 'filename'):
-            return
+            return []
 
-        secret_h = self.export_handle(directory)
         obj = self.existing
         if isinstance(obj, str):
-            secret_h.write(obj)
+            return [(self.filename, obj)]
         elif isinstance(obj, dict):
-            secret_h.write(yaml.safe_dump(obj))
+            return [(self.filename, yaml.safe_dump(obj))]
+
+        return []
 
-    def freeze(self, tmp_dir):
-        """Copies a secret into a particular location"""
+    def frozen(self):
+        """The secrets to be frozen, as pairs of their name
+        within an icefile and where they are now"""
+        files = []
         for sfile in self.secrets():
             src_file = hard_path(sfile, self.opt.secrets)
             if not os.path.exists(src_file):
                 raise aomi_excep.IceFile("%s secret not found at %s" %
                                          (self, src_file))
 
-            dest_file = "%s/%s" % (tmp_dir, sfile)
-            dest_dir = os.path.dirname(dest_file)
-            if not os.path.isdir(dest_dir):
-                os.mkdir(dest_dir, 0o700)
+            files.append((sfile, src_file))
 
-            shutil.copy(src_file, dest_file)
-            LOG.debug("Froze %s %s", self, sfile)
+        return files
 
     def resources(self):
         """List of included resources"""
@@ -134,6 +126,7 @@ class Resource(object):
     def __str__(self):
         return "%s %s" % (self.name(), self.path)
 
+    @traced('obj')
     def obj(self):
         """Returns the Python dict/JSON object representation
         of this Secret as it is to be written to Vault"""
@@ -151,10 +144,11 @@ class Resource(object):
         self.path = None
         self.existing = None
         self._obj = {}
-        self.tags = obj.get('tags', [])
+        self.tags = obj.get('tags', NO_TAGS)
         self.opt = opt
         self.tune = None
 
+    @traced('diff')
     def diff(self, obj=None):
         """Determine if something has changed or not"""
         if self.no_resource:
@@ -171,12 +165,11 @@ class Resource(object):
 
         is_diff = NOOP
         if self.present and self.existing:
-            if isinstance(self.existing, dict):
-                current = dict(self.existing)
-                if 'refresh_interval' in current:
-                    del current['refresh_interval']
-
-                if diff_dict(current, obj):
+            if isinstance(self.existing, Fingerprint):
+                if not self.existing.matches(obj):
+                    is_diff = CHANGED
+            elif isinstance(self.existing, dict):
+                if changed(obj, self.existing, ignore=IGNORED_KEYS):
                     is_diff = CHANGED
             elif is_unicode(self.existing):
                 if self.existing != obj:
@@ -199,6 +192,18 @@ class Resource(object):
         else:
             self.existing = None
 
+    def discard(self):
+        """Keeps only a fingerprint of the remote Vault resource
+        contents, for when they need only be compared against.
+        Empty contents are kept as they are, as they count as absent."""
+        if not self.existing:
+            return
+
+        if isinstance(self.existing, dict):
+            self.existing = Fingerprint(self.existing, IGNORED_KEYS)
+        elif is_unicode(self.existing):
+            self.existing = Fingerprint(self.existing)
+
     def sync(self, vault_client):
         """Update remove Vault resource contents if needed"""
         if self.present and not self.existing:
@@ -297,11 +302,14 @@ class Secret(Resource):
     """Vault Secrets
     These Vault resources will have some kind of secret backend
     underneath them. Seems to work with generic and AWS"""
+    __slots__ = ()
     config_key = 'secrets'
 
 
 class Auth(Resource):
     """Auth Backend"""
+    __slots__ = ('backend', 'mount')
+
     def __init__(self, backend, obj, opt):
         super(Auth, self).__init__(obj, opt)
         self.backend = backend
@@ -309,6 +317,7 @@ class Auth(Resource):
 
 class Mount(Resource):
     """Vault Generic Backend"""
+    __slots__ = ('mount',)
     required_fields = ['path']
     config_key = 'mounts'
     backend = 'generic'
@@ -325,6 +334,7 @@ class Mount(Resource):
 class AuditLog(Resource):
     """Audit Logs
     Only supports syslog and file backends"""
+    __slots__ = ('backend', 'mount')
     required_fields = ['type']
     config_key = 'audit_logs'
     no_resource = True
@@ -360,6 +370,7 @@ class Latent(Resource):
     """Latent Secret
     A latent secret is tracked only within icefiles. It will never be
     used as part of interactions with HCVault"""
+    __slots__ = ('secret',)
     required_fields = []
     resource_key = 'latent_file'
     config_key = 'secrets'
@@ -372,6 +383,7 @@ class Latent(Resource):
         super(Latent, self).__init__(obj, opt)
         self.secret = obj['latent_file']
 
+    @traced('obj')
     def obj(self):
         filename = hard_path(self.secret, self.opt.secrets)
         secret_file(filename)
@@ -5,6 +5,7 @@ from aomi.validation import sanitize_mount
 
 class SSHRole(Secret):
     """SSH Credential Backend"""
+    __slots__ = ('mount',)
     resource_key = 'ssh_creds'
     required_fields = ['key_type']
     backend = 'ssh'
@@ -0,0 +1,74 @@
+"""A small pool of worker threads for running Vault requests
+concurrently. Tasks may add further tasks as they run, which is how
+trees are walked. Requests made from the pool are still subject to
+the concurrency limits of aomi.limiter, so the number of workers
+need only be enough to keep those limits busy."""
+import threading
+import logging
+from future.moves.queue import Queue  # pylint: disable=E0401
+LOG = logging.getLogger(__name__)
+
+
+class Pool(object):
+    """Runs tasks on a fixed number of threads. The first error
+    raised by any task is raised again once the pool is joined, and
+    tasks not yet started when that happens are skipped."""
+    def __init__(self, workers=8):
+        self.workers = max(1, workers)
+        self.error = None
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    @staticmethod
+    def from_opt(opt):
+        """Builds a pool sized from command line options"""
+        return Pool(getattr(opt, 'concurrency', 8))
+
+    def __enter__(self):
+        for _index in range(self.workers):
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.join()
+
+    def submit(self, func, *args):
+        """Queues up a task"""
+        self._queue.put((func, args))
+
+    def work(self):
+        """Runs tasks until told to stop"""
+        while True:
+            func, args = self._queue.get()
+            try:
+                if func is None:
+                    return
+
+                if self.error is None:
+                    func(*args)
+            except Exception as exception:  # pylint: disable=broad-except
+                with self._lock:
+                    if self.error is None:
+                        LOG.debug("Stopping pool after %s", exception)
+                        self.error = exception
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Waits on every task, including those added while
+        waiting, then stops the workers"""
+        self._queue.join()
+        for _thread in self._threads:
+            self._queue.put((None, ()))
+
+        for thread in self._threads:
+            thread.join()
+
+        self._threads = []
+        if self.error is not None:
+            raise self.error  # pylint: disable=raising-bad-type
@@ -0,0 +1,348 @@
+"""Profiling of aomi runs. A run is split into phases (rendering the
+Secretfile, loading the context, fetching, diffing, syncing, freezing
+and thawing) and each phase is profiled separately, so it is clear
+where the time and memory goes without having to patch aomi."""
+from __future__ import print_function
+import os
+import sys
+import atexit
+import threading
+import logging
+from contextlib import contextmanager
+import aomi.exceptions
+LOG = logging.getLogger(__name__)
+# Time spent outside of any particular phase
+OTHER = 'other'
+# How many functions are shown in the summary
+TOP = 20
+# How many allocation sites are shown per phase
+TOP_SITES = 5
+
+
+class CPUProfiler(object):
+    """Keeps a cProfile profile per phase. Only one profile may be
+    active at a time, so entering a phase pauses the one around it
+    and time is attributed to the innermost phase. Phases entered
+    from other threads are not profiled."""
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.thread = None
+        self.profiles = {}
+        self._stack = []
+
+    def start(self, directory):
+        """Starts profiling, initially outside of any phase"""
+        self.enabled = True
+        self.directory = directory
+        self.thread = threading.current_thread()
+        self.enter(OTHER)
+
+    def profile(self, name):
+        """Returns the profile for a phase"""
+        if name not in self.profiles:
+            import cProfile
+            self.profiles[name] = cProfile.Profile()
+
+        return self.profiles[name]
+
+    def enter(self, name):
+        """Switches to profiling a phase"""
+        if threading.current_thread() is not self.thread:
+            return
+
+        if self._stack:
+            self.profile(self._stack[-1]).disable()
+
+        self._stack.append(name)
+        self.profile(name).enable()
+
+    def exit(self, name):
+        """Switches back to the surrounding phase"""
+        if threading.current_thread() is not self.thread or \
+           not self._stack or self._stack[-1] != name:
+            return
+
+        self.profile(self._stack.pop()).disable()
+        if self._stack:
+            self.profile(self._stack[-1]).enable()
+
+    def stop(self):
+        """Stops profiling altogether"""
+        while self._stack:
+            self.profile(self._stack.pop()).disable()
+
+        self.enabled = False
+
+    def dump(self):
+        """Writes a pstats file for every phase, returning
+        the filenames"""
+        filenames = []
+        for name, profile in sorted(self.profiles.items()):
+            filename = os.path.join(self.directory, "%s.pstats" % name)
+            profile.dump_stats(filename)
+            filenames.append(filename)
+
+        return filenames
+
+    def summary(self, stream, top=TOP):
+        """Writes the time spent per phase, and the functions
+        which took the most time overall"""
+        import pstats
+        combined = None
+        print("Time per phase", file=stream)
+        for name, profile in sorted(self.profiles.items()):
+            stats = pstats.Stats(profile, stream=stream)
+            print("  %-10s %8.3fs" % (name, stats.total_tt), file=stream)
+            if combined is None:
+                combined = stats
+            else:
+                combined.add(stats)
+
+        if combined is not None:
+            combined.sort_stats('tottime').print_stats(top)
+
+
+def deep_size(obj, seen):
+    """Approximate memory used by an object and everything it
+    refers to, skipping anything already seen"""
+    if id(obj) in seen:
+        return 0
+
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, val in obj.items():
+            size = size + deep_size(key, seen) + deep_size(val, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for val in obj:
+            size = size + deep_size(val, seen)
+    else:
+        if hasattr(obj, '__dict__'):
+            size = size + deep_size(obj.__dict__, seen)
+
+        for klass in type(obj).__mro__:
+            for slot in getattr(klass, '__slots__', ()):
+                if hasattr(obj, slot):
+                    size = size + deep_size(getattr(obj, slot), seen)
+
+    return size
+
+
+def resource_sizes(ctx):
+    """Count and approximate memory of resources in a context,
+    by type. Command line options are shared by every resource
+    so are not counted against any of them."""
+    seen = set([id(ctx.opt)])
+    sizes = {}
+    for resource in ctx.mounts() + ctx.auths() + ctx.logs() + \
+            ctx.resources():
+        name = type(resource).__name__
+        count, size = sizes.get(name, (0, 0))
+        sizes[name] = (count + 1, size + deep_size(resource, seen))
+
+    return sizes
+
+
+def allocated_lines():
+    """Memory currently allocated, and the number of blocks,
+    by source line. Only these totals are kept, as holding on to
+    whole snapshots would skew the very numbers being gathered."""
+    import tracemalloc
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__)
+    ])
+    lines = {}
+    for stat in snapshot.statistics('lineno'):
+        frame = stat.traceback[0]
+        lines[(frame.filename, frame.lineno)] = (stat.size, stat.count)
+
+    return lines
+
+
+def peak_rss():
+    """Peak resident set size of this process in KB, where known"""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss / 1024.0
+
+    return float(rss)
+
+
+def reset_peak():
+    """Resets the peak of traced memory, on Pythons which can.
+    Otherwise peaks are for the whole run so far."""
+    import tracemalloc
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+
+class MemoryProfiler(object):
+    """Tracks peak memory and where memory was allocated for
+    each phase, using tracemalloc, along with memory held by
+    resources as the context is loaded and fetched"""
+    def __init__(self):
+        self.enabled = False
+        self.thread = None
+        self.phases = {}
+        self.resources = {}
+        self._stack = []
+
+    def start(self):
+        """Starts tracing allocations"""
+        import tracemalloc
+        tracemalloc.start()
+        self.enabled = True
+        self.thread = threading.current_thread()
+
+    def enter(self, name):
+        """Notes where memory stands as a phase begins. The peak
+        is reset so it is only for this phase, keeping the peak
+        so far of the phase around it."""
+        if threading.current_thread() is not self.thread:
+            return
+
+        import tracemalloc
+        peak = tracemalloc.get_traced_memory()[1]
+        if self._stack:
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+
+        self._stack.append({'name': name,
+                            'peak': 0,
+                            'lines': allocated_lines()})
+        reset_peak()
+
+    def exit(self, name):
+        """Records the peak memory and top allocation sites
+        of a phase"""
+        if threading.current_thread() is not self.thread or \
+           not self._stack or self._stack[-1]['name'] != name:
+            return
+
+        import tracemalloc
+        started = self._stack.pop()
+        peak = max(started['peak'], tracemalloc.get_traced_memory()[1])
+        sites = []
+        for line, (size, count) in allocated_lines().items():
+            was_size, was_count = started['lines'].get(line, (0, 0))
+            if size > was_size:
+                sites.append((line, size - was_size, count - was_count))
+
+        phase_mem = self.phases.get(name, {'peak': 0, 'sites': []})
+        phase_mem['peak'] = max(phase_mem['peak'], peak)
+        phase_mem['sites'] = sorted(phase_mem['sites'] + sites,
+                                    key=lambda x: x[1],
+                                    reverse=True)[0:TOP_SITES]
+        self.phases[name] = phase_mem
+        if self._stack:
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+
+        reset_peak()
+
+    def measure(self, name, ctx):
+        """Notes memory held by the resources of a context"""
+        if self.enabled:
+            self.resources[name] = resource_sizes(ctx)
+
+    def stop(self):
+        """Stops tracing allocations"""
+        import tracemalloc
+        while self._stack:
+            self.exit(self._stack[-1]['name'])
+
+        tracemalloc.stop()
+        self.enabled = False
+
+    def summary(self, stream):
+        """Writes peak memory and allocation sites per phase,
+        and memory held per resource type"""
+        rss = peak_rss()
+        if rss is not None:
+            print("Peak RSS %.1f KB" % rss, file=stream)
+
+        print("Peak memory per phase", file=stream)
+        for name, phase_mem in sorted(self.phases.items()):
+            print("  %-10s %10.1f KB" % (name, phase_mem['peak'] / 1024.0),
+                  file=stream)
+            for (filename, lineno), size, count in phase_mem['sites']:
+                print("    %8.1f KB %6d blocks %s:%s" %
+                      (size / 1024.0, count, filename, lineno),
+                      file=stream)
+
+        for name, sizes in sorted(self.resources.items()):
+            print("Resource memory after %s" % name, file=stream)
+            for r_type, (count, size) in \
+                    sorted(sizes.items(), key=lambda x: x[1][1],
+                           reverse=True):
+                print("  %-20s %8d %10.1f KB %8.1f B avg" %
+                      (r_type, count, size / 1024.0,
+                       float(size) / count), file=stream)
+
+
+CPU = CPUProfiler()
+MEMORY = MemoryProfiler()
+PROFILERS = [CPU, MEMORY]
+
+
+@contextmanager
+def phase(name):
+    """Marks a phase of an aomi run for any enabled profilers"""
+    active = [x for x in PROFILERS if x.enabled]
+    for profiler in active:
+        profiler.enter(name)
+
+    try:
+        yield
+    finally:
+        for profiler in reversed(active):
+            profiler.exit(name)
+
+
+def measure(name, ctx):
+    """Notes memory held by the resources of a context,
+    when memory is being reported on"""
+    MEMORY.measure(name, ctx)
+
+
+def report(opt):
+    """Writes profiles and prints a summary"""
+    CPU.stop()
+    for filename in CPU.dump():
+        LOG.debug("Wrote profile %s", filename)
+
+    print("Profiles written to %s" % opt.profile, file=sys.stderr)
+    CPU.summary(sys.stderr)
+
+
+def report_memory():
+    """Prints a summary of memory use"""
+    MEMORY.stop()
+    MEMORY.summary(sys.stderr)
+
+
+def enable(opt):
+    """Starts profiling, ensuring results are written
+    when aomi exits"""
+    if not os.path.isdir(opt.profile):
+        os.makedirs(opt.profile)
+
+    CPU.start(opt.profile)
+    atexit.register(report, opt)
+
+
+def enable_memory():
+    """Starts tracing memory, ensuring a report is written
+    when aomi exits"""
+    try:
+        MEMORY.start()
+    except ImportError:
+        raise aomi.exceptions.AomiError('--memory-report requires'
+                                        ' tracemalloc (Python 3.4+)')
+
+    atexit.register(report_memory)
@@ -0,0 +1,87 @@
+"""Registry of the builtin templates, their help and the word lists
+bundled with aomi. The registry is generated into aomi/_builtins.py
+at build time so none of this requires pkg_resources, a directory
+listing or parsing YAML at run time. When running from a checkout
+without the generated module it is assembled from the source files."""
+from __future__ import print_function
+import os
+import sys
+import logging
+LOG = logging.getLogger(__name__)
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(PACKAGE_DIR, 'templates')
+WORD_DIR = os.path.join(PACKAGE_DIR, 'words')
+HELP_KEYS = ('name', 'help', 'args')
+_REGISTRY = {}
+
+
+def template_path(builtin):
+    """The location of a builtin template"""
+    return os.path.join(TEMPLATE_DIR, "%s.j2" % builtin)
+
+
+def build():
+    """Assembles the registry from the bundled files"""
+    import yaml
+    templates = {}
+    for filename in sorted(os.listdir(TEMPLATE_DIR)):
+        builtin, ext = os.path.splitext(filename)
+        if ext != '.j2':
+            continue
+
+        help_obj = {}
+        help_file = os.path.join(TEMPLATE_DIR, "%s-help.yml" % builtin)
+        if os.path.exists(help_file):
+            with open(help_file, 'r') as handle:
+                help_data = yaml.safe_load(handle)
+
+            for key in HELP_KEYS:
+                if key in help_data:
+                    help_obj[key] = help_data[key]
+
+        templates[builtin] = help_obj
+
+    words = {}
+    for filename in sorted(os.listdir(WORD_DIR)):
+        with open(os.path.join(WORD_DIR, filename), 'r') as handle:
+            words[filename] = handle.read()
+
+    return {'templates': templates, 'words': words}
+
+
+def load():
+    """Returns the registry, preferring the generated module"""
+    if not _REGISTRY:
+        try:
+            from aomi._builtins import TEMPLATES, WORDS
+            _REGISTRY['templates'] = TEMPLATES
+            _REGISTRY['words'] = WORDS
+        except ImportError:
+            LOG.debug("Assembling builtin registry from %s", PACKAGE_DIR)
+            _REGISTRY.update(build())
+
+    return _REGISTRY
+
+
+def templates():
+    """Every builtin template name, and it's help"""
+    return load()['templates']
+
+
+def words(filename):
+    """The contents of a bundled word list"""
+    return load()['words'][filename]
+
+
+def write(filename):
+    """Writes the registry out as a Python module"""
+    registry = build()
+    with open(filename, 'w') as handle:
+        handle.write('"""Generated by aomi.registry, do not edit"""\n')
+        handle.write("TEMPLATES = %r\n" % registry['templates'])
+        handle.write("WORDS = %r\n" % registry['words'])
+
+
+if __name__ == '__main__':
+    write(sys.argv[1] if len(sys.argv) > 1 else
+          os.path.join(PACKAGE_DIR, '_builtins.py'))
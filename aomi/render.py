@@ -4,13 +4,12 @@ import os
 import sys
 import logging
 from future.utils import iteritems  # pylint: disable=E0401
-from pkg_resources import resource_filename
 import hvac
 from cryptorito import portable_b64decode, is_base64
 from aomi.helpers import merge_dicts, cli_hash, \
     path_pieces, abspath
-from aomi.template import render, load_vars
 from aomi.vault import renew_secret, is_aws
+import aomi.registry
 import aomi.exceptions
 LOG = logging.getLogger(__name__)
 
@@ -36,13 +35,13 @@ def grok_template_file(src):
     if not src.startswith('builtin:'):
         return abspath(src)
 
-    builtin = src.split(':')[1]
-    builtin = "templates/%s.j2" % builtin
-    return resource_filename(__name__, builtin)
+    return aomi.registry.template_path(src.split(':')[1])
 
 
 def blend_vars(secrets, opt):
     """Blends secret and static variables together"""
+    # Jinja is only pulled in for operations which render templates
+    from aomi.template import load_vars
     base_obj = load_vars(opt)
     merged = merge_dicts(base_obj, secrets)
     template_obj = dict((k, v) for k, v in iteritems(merged) if v)
@@ -53,6 +52,7 @@ def blend_vars(secrets, opt):
 
 def template(client, src, dest, paths, opt):
     """Writes a template using variables from a vault path"""
+    from aomi.template import render
     key_map = cli_hash(opt.key_map)
     obj = {}
     for path in paths:
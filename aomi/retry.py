@@ -0,0 +1,122 @@
+"""Retry policy for Vault requests. Idempotent reads and writes
+are retried on different conditions, backoff uses decorrelated
+jitter so that many aomi processes do not retry in lock step, and
+the server may tell us how long to wait via Retry-After."""
+import time
+from random import SystemRandom
+import logging
+from email.utils import parsedate_tz, mktime_tz
+from requests.exceptions import ConnectionError as RequestsConnectionError, \
+    ConnectTimeout, Timeout, SSLError
+LOG = logging.getLogger(__name__)
+IDEMPOTENT = ('GET', 'HEAD', 'LIST', 'OPTIONS')
+# 429 is rate limiting (or an unsealed standby), 473 is a performance
+# standby and 503 is sealed or otherwise unavailable. Reads may also
+# be retried on the more generic gateway style errors.
+READ_STATUS = (429, 473, 500, 502, 503, 504)
+WRITE_STATUS = (429, 503)
+# The health endpoint communicates state via status codes
+NO_RETRY_PATHS = ('/v1/sys/health',)
+
+
+def retry_after(response):
+    """Returns the number of seconds a server has asked us to
+    wait, if any. Handles both delta seconds and HTTP dates."""
+    if response is None:
+        return None
+
+    header = response.headers.get('Retry-After')
+    if not header:
+        return None
+
+    header = header.strip()
+    if header.isdigit():
+        return float(header)
+
+    a_date = parsedate_tz(header)
+    if a_date is None:
+        LOG.debug("Ignoring invalid Retry-After %s", header)
+        return None
+
+    return max(0.0, mktime_tz(a_date) - time.time())
+
+
+class RetryPolicy(object):
+    """Describes how Vault requests may be retried"""
+    def __init__(self, reads=5, writes=2, budget=60.0, base=0.5, cap=30.0):
+        self.reads = reads
+        self.writes = writes
+        self.budget = budget
+        self.base = base
+        self.cap = cap
+
+    @staticmethod
+    def from_opt(opt):
+        """Builds a retry policy from command line options"""
+        return RetryPolicy(reads=opt.max_retries,
+                           writes=opt.max_write_retries,
+                           budget=opt.retry_budget)
+
+    def state(self, request):
+        """Returns the retry state for a single request"""
+        return RetryState(self, request)
+
+
+class RetryState(object):
+    """Tracks the retries of a single request"""
+    def __init__(self, policy, request):
+        self.policy = policy
+        self.idempotent = request.method.upper() in IDEMPOTENT
+        self.statuses = READ_STATUS if self.idempotent else WRITE_STATUS
+        self.max_retries = policy.reads if self.idempotent else policy.writes
+        for path in NO_RETRY_PATHS:
+            if path in request.url:
+                self.statuses = ()
+
+        self.retries = 0
+        self.slept = 0.0
+        self.started = time.time()
+        self._sleep = policy.base
+
+    def retryable(self, response, exception):
+        """Determines whether a response or exception may be retried"""
+        if exception is not None:
+            if isinstance(exception, SSLError):
+                return False
+
+            # writes are only retried if we know they never made it
+            if self.idempotent:
+                return isinstance(exception,
+                                  (RequestsConnectionError, Timeout))
+
+            return isinstance(exception, ConnectTimeout)
+
+        return response.status_code in self.statuses
+
+    def backoff(self):
+        """Decorrelated jitter, each delay a random amount between
+        the base and three times the last delay, up to the cap"""
+        # https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/  # noqa: E501
+        self._sleep = min(self.policy.cap,
+                          SystemRandom().uniform(self.policy.base,
+                                                 self._sleep * 3))
+        return self._sleep
+
+    def next_delay(self, response=None, exception=None):
+        """Returns how long to wait before retrying,
+        or None if we should not retry"""
+        if self.retries >= self.max_retries or \
+           not self.retryable(response, exception):
+            return None
+
+        delay = retry_after(response)
+        if delay is None:
+            delay = self.backoff()
+
+        if time.time() - self.started + delay > self.policy.budget:
+            LOG.debug("Retry budget of %ss exhausted", self.policy.budget)
+            return None
+
+        self.retries = self.retries + 1
+        self.slept = self.slept + delay
+        return delay
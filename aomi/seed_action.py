@@ -1,6 +1,8 @@
 """ The aomi "seed" loop """
 from __future__ import print_function
 import os
+import sys
+import json
 import difflib
 import logging
 from shutil import rmtree
@@ -8,19 +10,38 @@ import tempfile
 from termcolor import colored
 import yaml
 from future.utils import iteritems  # pylint: disable=E0401
-from aomi.helpers import dict_unicodeize
-from aomi.filez import thaw
+from aomi.filez import thaw, grok_keys, icefile_name, encrypted_stream, \
+    zip_archive, compression
+from aomi.helpers import write_atomic, ensure_dir
+from aomi.pool import Pool
 from aomi.model import Context
+from aomi.model.context import is_model, POLICY
 from aomi.template import get_secretfile, render_secretfile
-from aomi.model.resource import Resource
+from aomi.model.resource import Resource, Secret
 from aomi.model.backend import CHANGED, ADD, DEL, OVERWRITE, NOOP, \
     CONFLICT, VaultBackend
 from aomi.model.auth import Policy
 from aomi.model.aws import AWSRole
 from aomi.validation import is_unicode
+from aomi.diff import changes, normalize_val, ADDED, REMOVED
+from aomi.trace import span
+from aomi.profile import phase, measure
 import aomi.error
 import aomi.exceptions
 LOG = logging.getLogger(__name__)
+# How diff results are named in JSON lines output
+ACTIONS = {
+    NOOP: 'noop',
+    ADD: 'add',
+    CHANGED: 'change',
+    DEL: 'remove',
+    OVERWRITE: 'overwrite',
+    CONFLICT: 'conflict'
+}
+# How many JSON lines records are written at a time
+FLUSH_EVERY = 64
+# What counts as drift
+DRIFT = (ADD, CHANGED, DEL, CONFLICT)
 
 
 def auto_thaw(vault_client, opt):
@@ -39,9 +60,10 @@ def seed(vault_client, opt):
         opt.secrets = tempfile.mkdtemp('aomi-thaw')
         auto_thaw(vault_client, opt)
 
-    Context.load(get_secretfile(opt), opt) \
-           .fetch(vault_client) \
-           .sync(vault_client, opt)
+    ctx = Context.load(get_secretfile(opt), opt) \
+                 .fetch(vault_client)
+    with phase('sync'):
+        ctx.sync(vault_client, opt)
 
     if opt.thaw_from:
         rmtree(opt.secrets)
@@ -82,13 +104,64 @@ def render(directory, opt):
                     open(filename, 'w').write(r_obj['policy'])
 
 
+def export_files(resources):
+    """Every file to be exported, and it's contents. When
+    more than one resource exports a file the last one wins."""
+    files = {}
+    for resource in resources:
+        for filename, data in resource.exports():
+            files[filename] = data
+
+    return files
+
+
+def export_directory(files, opt):
+    """Writes exported files into a directory. Every directory
+    needed is created up front, and then files are written out
+    concurrently."""
+    files = dict([(os.path.join(opt.directory, filename), data)
+                  for filename, data in iteritems(files)])
+    for directory in sorted(set([os.path.dirname(x) for x in files])):
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+
+    with Pool.from_opt(opt) as pool:
+        for filename, data in iteritems(files):
+            pool.submit(write_atomic, filename, data)
+
+
+def export_icefile(files, pgp_keys, opt):
+    """Writes exported files straight into an encrypted icefile"""
+    ensure_dir(opt.directory)
+    kind, level = compression(opt)
+    ice_file = icefile_name(opt.directory, opt)
+    with encrypted_stream(ice_file, pgp_keys) as handle, \
+            zip_archive(handle, kind, level) as archive:
+        for filename, data in sorted(iteritems(files)):
+            archive.writestr(filename, data)
+
+    LOG.debug("Generated file is %s", ice_file)
+
+
 def export(vault_client, opt):
     """Export contents of a Secretfile from the Vault server
-    into a specified directory."""
-    ctx = Context.load(get_secretfile(opt), opt) \
-                 .fetch(vault_client)
-    for resource in ctx.resources():
-        resource.export(opt.directory)
+    into a specified directory, or an icefile within it. Resources
+    are fetched concurrently."""
+    config = get_secretfile(opt)
+    pgp_keys = grok_keys(config) if opt.icefile else None
+    ctx = Context.load(config, opt)
+    with span('export'), phase('export'):
+        ctx.fetch_backends(vault_client)
+        resources = ctx.resources()
+        with Pool.from_opt(opt) as pool:
+            for resource in resources:
+                pool.submit(ctx.fetch_resource, vault_client, resource)
+
+        files = export_files(resources)
+        if opt.icefile:
+            export_icefile(files, pgp_keys, opt)
+        else:
+            export_directory(files, opt)
 
 
 def maybe_colored(msg, color, opt):
@@ -99,43 +172,25 @@ def maybe_colored(msg, color, opt):
     return colored(msg, color)
 
 
-def normalize_val(val):
-    """Normalize JSON/YAML derived values as they pertain
-    to Vault resources and comparison operations """
-    if is_unicode(val) and val.isdigit():
-        return int(val)
-    elif isinstance(val, list):
-        return ','.join(val)
-    elif val is None:
-        return ''
-
-    return val
-
-
 def details_dict(obj, existing, ignore_missing, opt):
     """Output the changes, if any, for a dict"""
-    existing = dict_unicodeize(existing)
-    obj = dict_unicodeize(obj)
-    for ex_k, ex_v in iteritems(existing):
-        new_value = normalize_val(obj.get(ex_k))
-        og_value = normalize_val(ex_v)
-        if ex_k in obj and og_value != new_value:
-            print(maybe_colored("-- %s: %s" % (ex_k, og_value),
+    for change in changes(obj, existing, ignore_missing, normalize_val):
+        if change.action != ADDED:
+            print(maybe_colored("-- %s: %s" % (change.key, change.old),
                                 'red', opt))
-            print(maybe_colored("++ %s: %s" % (ex_k, new_value),
+
+        if change.action != REMOVED:
+            print(maybe_colored("++ %s: %s" % (change.key, change.new),
                                 'green', opt))
 
-        if (not ignore_missing) and (ex_k not in obj):
-            print(maybe_colored("-- %s: %s" % (ex_k, og_value),
-                                'red', opt))
 
-    for ob_k, ob_v in iteritems(obj):
-        val = normalize_val(ob_v)
-        if ob_k not in existing:
-            print(maybe_colored("++ %s: %s" % (ob_k, val),
-                                'green', opt))
+def compared(thing):
+    """What is to be written, and what exists, for a
+    Vault backend or resource"""
+    if isinstance(thing, VaultBackend):
+        return thing.config, thing.existing
 
-    return
+    return thing.obj(), thing.existing
 
 
 def maybe_details(resource, opt):
@@ -148,15 +203,7 @@ def maybe_details(resource, opt):
     if not resource.present:
         return
 
-    obj = None
-    existing = None
-    if isinstance(resource, Resource):
-        obj = resource.obj()
-        existing = resource.existing
-    elif isinstance(resource, VaultBackend):
-        obj = resource.config
-        existing = resource.existing
-
+    obj, existing = compared(resource)
     if not obj:
         return
 
@@ -178,10 +225,71 @@ def maybe_details(resource, opt):
         details_dict(obj, existing, ignore_missing, opt)
 
 
-def diff_a_thing(thing, opt):
+class RecordWriter(object):
+    """Writes diff records as JSON lines, a batch at a time"""
+    def __init__(self, stream, flush_every=FLUSH_EVERY):
+        self.stream = stream
+        self.flush_every = flush_every
+        self.pending = []
+
+    def write(self, record):
+        """Queues a record, writing out the batch once full"""
+        self.pending.append(json.dumps(record, sort_keys=True, default=str))
+        if len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Writes out any queued records"""
+        if self.pending:
+            self.stream.write("\n".join(self.pending) + "\n")
+            self.stream.flush()
+            self.pending = []
+
+
+def change_record(change, opt):
+    """A changed key, with values only if they are to be shown"""
+    record = {'key': change.key, 'action': change.action}
+    if opt.show_values:
+        if change.action != ADDED:
+            record['old'] = change.old
+
+        if change.action != REMOVED:
+            record['new'] = change.new
+
+    return record
+
+
+def diff_record(thing, changed, opt):
+    """Describes the diff of a Vault backend or resource"""
+    record = {
+        'kind': 'backend' if isinstance(thing, VaultBackend) else 'resource',
+        'type': type(thing).__name__,
+        'path': thing.path,
+        'action': ACTIONS[changed]
+    }
+    if changed in (ADD, CHANGED) and thing.present:
+        obj, existing = compared(thing)
+        if changed == ADD and not existing:
+            existing = {}
+
+        if isinstance(obj, dict) and isinstance(existing, dict):
+            ignore_missing = isinstance(thing, VaultBackend)
+            record['changes'] = [change_record(x, opt) for x in
+                                 changes(obj, existing, ignore_missing,
+                                         normalize_val)]
+
+    return record
+
+
+def diff_a_thing(thing, opt, records=None):
     """Handle the diff action for a single thing. It may be a Vault backend
-    implementation or it may be a Vault data resource"""
+    implementation or it may be a Vault data resource. Returns what,
+    if anything, has changed."""
     changed = thing.diff()
+    if records is not None:
+        records.write(diff_record(thing, changed, opt))
+        return changed
+
     if changed == ADD:
         print("%s %s" % (maybe_colored("+", "green", opt), str(thing)))
     elif changed == DEL:
@@ -196,22 +304,75 @@ def diff_a_thing(thing, opt):
     if changed != OVERWRITE and changed != NOOP:
         maybe_details(thing, opt)
 
+    return changed
+
+
+def is_drift(changed):
+    """Whether a diff result counts as drift. Write only resources
+    are always overwritten, so that alone is not taken as drift."""
+    return changed in DRIFT
+
+
+def check_cost(resource):
+    """Used to sort resources so those which are cheapest to read
+    come first. Policies are a single small read, and secrets are
+    the most numerous and the largest."""
+    if is_model(resource, POLICY):
+        return 0
+    elif isinstance(resource, Secret):
+        return 2
+
+    return 1
+
 
 def diff(vault_client, opt):
     """Derive a comparison between what is represented in the Secretfile
-    and what is actually live on a Vault instance"""
+    and what is actually live on a Vault instance. Each resource is
+    fetched and then diffed in turn, so results are available as soon
+    as possible. Returns whether there are any differences. When only
+    checking, the cheapest things are compared first and nothing more
+    is read once there is a difference."""
     if opt.thaw_from:
         opt.secrets = tempfile.mkdtemp('aomi-thaw')
         auto_thaw(vault_client, opt)
 
-    ctx = Context.load(get_secretfile(opt), opt) \
-                 .fetch(vault_client)
-
-    for backend in ctx.mounts():
-        diff_a_thing(backend, opt)
-
-    for resource in ctx.resources():
-        diff_a_thing(resource, opt)
+    ctx = Context.load(get_secretfile(opt), opt)
+    records = None
+    if getattr(opt, 'format', 'text') == 'jsonl':
+        records = RecordWriter(sys.stdout)
+
+    check = getattr(opt, 'check', False)
+    resources = ctx.resources()
+    if check:
+        resources = sorted(resources, key=check_cost)
+
+    # secret values are only needed when they are to be shown
+    discard = records is None and not opt.verbose
+    drift = False
+    with span('diff'), phase('diff'):
+        ctx.fetch_backends(vault_client)
+        for backend in ctx.mounts():
+            changed = diff_a_thing(backend, opt, records)
+            drift = drift or is_drift(changed)
+            if check and drift:
+                resources = []
+                break
+
+        for resource in resources:
+            ctx.fetch_resource(vault_client, resource, discard)
+            changed = diff_a_thing(resource, opt, records)
+            resource.discard()
+            drift = drift or is_drift(changed)
+            if check and drift:
+                LOG.debug("Stopping at first difference %s", resource)
+                break
+
+        measure('fetch', ctx)
+
+    if records is not None:
+        records.flush()
 
     if opt.thaw_from:
         rmtree(opt.secrets)
+
+    return drift
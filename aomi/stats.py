@@ -0,0 +1,239 @@
+"""Per-request instrumentation of Vault interactions. Every request
+made through aomi.vault.Client is timed and recorded here when
+statistics have been requested on the command line."""
+from __future__ import print_function
+import sys
+import json
+import math
+import atexit
+import threading
+import logging
+from contextlib import contextmanager
+from requests.compat import urlparse
+LOG = logging.getLogger(__name__)
+SLOWEST = 10
+UNKNOWN = '-'
+
+
+def operation(method, url):
+    """Returns the Vault operation associated with a HTTP method"""
+    method = method.upper()
+    if method == 'LIST' or \
+       (method == 'GET' and 'list=true' in urlparse(url).query.lower()):
+        return 'list'
+    elif method == 'GET':
+        return 'read'
+    elif method in ('PUT', 'POST'):
+        return 'write'
+    elif method == 'DELETE':
+        return 'delete'
+
+    return method.lower()
+
+
+def vault_path(url):
+    """Returns the Vault path of a request, sans API version"""
+    path_bits = [x for x in urlparse(url).path.split('/') if x]
+    if path_bits and path_bits[0] == 'v1':
+        path_bits = path_bits[1:]
+
+    return '/'.join(path_bits)
+
+
+def path_template(path):
+    """Collapses a Vault path down to the part which identifies
+    where in Vault it lives. Secret paths are reduced to the mount
+    while sys/ and auth/ paths keep their second component"""
+    path_bits = path.split('/')
+    keep = 1
+    if path_bits[0] in ('sys', 'auth'):
+        keep = 2
+
+    if len(path_bits) <= keep:
+        return path
+
+    return "%s/*" % '/'.join(path_bits[0:keep])
+
+
+def percentile(values, pct):
+    """Nearest rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+def body_size(body):
+    """Size of a request body, which may or may not be present"""
+    if body is None:
+        return 0
+
+    return len(body)
+
+
+def latency_summary(latencies):
+    """Summarizes a list of latencies"""
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'total': sum(latencies),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'max': latencies[-1] if latencies else 0.0
+    }
+
+
+def group_summary(calls, key):
+    """Summarizes a list of calls grouped by a particular key"""
+    groups = {}
+    for call in calls:
+        groups.setdefault(call[key], []).append(call['seconds'])
+
+    return dict([(name, latency_summary(latencies))
+                 for name, latencies in groups.items()])
+
+
+class Stats(object):
+    """Collects Vault request information. Recording is thread
+    safe, and the resource type being acted upon is tracked per
+    thread."""
+    def __init__(self):
+        self.enabled = False
+        self._calls = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._gauges = {}
+
+    def gauge(self, name, fun):
+        """Registers a function which reports some current
+        state to be included in the summary"""
+        self._gauges[name] = fun
+
+    @contextmanager
+    def resource(self, name):
+        """Attributes any requests made within the block
+        to a particular type of resource"""
+        previous = getattr(self._local, 'resource', None)
+        self._local.resource = name
+        try:
+            yield
+        finally:
+            self._local.resource = previous
+
+    def record(self, request, response, seconds,
+               retries=0, retry_seconds=0.0, queue_seconds=0.0):
+        """Records a single HTTP request made to Vault"""
+        if not self.enabled:
+            return
+
+        path = vault_path(request.url)
+        call = {
+            'operation': operation(request.method, request.url),
+            'path': path,
+            'template': path_template(path),
+            'resource': getattr(self._local, 'resource', None) or UNKNOWN,
+            'status': None,
+            'retries': retries,
+            'retry_seconds': retry_seconds,
+            'queue_seconds': queue_seconds,
+            'bytes': body_size(request.body),
+            'seconds': seconds
+        }
+        if response is not None:
+            call['status'] = response.status_code
+            call['bytes'] = call['bytes'] + len(response.content or b'')
+
+        with self._lock:
+            self._calls.append(call)
+
+    def calls(self):
+        """Every recorded call"""
+        with self._lock:
+            return list(self._calls)
+
+    def summary(self, slowest=SLOWEST):
+        """Returns a summary of every recorded call"""
+        calls = self.calls()
+        by_latency = sorted(calls, key=lambda x: x['seconds'], reverse=True)
+        return {
+            'requests': len(calls),
+            'seconds': sum([x['seconds'] for x in calls]),
+            'retries': sum([x['retries'] for x in calls]),
+            'retry_seconds': sum([x['retry_seconds'] for x in calls]),
+            'queue_seconds': sum([x['queue_seconds'] for x in calls]),
+            'max_queue_seconds': max([x['queue_seconds'] for x in calls]
+                                     or [0.0]),
+            'gauges': dict([(name, fun())
+                            for name, fun in self._gauges.items()]),
+            'bytes': sum([x['bytes'] for x in calls]),
+            'operations': group_summary(calls, 'operation'),
+            'resources': group_summary(calls, 'resource'),
+            'templates': group_summary(calls, 'template'),
+            'slowest': by_latency[0:slowest]
+        }
+
+
+STATS = Stats()
+
+
+def print_group(title, group, handle):
+    """Prints a table of latency information for a group of calls"""
+    print("%-32s %7s %9s %9s %9s" % (title, 'count', 'p50', 'p95', 'max'),
+          file=handle)
+    ordered = sorted(group.items(), key=lambda x: x[1]['total'],
+                     reverse=True)
+    for name, info in ordered:
+        print("%-32s %7d %8.3fs %8.3fs %8.3fs" %
+              (name, info['count'], info['p50'], info['p95'], info['max']),
+              file=handle)
+
+    print('', file=handle)
+
+
+def print_summary(summary, handle=sys.stderr):
+    """Prints a human readable summary of Vault requests"""
+    print("%s Vault requests, %.3fs, %s retries (%.3fs), %s bytes" %
+          (summary['requests'], summary['seconds'],
+           summary['retries'], summary['retry_seconds'],
+           summary['bytes']), file=handle)
+    print("%.3fs queued for concurrency limits, at most %.3fs" %
+          (summary['queue_seconds'], summary['max_queue_seconds']),
+          file=handle)
+    limiter = summary['gauges'].get('limiter')
+    if limiter:
+        print("concurrency limit %s, per mount: %s" %
+              (limiter['global']['limit'],
+               ', '.join(["%s=%s" % (key, limit['limit'])
+                          for key, limit
+                          in sorted(limiter['mounts'].items())])),
+              file=handle)
+
+    print('', file=handle)
+    print_group('operation', summary['operations'], handle)
+    print_group('resource', summary['resources'], handle)
+    print_group('path', summary['templates'], handle)
+    print('slowest', file=handle)
+    for call in summary['slowest']:
+        print("%8.3fs %-6s %s (%s, %s retries)" %
+              (call['seconds'], call['operation'],
+               call['path'], call['status'], call['retries']), file=handle)
+
+
+def report(opt):
+    """Emits statistics as requested on the command line"""
+    summary = STATS.summary()
+    if opt.stats_file:
+        LOG.debug("Writing Vault statistics to %s", opt.stats_file)
+        with open(opt.stats_file, 'w') as handle:
+            json.dump(summary, handle, indent=2, sort_keys=True)
+
+    if opt.stats:
+        print_summary(summary)
+
+
+def enable(opt):
+    """Starts recording statistics and ensures they
+    are reported when aomi exits"""
+    STATS.enabled = True
+    atexit.register(report, opt)
@@ -7,13 +7,15 @@ import traceback
 import json
 # Python 2/3 compat
 from future.utils import iteritems  # pylint: disable=E0401
-from pkg_resources import resource_listdir, resource_filename
 import yaml
 from jinja2 import Environment, FileSystemLoader, meta
 import jinja2.nodes
 import jinja2.exceptions
 from cryptorito import portable_b64encode, portable_b64decode, polite_string
 from aomi.helpers import merge_dicts, abspath, cli_hash
+import aomi.registry
+from aomi.trace import span
+from aomi.profile import phase
 import aomi.exceptions as aomi_excep
 LOG = logging.getLogger(__name__)
 
@@ -118,6 +120,12 @@ def missing_vars(template_vars, parsed_content, obj):
 
 def render(filename, obj):
     """Render a template, maybe mixing in extra variables"""
+    with span('render', template=filename):
+        return render_template(filename, obj)
+
+
+def render_template(filename, obj):
+    """Actually render a template"""
     template_path = abspath(filename)
     env = jinja_env(template_path)
     template_base = os.path.basename(template_path)
@@ -205,32 +213,12 @@ def load_var_file(filename, obj):
 
 def load_template_help(builtin):
     """Loads the help for a given template"""
-
-    help_file = "templates/%s-help.yml" % builtin
-    help_file = resource_filename(__name__, help_file)
-    help_obj = {}
-    if os.path.exists(help_file):
-        help_data = yaml.safe_load(open(help_file))
-        if 'name' in help_data:
-            help_obj['name'] = help_data['name']
-
-        if 'help' in help_data:
-            help_obj['help'] = help_data['help']
-
-        if 'args' in help_data:
-            help_obj['args'] = help_data['args']
-
-    return help_obj
+    return dict(aomi.registry.templates().get(builtin, {}))
 
 
 def builtin_list():
     """Show a listing of all our builtin templates"""
-    for template in resource_listdir(__name__, "templates"):
-        builtin, ext = os.path.splitext(os.path.basename(abspath(template)))
-        if ext == '.yml':
-            continue
-
-        help_obj = load_template_help(builtin)
+    for builtin, help_obj in sorted(aomi.registry.templates().items()):
         if 'name' in help_obj:
             print("%-*s %s" % (20, builtin, help_obj['name']))
         else:
@@ -253,12 +241,15 @@ def builtin_info(builtin):
 
 def get_secretfile(opt):
     """Returns the de-YAML'd rendered Secretfile"""
-    return yaml.safe_load(render_secretfile(opt))
+    with span('get_secretfile', secretfile=opt.secretfile), \
+            phase('render'):
+        return yaml.safe_load(render_secretfile(opt))
 
 
 def render_secretfile(opt):
     """Renders and returns the Secretfile construct"""
     LOG.debug("Using Secretfile %s", opt.secretfile)
-    secretfile_path = abspath(opt.secretfile)
-    obj = load_vars(opt)
-    return render(secretfile_path, obj)
+    with phase('render'):
+        secretfile_path = abspath(opt.secretfile)
+        obj = load_vars(opt)
+        return render(secretfile_path, obj)
@@ -0,0 +1,135 @@
+"""Timing reports for seed and diff. These are assembled from the
+spans recorded by aomi.trace, showing where the time went in each
+phase of a run and which resources were the most expensive to render,
+read, diff and write."""
+from __future__ import print_function
+import sys
+import atexit
+from aomi.trace import TRACER
+# Phases which are reported on, and the spans which cover them
+PHASES = [
+    ('render', 'get_secretfile'),
+    ('load', 'context.load'),
+    ('fetch', 'context.fetch'),
+    ('diff', 'diff'),
+    ('audit logs', 'sync.audit_logs'),
+    ('policies', 'sync.policies'),
+    ('auth', 'sync.auth'),
+    ('mounts', 'sync.mounts'),
+    ('resources', 'sync.resources'),
+    ('children', 'sync.children'),
+    ('unmount', 'sync.unmount'),
+    ('prune', 'sync.prune')
+]
+# Spans around work on a single resource, and what they are reported as
+KINDS = {
+    'obj': 'render',
+    'fetch': 'read',
+    'diff': 'diff',
+    'sync': 'write'
+}
+COLUMNS = ['render', 'read', 'diff', 'write']
+# How many of the slowest resources are shown
+TOP = 20
+
+
+def phase_times(spans):
+    """Wall time spent in each phase"""
+    times = {}
+    for a_span in spans:
+        times[a_span.name] = times.get(a_span.name, 0.0) + a_span.duration()
+
+    return [(name, times[span_name]) for name, span_name in PHASES
+            if span_name in times]
+
+
+def resource_times(spans):
+    """Time spent on each resource, by kind of work. Work nests, as
+    diffing renders and writing may diff, so each span only counts
+    the time not spent in the resource spans within it."""
+    by_id = dict([(x.span_id, x) for x in spans])
+    times = {}
+    for a_span in spans:
+        if a_span.name not in KINDS or 'resource' not in a_span.attrs:
+            continue
+
+        key = (a_span.attrs['type'], a_span.attrs['resource'])
+        column = KINDS[a_span.name]
+        if key not in times:
+            times[key] = dict([(x, 0.0) for x in COLUMNS])
+
+        times[key][column] = times[key][column] + a_span.duration()
+        parent = by_id.get(a_span.parent)
+        while parent is not None and \
+                (parent.name not in KINDS or 'resource' not in parent.attrs):
+            parent = by_id.get(parent.parent)
+
+        if parent is not None:
+            p_key = (parent.attrs['type'], parent.attrs['resource'])
+            p_column = KINDS[parent.name]
+            if p_key not in times:
+                times[p_key] = dict([(x, 0.0) for x in COLUMNS])
+
+            times[p_key][p_column] = times[p_key][p_column] - \
+                a_span.duration()
+
+    return times
+
+
+def type_times(times):
+    """Resource times rolled up by type of resource"""
+    by_type = {}
+    for (r_type, _resource), r_times in times.items():
+        t_times = by_type.get(r_type, dict([(x, 0.0) for x in COLUMNS]))
+        t_times['count'] = t_times.get('count', 0) + 1
+        for column in COLUMNS:
+            t_times[column] = t_times[column] + r_times[column]
+
+        by_type[r_type] = t_times
+
+    return by_type
+
+
+def total(times):
+    """Overall time across every kind of work"""
+    return sum([times[x] for x in COLUMNS])
+
+
+def print_times(label, rows, stream):
+    """Prints a table of times, most expensive first"""
+    print("%-40s %8s %8s %8s %8s %8s" %
+          tuple([label] + COLUMNS + ['total']), file=stream)
+    for name, times in sorted(rows, key=lambda x: total(x[1]),
+                              reverse=True):
+        print("%-40s %8.3f %8.3f %8.3f %8.3f %8.3f" %
+              tuple([name[0:40]] + [times[x] for x in COLUMNS] +
+                    [total(times)]), file=stream)
+
+
+def report(stream=None, top=TOP):
+    """Prints the timing breakdown of this run"""
+    stream = stream or sys.stderr
+    spans = TRACER.spans()
+    print("Time per phase", file=stream)
+    for name, seconds in phase_times(spans):
+        print("  %-12s %8.3fs" % (name, seconds), file=stream)
+
+    times = resource_times(spans)
+    by_type = type_times(times)
+    print_times('resource type',
+                [("%s (%s)" % (r_type, t_times['count']), t_times)
+                 for r_type, t_times in by_type.items()],
+                stream)
+    slowest = sorted(times.items(), key=lambda x: total(x[1]),
+                     reverse=True)[0:top]
+    print_times("slowest %s resources" % len(slowest),
+                [(resource, r_times)
+                 for (_r_type, resource), r_times in slowest],
+                stream)
+
+
+def enable():
+    """Starts recording spans, ensuring timings are
+    reported when aomi exits"""
+    TRACER.enabled = True
+    atexit.register(report)
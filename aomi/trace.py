@@ -0,0 +1,167 @@
+"""Lightweight tracing of aomi operations. Nested spans are
+recorded around the expensive parts of an aomi run and may be
+exported to a local file for inspection in a trace viewer."""
+import os
+import json
+import time
+import atexit
+import threading
+import logging
+from functools import wraps
+from contextlib import contextmanager
+LOG = logging.getLogger(__name__)
+
+
+class Span(object):
+    """A single timed operation, possibly nested within another"""
+    def __init__(self, span_id, parent, name, attrs):
+        self.span_id = span_id
+        self.parent = parent
+        self.name = name
+        self.attrs = attrs
+        self.thread = threading.current_thread().ident
+        self.start = time.time()
+        self.end = None
+
+    def duration(self):
+        """How long the span was open for, in seconds"""
+        if self.end is None:
+            return 0.0
+
+        return self.end - self.start
+
+
+class Tracer(object):
+    """Collects spans. Each thread maintains it's own stack
+    of open spans so nesting is tracked per thread."""
+    def __init__(self):
+        self.enabled = False
+        self._spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._next_id = 0
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Opens a span for the duration of the block. The span
+        itself is yielded so attributes may be added to it, and
+        will be None when tracing is not enabled."""
+        if not self.enabled:
+            yield None
+            return
+
+        stack = self._stack()
+        parent = stack[-1].span_id if stack else None
+        with self._lock:
+            self._next_id = self._next_id + 1
+            a_span = Span(self._next_id, parent, name, attrs)
+
+        stack.append(a_span)
+        try:
+            yield a_span
+        finally:
+            a_span.end = time.time()
+            stack.pop()
+            with self._lock:
+                self._spans.append(a_span)
+
+    def spans(self):
+        """Every completed span, in order of start time"""
+        with self._lock:
+            return sorted(self._spans, key=lambda x: x.start)
+
+
+def export_jsonl(spans, handle):
+    """Writes one JSON object per span"""
+    for a_span in spans:
+        handle.write(json.dumps({
+            'id': a_span.span_id,
+            'parent': a_span.parent,
+            'name': a_span.name,
+            'thread': a_span.thread,
+            'start': a_span.start,
+            'end': a_span.end,
+            'duration': a_span.duration(),
+            'attrs': a_span.attrs
+        }, sort_keys=True))
+        handle.write("\n")
+
+
+def export_chrome(spans, handle):
+    """Writes spans as Chrome trace events, suitable for
+    chrome://tracing or any compatible viewer"""
+    pid = os.getpid()
+    events = []
+    for a_span in spans:
+        events.append({
+            'name': a_span.name,
+            'cat': 'aomi',
+            'ph': 'X',
+            'ts': int(a_span.start * 1000000),
+            'dur': int(a_span.duration() * 1000000),
+            'pid': pid,
+            'tid': a_span.thread,
+            'args': a_span.attrs
+        })
+
+    json.dump({'traceEvents': events}, handle)
+
+
+EXPORTERS = {
+    'jsonl': export_jsonl,
+    'chrome': export_chrome
+}
+TRACER = Tracer()
+
+
+def span(name, **attrs):
+    """Opens a span on the global tracer"""
+    return TRACER.span(name, **attrs)
+
+
+def resource_span(name, resource):
+    """Opens a span for work on a particular resource. The
+    resource is only described when tracing is enabled."""
+    if not TRACER.enabled:
+        return TRACER.span(name)
+
+    return TRACER.span(name, resource=str(resource),
+                       type=type(resource).__name__)
+
+
+def traced(name):
+    """Decorates a resource method so each call is a span. Nothing
+    about the resource is looked at unless tracing is enabled."""
+    # pylint: disable=missing-docstring
+    def wrap_call(func):
+        @wraps(func)
+        def func_wrapper(self, *args, **kwargs):
+            if not TRACER.enabled:
+                return func(self, *args, **kwargs)
+
+            with resource_span(name, self):
+                return func(self, *args, **kwargs)
+
+        return func_wrapper
+    return wrap_call
+
+
+def export(opt):
+    """Writes every recorded span to the requested trace file"""
+    exporter = EXPORTERS[opt.trace_format]
+    LOG.debug("Writing %s trace to %s", opt.trace_format, opt.trace)
+    with open(opt.trace, 'w') as handle:
+        exporter(TRACER.spans(), handle)
+
+
+def enable(opt):
+    """Starts recording spans and ensures they are
+    exported when aomi exits"""
+    TRACER.enabled = True
+    atexit.register(export, opt)
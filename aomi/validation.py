@@ -6,7 +6,7 @@ import re
 import platform
 import stat
 import logging
-from aomi.helpers import abspath, subdir_path
+from aomi.helpers import abspath, subdir_path, intern_string
 import aomi.exceptions
 LOG = logging.getLogger(__name__)
 
@@ -129,7 +129,7 @@ def sanitize_mount(mount):
         sanitized_mount = sanitized_mount[:-1]
 
     sanitized_mount = sanitized_mount.replace('//', '/')
-    return sanitized_mount
+    return intern_string(sanitized_mount)
 
 
 def gpg_fingerprint(key):
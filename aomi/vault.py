@@ -1,16 +1,20 @@
 """ Vault interactions """
 from __future__ import print_function
 import os
+import time
 import socket
 import logging
 import requests
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 import hvac
 import yaml
 from aomi.helpers import normalize_vault_path
 from aomi.util import token_file, appid_file, approle_file
 from aomi.validation import sanitize_mount
+from aomi.stats import STATS, vault_path
+from aomi.trace import span
+from aomi.retry import RetryPolicy
+from aomi.limiter import Limiter
 import aomi.error
 import aomi.exceptions
 LOG = logging.getLogger(__name__)
@@ -138,7 +142,8 @@ def wrap_hvac(msg):
         # pylint: disable=missing-docstring
         def func_wrapper(self, vault_client):
             try:
-                return func(self, vault_client)
+                with STATS.resource(self.name()):
+                    return func(self, vault_client)
             except (hvac.exceptions.InvalidRequest,
                     hvac.exceptions.Forbidden) as vault_exception:
                 if vault_exception.errors[0] == 'permission denied':
@@ -151,6 +156,79 @@ def wrap_hvac(msg):
     return wrap_call
 
 
+class InstrumentedAdapter(HTTPAdapter):
+    """Transport adapter which retries requests to Vault according
+    to our retry policy, and records the timing and outcome of
+    every request"""
+    def __init__(self, policy=None, limiter=None, **kwargs):
+        self.policy = policy or RetryPolicy()
+        self.limiter = limiter or Limiter()
+        super(InstrumentedAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        start = time.time()
+        resp = None
+        retry = self.policy.state(request)
+        timing = {'queued': 0.0}
+        with span('vault', method=request.method,
+                  path=vault_path(request.url)) as a_span:
+            try:
+                resp = self.send_retry(request, retry, timing, **kwargs)
+                if a_span:
+                    a_span.attrs['status'] = resp.status_code
+
+                return resp
+            finally:
+                if a_span:
+                    a_span.attrs['retries'] = retry.retries
+                    a_span.attrs['queued'] = timing['queued']
+
+                STATS.record(request, resp, time.time() - start,
+                             retries=retry.retries,
+                             retry_seconds=retry.slept,
+                             queue_seconds=timing['queued'])
+
+    def send_limited(self, request, timing, **kwargs):
+        """Sends a single request once there is room for
+        it under our concurrency limits"""
+        limits, wait = self.limiter.acquire(vault_path(request.url))
+        timing['queued'] = timing['queued'] + wait
+        start = time.time()
+        status = None
+        try:
+            resp = super(InstrumentedAdapter, self).send(request, **kwargs)
+            status = resp.status_code
+            return resp
+        finally:
+            self.limiter.release(limits, time.time() - start, status)
+
+    def send_retry(self, request, retry, timing, **kwargs):
+        """Sends a request, retrying as our policy allows"""
+        while True:
+            try:
+                resp = self.send_limited(request, timing, **kwargs)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as exception:
+                delay = retry.next_delay(exception=exception)
+                if delay is None:
+                    raise
+
+                LOG.debug("Retrying %s %s in %.2fs after %s",
+                          request.method, vault_path(request.url),
+                          delay, exception)
+            else:
+                delay = retry.next_delay(response=resp)
+                if delay is None:
+                    return resp
+
+                LOG.debug("Retrying %s %s in %.2fs after HTTP %s",
+                          request.method, vault_path(request.url),
+                          delay, resp.status_code)
+                resp.close()
+
+            time.sleep(delay)
+
+
 class Client(hvac.Client):
     """Our Vault Client Wrapper
     This class will pass the existing hvac bits through. When interacting
@@ -176,14 +254,14 @@ class Client(hvac.Client):
                 urllib3.disable_warnings()
                 ssl_verify = False
 
+        self.ssl_verify = ssl_verify
         self.initial_token = None
         self.operational_token = None
+        self.cubbyhole = None
         session = requests.Session()
-        retries = Retry(total=5,
-                        backoff_factor=0.5)
-        adapter = HTTPAdapter(max_retries=retries)
-        session.mount('https://', adapter)
-        session.mount('http://', adapter)
+        self.adapter = InstrumentedAdapter()
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
         super(Client, self).__init__(url=self.vault_addr,
                                      verify=ssl_verify,
                                      session=session)
@@ -206,9 +284,13 @@ class Client(hvac.Client):
     def connect(self, opt):
         """This sets up the tokens we expect to see in a way
         that hvac also expects."""
-        if not self._kwargs['verify']:
+        if not self.ssl_verify:
             LOG.warning('Skipping SSL Validation!')
 
+        self.adapter.policy = RetryPolicy.from_opt(opt)
+        self.adapter.limiter = Limiter.from_opt(opt)
+        STATS.gauge('limiter', self.adapter.limiter.snapshot)
+
         self.version = self.server_version()
         self.token = self.init_token()
         my_token = self.lookup_token()
@@ -230,18 +312,30 @@ class Client(hvac.Client):
 
         if opt.reuse_token:
             LOG.debug("Not creating operational token")
-            self.initial_token = self.token
-            self.operational_token = self.token
+            self.use_tokens(self.token, self.token)
         else:
-            self.initial_token = self.token
-            self.operational_token = self.op_token(display_name, opt)
+            initial_token = self.token
+            operational_token = self.op_token(display_name, opt)
+            self.use_tokens(initial_token, operational_token)
             if not self.is_authenticated():
                 raise aomi.exceptions.AomiCredentials('operational token')
 
-            self.token = self.operational_token
-
         return self
 
+    def use_tokens(self, initial_token, operational_token):
+        """Pins the operational token to this client and the initial
+        token to a sibling client which shares our connection pool.
+        The sibling is only used for cubbyhole paths, so the token
+        on either client never changes once we are connected and
+        both may be used from many threads at once."""
+        self.initial_token = initial_token
+        self.operational_token = operational_token
+        self.token = operational_token
+        self.cubbyhole = hvac.Client(url=self.vault_addr,
+                                     token=initial_token,
+                                     verify=self.ssl_verify,
+                                     session=self.session)
+
     def init_token(self):
         """Generate our first token based on workstation configuration"""
 
@@ -316,15 +410,22 @@ class Client(hvac.Client):
         LOG.debug("Created operational token with lease of %s", opt.lease)
         return token['auth']['client_token']
 
+    def path_client(self, path):
+        """Returns the hvac client appropriate for a path. Cubbyhole
+        paths are scoped to the initial token, everything else
+        uses the operational token."""
+        if path.startswith('cubbyhole') and self.cubbyhole:
+            return self.cubbyhole
+
+        return None
+
     def read(self, path, wrap_ttl=None):
         """Wrap the hvac read call, using the right token for
         cubbyhole interactions."""
         path = sanitize_mount(path)
-        if path.startswith('cubbyhole'):
-            self.token = self.initial_token
-            val = super(Client, self).read(path, wrap_ttl)
-            self.token = self.operational_token
-            return val
+        client = self.path_client(path)
+        if client:
+            return client.read(path, wrap_ttl)
 
         return super(Client, self).read(path, wrap_ttl)
 
@@ -333,10 +434,9 @@ class Client(hvac.Client):
         cubbyhole interactions."""
         path = sanitize_mount(path)
         val = None
-        if path.startswith('cubbyhole'):
-            self.token = self.initial_token
-            val = super(Client, self).write(path, wrap_ttl=wrap_ttl, **kwargs)
-            self.token = self.operational_token
+        client = self.path_client(path)
+        if client:
+            val = client.write(path, wrap_ttl=wrap_ttl, **kwargs)
         else:
             super(Client, self).write(path, wrap_ttl=wrap_ttl, **kwargs)
 
@@ -347,10 +447,9 @@ class Client(hvac.Client):
         cubbyhole interactions."""
         path = sanitize_mount(path)
         val = None
-        if path.startswith('cubbyhole'):
-            self.token = self.initial_token
-            val = super(Client, self).delete(path)
-            self.token = self.operational_token
+        client = self.path_client(path)
+        if client:
+            val = client.delete(path)
         else:
             super(Client, self).delete(path)
 
@@ -0,0 +1,231 @@
+"""Benchmarks freezing and thawing icefiles with each kind of
+compression. A synthetic Secretfile with N resources is generated, as
+with benchmark.py, with certificates made up of random data so they
+compress as real ones would. The secrets are then archived, and the
+archive extracted again, for each kind of compression. Encryption is
+left out unless a GPG key is given, as it takes time in proportion
+to the size of the archive whatever the compression. Results may be
+saved as a JSON baseline and later runs compared against it.
+
+    python tests/benchmark_icefile.py --sizes 100,1000 --output ice.json
+    python tests/benchmark_icefile.py --sizes 100,1000 --baseline ice.json
+    python tests/benchmark_icefile.py --sizes 100 --pgp-key ABCD1234
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import platform
+import tempfile
+from base64 import b64encode
+from argparse import ArgumentParser
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmark import generate  # noqa: E402
+import aomi.cli  # noqa: E402
+from aomi.filez import COMPRESSION, compression, encrypted_stream, \
+    zip_archive  # noqa: E402
+from aomi.model import Context  # noqa: E402
+from aomi.template import get_secretfile  # noqa: E402
+
+# Differences smaller than this many seconds, or KB, are taken as noise
+NOISE = 0.05
+SIZE_NOISE = 4
+MEASURES = [('freeze_seconds', NOISE),
+            ('thaw_seconds', NOISE),
+            ('size_kb', SIZE_NOISE)]
+
+
+def realistic(directory):
+    """Replaces the generated certificates with random ones, so they
+    are no more compressible than the real thing"""
+    secrets_dir = os.path.join(directory, '.secrets')
+    for filename in os.listdir(secrets_dir):
+        if not filename.endswith('.pem'):
+            continue
+
+        body = b64encode(os.urandom(1200)).decode('ascii')
+        lines = [body[x:x + 64] for x in range(0, len(body), 64)]
+        with open(os.path.join(secrets_dir, filename), 'w') as handle:
+            handle.write("-----BEGIN CERTIFICATE-----\n%s\n"
+                         "-----END CERTIFICATE-----\n" % '\n'.join(lines))
+
+
+def freeze(frozen, ice_file, opt, pgp_key=None):
+    """Archives secrets, encrypting them if there is a key"""
+    kind, level = compression(opt)
+    if pgp_key:
+        with encrypted_stream(ice_file, [pgp_key]) as handle, \
+                zip_archive(handle, kind, level) as archive:
+            for sfile, src_file in frozen:
+                archive.write(src_file, sfile)
+    else:
+        with open(ice_file, 'wb') as handle, \
+                zip_archive(handle, kind, level) as archive:
+            for sfile, src_file in frozen:
+                archive.write(src_file, sfile)
+
+
+def thaw(ice_file, dest_dir, pgp_key=None):
+    """Extracts secrets, decrypting them first if there is a key"""
+    zip_file = ice_file
+    if pgp_key:
+        from cryptorito import decrypt
+        zip_file = "%s.zip" % ice_file
+        decrypt(ice_file, zip_file)
+
+    archive = zipfile.ZipFile(zip_file, 'r')
+    archive.extractall(dest_dir)
+    archive.close()
+
+
+def run_codec(directory, frozen, name, level, pgp_key):
+    """Measures a single kind of compression"""
+    opt = aomi.cli.parser_factory(['freeze', directory,
+                                   '--compression', name] +
+                                  (['--compression-level', str(level)]
+                                   if level is not None else []))[1]
+    ice_file = os.path.join(directory, "%s.ice" % name)
+    dest_dir = os.path.join(directory, "thawed-%s" % name)
+    start = time.time()
+    freeze(frozen, ice_file, opt, pgp_key)
+    freeze_seconds = time.time() - start
+    start = time.time()
+    thaw(ice_file, dest_dir, pgp_key)
+    return {
+        'freeze_seconds': freeze_seconds,
+        'thaw_seconds': time.time() - start,
+        'size_kb': os.path.getsize(ice_file) / 1024.0
+    }
+
+
+def run_size(size, codecs, level, pgp_key):
+    """Measures every kind of compression for a single size"""
+    directory = tempfile.mkdtemp('-aomi-bench')
+    try:
+        secretfile = generate(directory, size)
+        realistic(directory)
+        opt = aomi.cli.parser_factory([
+            'freeze', directory,
+            '--secretfile', secretfile,
+            '--secrets', os.path.join(directory, '.secrets'),
+            '--policies', os.path.join(directory, 'vault')
+        ])[1]
+        frozen = Context.load(get_secretfile(opt), opt).frozen()
+        results = {
+            'secrets': len(frozen),
+            'source_kb': sum([os.path.getsize(x[1]) for x in frozen]) /
+                         1024.0,
+            'codecs': {}
+        }
+        for name in codecs:
+            codec_level = level if name in ('deflate', 'bzip2') else None
+            results['codecs'][name] = run_codec(directory, frozen, name,
+                                                codec_level, pgp_key)
+    finally:
+        shutil.rmtree(directory)
+
+    return results
+
+
+def run(sizes, codecs, level=None, pgp_key=None):
+    """Measures every size"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'encrypted': bool(pgp_key),
+        'sizes': dict([(str(size), run_size(size, codecs, level, pgp_key))
+                       for size in sizes])
+    }
+
+
+def print_results(results, baseline=None):
+    """Human readable results, with ratios against a baseline"""
+    print("%-8s %-8s %10s %10s %10s %8s %8s" %
+          ('size', 'codec', 'freeze s', 'thaw s', 'KB', 'ratio', 'vs base'))
+    for size in sorted(results['sizes'].keys(), key=int):
+        size_res = results['sizes'][size]
+        base = None
+        if baseline and size in baseline['sizes']:
+            base = baseline['sizes'][size]['codecs']
+
+        for name, c_res in sorted(size_res['codecs'].items()):
+            vs_base = ''
+            if base and name in base and base[name]['size_kb']:
+                vs_base = "%.2f" % (c_res['size_kb'] / base[name]['size_kb'])
+
+            print("%-8s %-8s %10.3f %10.3f %10.1f %8.2f %8s" %
+                  (size, name, c_res['freeze_seconds'],
+                   c_res['thaw_seconds'], c_res['size_kb'],
+                   c_res['size_kb'] / size_res['source_kb'], vs_base))
+
+
+def regressions(results, baseline, tolerance):
+    """Codecs which are slower, or produce larger icefiles,
+    beyond the tolerance relative to a baseline"""
+    problems = []
+    for size, size_res in results['sizes'].items():
+        if size not in baseline['sizes']:
+            continue
+
+        base = baseline['sizes'][size]['codecs']
+        for name, c_res in size_res['codecs'].items():
+            if name not in base:
+                continue
+
+            for measure, noise in MEASURES:
+                if c_res[measure] > base[name][measure] * tolerance and \
+                   c_res[measure] - base[name][measure] > noise:
+                    problems.append("%s %s %s was %.3f (was %.3f)" %
+                                    (size, name, measure, c_res[measure],
+                                     base[name][measure]))
+
+    return problems
+
+
+def main():
+    """Entrypoint"""
+    parser = ArgumentParser(description='Benchmark icefile compression')
+    parser.add_argument('--sizes', default='100,1000',
+                        help='Comma separated resource counts')
+    parser.add_argument('--codecs',
+                        default=','.join([x for x in sorted(COMPRESSION)
+                                          if COMPRESSION[x] is not None]),
+                        help='Comma separated kinds of compression')
+    parser.add_argument('--level', type=int,
+                        help='Level of deflate and bzip2 compression')
+    parser.add_argument('--pgp-key', dest='pgp_key',
+                        help='Also encrypt, and decrypt, with this key')
+    parser.add_argument('--output', help='Write results as JSON')
+    parser.add_argument('--baseline', help='Compare to JSON results')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='Allowed growth relative to the baseline')
+    args = parser.parse_args()
+    results = run([int(x) for x in args.sizes.split(',')],
+                  args.codecs.split(','), args.level, args.pgp_key)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as handle:
+            baseline = json.load(handle)
+
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+
+    if baseline:
+        problems = regressions(results, baseline, args.tolerance)
+        for problem in problems:
+            print("regression: %s" % problem, file=sys.stderr)
+
+        if problems:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
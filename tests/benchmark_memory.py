@@ -0,0 +1,168 @@
+"""Benchmarks the memory held by a loaded Context. A synthetic
+Secretfile with N resources is generated, as with benchmark.py, and
+Context.load is run under tracemalloc. Each size runs in it's own
+process. Results may be saved as a JSON baseline and later runs
+compared against it, i.e. before and after a change to the models.
+
+    python tests/benchmark_memory.py --sizes 1000,10000 --output mem.json
+    python tests/benchmark_memory.py --sizes 1000,10000 --baseline mem.json
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import shutil
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from argparse import ArgumentParser, SUPPRESS
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmark import generate  # noqa: E402
+import aomi.cli  # noqa: E402
+from aomi.model import Context  # noqa: E402
+from aomi.template import get_secretfile  # noqa: E402
+from aomi.profile import resource_sizes  # noqa: E402
+
+# Growth smaller than this many KB is taken as noise
+NOISE = 64
+
+
+def run_size(size):
+    """Measures a single size, returning the results"""
+    directory = tempfile.mkdtemp('-aomi-bench')
+    try:
+        secretfile = generate(directory, size)
+        opt = aomi.cli.parser_factory([
+            'seed',
+            '--secretfile', secretfile,
+            '--secrets', os.path.join(directory, '.secrets'),
+            '--policies', os.path.join(directory, 'vault'),
+            '--monochrome'
+        ])[1]
+        config = get_secretfile(opt)
+        tracemalloc.start()
+        ctx = Context.load(config, opt)
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        sizes = resource_sizes(ctx)
+    finally:
+        shutil.rmtree(directory)
+
+    return {
+        'resources': len(ctx.resources()),
+        'held_kb': held / 1024.0,
+        'peak_kb': peak / 1024.0,
+        'types': dict([(r_type, {'count': count, 'kb': r_size / 1024.0})
+                       for r_type, (count, r_size) in sizes.items()])
+    }
+
+
+def run(sizes):
+    """Measures every size, each in a fresh interpreter"""
+    results = {}
+    for size in sizes:
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__),
+            '--single', str(size)
+        ])
+        results[str(size)] = json.loads(output.decode('utf-8'))
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sizes': results
+    }
+
+
+def print_results(results, baseline=None):
+    """Human readable results, with ratios against a baseline"""
+    print("%-8s %-20s %8s %12s %10s %8s" %
+          ('size', 'type', 'count', 'KB', 'B each', 'ratio'))
+    for size in sorted(results['sizes'].keys(), key=int):
+        size_res = results['sizes'][size]
+        base = None
+        if baseline and size in baseline['sizes']:
+            base = baseline['sizes'][size]
+
+        for r_type, t_res in sorted(size_res['types'].items(),
+                                    key=lambda x: x[1]['kb'],
+                                    reverse=True):
+            ratio = ''
+            if base and r_type in base['types'] and \
+               base['types'][r_type]['kb']:
+                ratio = "%.2f" % (t_res['kb'] / base['types'][r_type]['kb'])
+
+            print("%-8s %-20s %8d %12.1f %10.1f %8s" %
+                  (size, r_type, t_res['count'], t_res['kb'],
+                   t_res['kb'] * 1024 / t_res['count'], ratio))
+
+        for measure in ['held_kb', 'peak_kb']:
+            ratio = ''
+            if base and base[measure]:
+                ratio = "%.2f" % (size_res[measure] / base[measure])
+
+            print("%-8s %-20s %8s %12.1f %10s %8s" %
+                  (size, measure, '', size_res[measure], '', ratio))
+
+
+def regressions(results, baseline, tolerance):
+    """Sizes which hold more memory beyond the tolerance,
+    relative to a baseline"""
+    problems = []
+    for size, size_res in results['sizes'].items():
+        if size not in baseline['sizes']:
+            continue
+
+        base = baseline['sizes'][size]
+        for measure in ['held_kb', 'peak_kb']:
+            if size_res[measure] > base[measure] * tolerance and \
+               size_res[measure] - base[measure] > NOISE:
+                problems.append("%s %s was %.1f (was %.1f)" %
+                                (size, measure, size_res[measure],
+                                 base[measure]))
+
+    return problems
+
+
+def main():
+    """Entrypoint"""
+    parser = ArgumentParser(description='Benchmark memory held by '
+                            'a loaded aomi context')
+    parser.add_argument('--sizes', default='1000,10000',
+                        help='Comma separated resource counts')
+    parser.add_argument('--output', help='Write results as JSON')
+    parser.add_argument('--baseline', help='Compare to JSON results')
+    parser.add_argument('--tolerance', type=float, default=1.1,
+                        help='Allowed growth relative to the baseline')
+    parser.add_argument('--single', type=int, help=SUPPRESS)
+    args = parser.parse_args()
+    if args.single:
+        print(json.dumps(run_size(args.single)))
+        return 0
+
+    results = run([int(x) for x in args.sizes.split(',')])
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as handle:
+            baseline = json.load(handle)
+
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+
+    if baseline:
+        problems = regressions(results, baseline, args.tolerance)
+        for problem in problems:
+            print("regression: %s" % problem, file=sys.stderr)
+
+        if problems:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
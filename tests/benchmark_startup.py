@@ -0,0 +1,175 @@
+"""Benchmarks aomi startup for each operation. The command line is
+parsed and the modules an operation needs are imported, all under
+python -X importtime, without actually talking to Vault. Results may
+be saved as a JSON baseline and later runs compared against it.
+
+    python tests/benchmark_startup.py --output startup.json
+    python tests/benchmark_startup.py --baseline startup.json
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from argparse import ArgumentParser
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from aomi.cli import OPERATIONS  # noqa: E402
+
+# Positional arguments each operation requires
+SAMPLE_ARGS = {
+    'extract_file': ['secret/foo/bar', 'bar.txt'],
+    'environment': ['secret/foo'],
+    'aws_environment': ['aws/creds/foo'],
+    'render': ['rendered'],
+    'freeze': ['icefile'],
+    'thaw': ['icefile'],
+    'template': ['builtin:shenv', 'env.sh', 'secret/foo'],
+    'set_password': ['secret/foo'],
+    'export': ['exported']
+}
+STARTUP = "import sys; import aomi.cli as cli; " \
+          "args = cli.parser_factory(sys.argv[1:])[1]; " \
+          "cli.load_operation(args.operation)"
+# Slowdowns smaller than this many seconds are taken as noise
+NOISE = 0.01
+TOP = 5
+
+
+def parse_importtime(output):
+    """Parses python -X importtime output into a list of
+    (module, self, cumulative, depth) tuples. Times are seconds."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        self_us, cumulative_us, name = line[12:].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us) / 1000000.0,
+                        int(cumulative_us) / 1000000.0, depth))
+
+    return imports
+
+
+def run_operation(operation, repeat):
+    """Measures startup for one operation, keeping the fastest run"""
+    best = None
+    for _index in range(0, repeat):
+        start = time.time()
+        proc = subprocess.Popen([sys.executable, '-X', 'importtime',
+                                 '-c', STARTUP, operation] +
+                                SAMPLE_ARGS.get(operation, []),
+                                cwd=ROOT,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        _out, err = proc.communicate()
+        wall = time.time() - start
+        if proc.returncode != 0:
+            raise RuntimeError("%s failed %s" % (operation,
+                                                 err.decode('utf-8')))
+
+        imports = parse_importtime(err.decode('utf-8'))
+        aomi_imports = [x for x in imports if x[0].startswith('aomi')]
+        # the outermost aomi import accounts for everything it pulled in
+        import_seconds = sum([x[2] for x in imports
+                              if x[0].startswith('aomi') and
+                              not [y for y in aomi_imports if y[3] < x[3]]])
+        if best is None or wall < best['seconds']:
+            top = sorted([x for x in imports if x[3] == 1],
+                         key=lambda x: x[2], reverse=True)[0:TOP]
+            best = {
+                'seconds': wall,
+                'import_seconds': import_seconds,
+                'modules': len(imports),
+                'top': [[x[0], x[2]] for x in top]
+            }
+
+    return best
+
+
+def run(repeat):
+    """Measures startup for every operation"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'operations': dict([(x[0], run_operation(x[0], repeat))
+                            for x in OPERATIONS])
+    }
+
+
+def print_results(results, baseline=None):
+    """Human readable results, with ratios against a baseline"""
+    print("%-16s %10s %10s %8s %8s" %
+          ('operation', 'seconds', 'imports', 'modules', 'ratio'))
+    for operation in sorted(results['operations'].keys()):
+        op_res = results['operations'][operation]
+        ratio = ''
+        if baseline and operation in baseline['operations']:
+            was = baseline['operations'][operation]['seconds']
+            ratio = "%.2f" % (op_res['seconds'] / was)
+
+        print("%-16s %10.3f %10.3f %8d %8s" %
+              (operation, op_res['seconds'], op_res['import_seconds'],
+               op_res['modules'], ratio))
+        for module, seconds in op_res['top']:
+            print("    %-40s %8.3f" % (module, seconds))
+
+
+def regressions(results, baseline, tolerance):
+    """Operations which start slower beyond the tolerance, or import
+    more modules, relative to a baseline"""
+    problems = []
+    for operation, op_res in results['operations'].items():
+        if operation not in baseline['operations']:
+            continue
+
+        base = baseline['operations'][operation]
+        if op_res['seconds'] > base['seconds'] * tolerance and \
+           op_res['seconds'] - base['seconds'] > NOISE:
+            problems.append("%s took %.3fs (was %.3fs)" %
+                            (operation, op_res['seconds'], base['seconds']))
+
+        if op_res['modules'] > base['modules']:
+            problems.append("%s imported %s modules (was %s)" %
+                            (operation, op_res['modules'], base['modules']))
+
+    return problems
+
+
+def main():
+    """Entrypoint"""
+    parser = ArgumentParser(description='Benchmark aomi startup')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Runs per operation, the fastest is kept')
+    parser.add_argument('--output', help='Write results as JSON')
+    parser.add_argument('--baseline', help='Compare to JSON results')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='Allowed slowdown relative to the baseline')
+    args = parser.parse_args()
+    results = run(args.repeat)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as handle:
+            baseline = json.load(handle)
+
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+
+    if baseline:
+        problems = regressions(results, baseline, args.tolerance)
+        for problem in problems:
+            print("regression: %s" % problem, file=sys.stderr)
+
+        if problems:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
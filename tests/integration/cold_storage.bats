@@ -67,3 +67,13 @@ teardown() {
     aomi_run thaw "${BATS_TMPDIR}/cold/${ICEFILE}" --extra-vars pgp_key="$GPGID" --verbose  --tags sub
     aomi_seed --extra-vars pgp_key="$GPGID"  --tags sub --verbose
 }
+
+@test "can export into an icefile and thaw" {
+    aomi_seed --extra-vars pgp_key="$GPGID"
+    aomi_run export "${BATS_TMPDIR}/cold" --icefile --extra-vars pgp_key="$GPGID"
+    rm -rf "${FIXTURE_DIR}/.secrets"
+    mkdir -p "${FIXTURE_DIR}/.secrets"
+    ICEFILE=$(ls "${BATS_TMPDIR}/cold")
+    aomi_run thaw "${BATS_TMPDIR}/cold/${ICEFILE}" --extra-vars pgp_key="$GPGID" --verbose
+    aomi_seed --extra-vars pgp_key="$GPGID"
+}
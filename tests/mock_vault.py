@@ -0,0 +1,439 @@
+"""An in-process stand in for a Vault server. Covers the parts of
+the Vault HTTP API which aomi interacts with, and can inject latency,
+jitter and errors so that retry, concurrency and caching behaviour
+may be tested and benchmarked without an actual Vault."""
+import os
+import json
+import time
+import random
+import threading
+from uuid import uuid4
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+ROOT_TOKEN = 'root'
+MOUNT_CONFIG = {
+    'default_lease_ttl': 0,
+    'max_lease_ttl': 0,
+    'force_no_cache': False
+}
+UNAUTHENTICATED = ('sys/health', 'auth/approle/login')
+
+
+def set_vault_addr(url):
+    """Points VAULT_ADDR at a url, returning a function
+    which puts it back as it was"""
+    old = os.environ.get('VAULT_ADDR')
+    os.environ['VAULT_ADDR'] = url
+
+    def restore():
+        """Puts VAULT_ADDR back"""
+        if old is None:
+            os.environ.pop('VAULT_ADDR', None)
+        else:
+            os.environ['VAULT_ADDR'] = old
+
+    return restore
+
+
+def norm(path):
+    """Vault paths without leading, trailing or doubled slashes"""
+    return '/'.join([x for x in path.split('/') if x])
+
+
+def errors(*msgs):
+    """A Vault error body"""
+    return {'errors': list(msgs)}
+
+
+def listing(mounts):
+    """The representation of a set of mounts as Vault lists them"""
+    obj = dict([("%s/" % path, dict(mount))
+                for path, mount in mounts.items()])
+    resp = dict(obj)
+    resp['data'] = obj
+    resp['request_id'] = str(uuid4())
+    return resp
+
+
+def mount_for(path, mounts):
+    """Finds the longest mount which a path lives under"""
+    match = None
+    for mount in mounts.keys():
+        if path == mount or path.startswith("%s/" % mount):
+            if match is None or len(mount) > len(match):
+                match = mount
+
+    return match
+
+
+class MockVault(object):
+    """A fake Vault. Requests are served from an in memory store,
+    and every request is logged as a (method, path, status, token)
+    tuple in requests."""
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, latency=0.0, jitter=0.0, fault_rate=0.0,
+                 fault_statuses=(429, 503), retry_after=None,
+                 version='0.7.3', seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.fault_rate = fault_rate
+        self.fault_statuses = fault_statuses
+        self.retry_after = retry_after
+        self.version = version
+        self.random = random.Random(seed)
+        self.requests = []
+        self.tokens = {ROOT_TOKEN: 'root'}
+        self.token_paths = {ROOT_TOKEN: 'auth/token/root'}
+        self.mounts = {
+            'secret': {'type': 'generic', 'description': 'generic secrets',
+                       'config': dict(MOUNT_CONFIG)},
+            'cubbyhole': {'type': 'cubbyhole', 'description': '',
+                          'config': dict(MOUNT_CONFIG)},
+            'sys': {'type': 'system', 'description': '',
+                    'config': dict(MOUNT_CONFIG)}
+        }
+        self.auths = {
+            'token': {'type': 'token', 'description': 'token based',
+                      'config': dict(MOUNT_CONFIG)}
+        }
+        self.audits = {}
+        self.policies = {'root': '', 'default': ''}
+        self.secrets = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+        self.url = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_args):
+        self.stop()
+
+    def start(self):
+        """Starts serving on a random local port"""
+        self.server = ThreadingServer(('127.0.0.1', 0), Handler)
+        self.server.vault = self
+        self.url = "http://127.0.0.1:%s" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={'poll_interval': 0.01})
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def paths(self, method=None):
+        """Logged request paths, optionally only for one method"""
+        return [x[1] for x in self.requests
+                if method is None or x[0] == method]
+
+    def delay(self):
+        """Simulated server side latency"""
+        wait = self.latency
+        if self.jitter:
+            wait = wait + self.random.uniform(0, self.jitter)
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def fault(self):
+        """Maybe returns an injected error"""
+        if not self.fault_rate or self.random.random() >= self.fault_rate:
+            return None
+
+        status = self.random.choice(self.fault_statuses)
+        headers = {}
+        if self.retry_after is not None:
+            headers['Retry-After'] = str(self.retry_after)
+
+        return status, errors('injected fault'), headers
+
+    def handle(self, method, path, query, body, token):
+        """Handles a single request, returning a status, a JSON
+        serializable body (or None) and any extra headers"""
+        self.delay()
+        path = norm(path)
+        if path.startswith('v1/'):
+            path = path[3:]
+
+        if method == 'GET' and \
+           query.get('list', [''])[0].lower() == 'true':
+            method = 'LIST'
+
+        outcome = self.fault()
+        if outcome is None:
+            with self.lock:
+                outcome = self.route(method, path, body, token)
+
+            if len(outcome) == 2:
+                outcome = (outcome[0], outcome[1], {})
+
+        with self.lock:
+            self.requests.append((method, path, outcome[0], token))
+
+        return outcome
+
+    def route(self, method, path, body, token):
+        """Dispatches a request to the right fake endpoint"""
+        if path not in UNAUTHENTICATED and token not in self.tokens:
+            return 403, errors('permission denied')
+
+        if path == 'sys/health':
+            return 200, {'initialized': True, 'sealed': False,
+                         'standby': False, 'version': self.version}
+        elif path.startswith('sys/mounts/') and path.endswith('/tune'):
+            return self.tune(method, path[11:-5], body)
+        elif path == 'sys/mounts' or path.startswith('sys/mounts/'):
+            return self.backend(self.mounts, method, path[11:], body)
+        elif path == 'sys/auth' or path.startswith('sys/auth/'):
+            return self.backend(self.auths, method, path[9:], body)
+        elif path == 'sys/audit' or path.startswith('sys/audit/'):
+            return self.audit(method, path[10:], body)
+        elif path == 'sys/policy' or path.startswith('sys/policy/'):
+            return self.policy(method, path[11:], body)
+        elif path.startswith('auth/token/') or path == 'auth/approle/login':
+            return self.token(method, path, body, token)
+
+        return self.kv(method, path, body, token)
+
+    @staticmethod
+    def backend(backends, method, path, body):
+        """Secret and auth backend mounting"""
+        if not path:
+            if method == 'GET':
+                return 200, listing(backends)
+
+            return 405, errors('unsupported operation')
+
+        if method in ('POST', 'PUT'):
+            if path in backends:
+                return 400, errors("existing mount at %s/" % path)
+
+            backends[path] = {
+                'type': body.get('type'),
+                'description': body.get('description', ''),
+                'config': dict(MOUNT_CONFIG, **(body.get('config') or {}))
+            }
+            return 204, None
+        elif method == 'DELETE':
+            backends.pop(path, None)
+            return 204, None
+
+        return 405, errors('unsupported operation')
+
+    def tune(self, method, path, body):
+        """Mount tuning, for both secret and auth backends"""
+        backends = self.mounts
+        if path.startswith('auth/'):
+            backends = self.auths
+            path = path[5:]
+
+        if path not in backends:
+            return 400, errors("cannot fetch sysview for path %s" % path)
+
+        config = backends[path]['config']
+        if method == 'GET':
+            resp = dict(config)
+            resp['data'] = dict(config)
+            return 200, resp
+        elif method in ('POST', 'PUT'):
+            for key, value in body.items():
+                if key in MOUNT_CONFIG:
+                    config[key] = value
+
+            return 204, None
+
+        return 405, errors('unsupported operation')
+
+    def audit(self, method, path, body):
+        """Audit log backends"""
+        if not path:
+            if method == 'GET':
+                obj = dict([("%s/" % name, dict(audit))
+                            for name, audit in self.audits.items()])
+                return 200, dict(obj, data=obj)
+
+            return 405, errors('unsupported operation')
+
+        if method in ('POST', 'PUT'):
+            self.audits[path] = {
+                'type': body.get('type'),
+                'description': body.get('description', ''),
+                'options': body.get('options') or {},
+                'path': "%s/" % path
+            }
+            return 204, None
+        elif method == 'DELETE':
+            self.audits.pop(path, None)
+            return 204, None
+
+        return 405, errors('unsupported operation')
+
+    def policy(self, method, name, body):
+        """ACL policies"""
+        if not name:
+            if method in ('GET', 'LIST'):
+                names = sorted(self.policies.keys())
+                return 200, {'policies': names, 'data': {'keys': names}}
+
+            return 405, errors('unsupported operation')
+
+        if method == 'GET':
+            if name not in self.policies:
+                return 404, errors()
+
+            rules = self.policies[name]
+            return 200, {'name': name, 'rules': rules,
+                         'data': {'name': name, 'rules': rules}}
+        elif method in ('POST', 'PUT'):
+            self.policies[name] = body.get('rules', body.get('policy', ''))
+            return 204, None
+        elif method == 'DELETE':
+            self.policies.pop(name, None)
+            return 204, None
+
+        return 405, errors('unsupported operation')
+
+    def token(self, method, path, body, token):
+        """The handful of token endpoints aomi uses"""
+        if path in ('auth/token/create', 'auth/approle/login'):
+            new_token = str(uuid4())
+            display_name = body.get('display_name', 'token')
+            self.tokens[new_token] = display_name
+            self.token_paths[new_token] = path
+            return 200, {'auth': {'client_token': new_token,
+                                  'policies': ['root'],
+                                  'lease_duration': 0,
+                                  'renewable': False}}
+        elif path == 'auth/token/lookup-self' and method == 'GET':
+            return 200, {'data': {'id': token,
+                                  'display_name': self.tokens[token],
+                                  'path': self.token_paths[token],
+                                  'policies': ['root'],
+                                  'meta': None}}
+        elif path == 'auth/token/revoke-self':
+            if token != ROOT_TOKEN:
+                self.tokens.pop(token, None)
+                self.token_paths.pop(token, None)
+
+            return 204, None
+        elif path == 'auth/token/renew-self':
+            return 200, {'auth': {'client_token': token,
+                                  'lease_duration': 0}}
+
+        return self.kv(method, path, body, token)
+
+    def kv(self, method, path, body, token):
+        """Generic key/value storage, used for every mounted path.
+        Cubbyholes are scoped to the token in use."""
+        relative = path
+        backends = self.mounts
+        if path.startswith('auth/'):
+            relative = path[5:]
+            backends = self.auths
+
+        mount = mount_for(relative, backends)
+        if mount is None or (mount == relative and method != 'LIST'):
+            return 404, errors("no handler for route '%s'" % path)
+
+        key = path
+        if mount == 'cubbyhole':
+            key = "%s:%s" % (token, path)
+
+        if method == 'GET':
+            if key not in self.secrets:
+                return 404, errors()
+
+            return 200, {'data': dict(self.secrets[key]),
+                         'lease_duration': 0, 'renewable': False}
+        elif method in ('POST', 'PUT'):
+            secret = dict(body)
+            # as Vault does, approle policies are kept as a list
+            if path.startswith('auth/approle/role/') and \
+               isinstance(secret.get('policies'), str):
+                secret['policies'] = secret['policies'].split(',')
+
+            self.secrets[key] = secret
+            return 204, None
+        elif method == 'DELETE':
+            self.secrets.pop(key, None)
+            return 204, None
+        elif method == 'LIST':
+            prefix = "%s/" % key
+            keys = set()
+            for a_key in self.secrets.keys():
+                if a_key.startswith(prefix):
+                    rest = a_key[len(prefix):].split('/')
+                    keys.add(rest[0] if len(rest) == 1 else "%s/" % rest[0])
+
+            if not keys:
+                return 404, errors()
+
+            return 200, {'data': {'keys': sorted(keys)}}
+
+        return 405, errors('unsupported operation')
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    """Handles each request in it's own thread"""
+    daemon_threads = True
+    vault = None
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Adapts HTTP requests into MockVault.handle calls"""
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in one write, avoiding delayed ACK stalls
+    wbufsize = -1
+
+    def log_message(self, *_args):  # pylint: disable=arguments-differ
+        pass
+
+    def dispatch(self):
+        """Handles any HTTP method"""
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = {}
+        if length:
+            raw = self.rfile.read(length)
+            try:
+                body = json.loads(raw.decode('utf-8')) or {}
+            except ValueError:
+                body = {}
+
+        status, obj, headers = self.server.vault \
+            .handle(self.command, url.path, parse_qs(url.query),
+                    body, self.headers.get('X-Vault-Token'))
+        payload = b''
+        if obj is not None:
+            payload = json.dumps(obj).encode('utf-8')
+
+        self.send_response(status)
+        for header, value in headers.items():
+            self.send_header(header, value)
+
+        if obj is not None:
+            self.send_header('Content-Type', 'application/json')
+
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = dispatch
+    do_PUT = dispatch
+    do_POST = dispatch
+    do_DELETE = dispatch
+    do_LIST = dispatch
@@ -1,6 +1,11 @@
+import os
+import sys
+import subprocess
 import unittest
 import aomi.cli
 
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 class OpParserTest(unittest.TestCase):
     def enabled_options(self, operations, option):
         for op in operations:
@@ -168,3 +173,58 @@ class OpParserTest(unittest.TestCase):
                                ['extract_file', 'foo', 'bar'],
                                ['set_password', 'foo'],
                                ['token']], 'extra-vars-file')
+
+    def test_stats_option(self):
+        self.enabled_options([['environment', 'foo'],
+                              ['seed'],
+                              ['diff'],
+                              ['export', 'foo'],
+                              ['token']], 'stats')
+        self.enabled_options([['seed'],
+                              ['token']], 'stats-file')
+
+
+class LazyStartupTest(unittest.TestCase):
+    def imported(self, args):
+        code = "import sys; import aomi.cli as cli; " \
+               "op = cli.parser_factory(sys.argv[1:])[1].operation; " \
+               "cli.load_operation(op); " \
+               "print(' '.join(sorted(sys.modules.keys())))"
+        out = subprocess.check_output([sys.executable, '-c', code] + args,
+                                      cwd=ROOT)
+        return out.decode('utf-8').split()
+
+    def test_only_requested_parser(self):
+        parser = aomi.cli.parser_factory(['token'])[0]
+        subparsers = [x for x in parser._actions
+                      if x.dest == 'operation'][0]
+        self.assertEqual(list(subparsers.choices.keys()), ['token'])
+
+    def test_help_parser(self):
+        parser = aomi.cli.parser_factory(['help'])[0]
+        subparsers = [x for x in parser._actions
+                      if x.dest == 'operation'][0]
+        self.assertEqual(sorted(subparsers.choices.keys()),
+                         sorted([x[0] for x in aomi.cli.OPERATIONS]))
+
+    def test_environment_imports(self):
+        modules = self.imported(['environment', 'foo'])
+        assert 'aomi.vault' in modules
+        assert 'aomi.render' in modules
+        for module in ['aomi.seed_action', 'aomi.model', 'aomi.filez',
+                       'aomi.template', 'jinja2']:
+            assert module not in modules
+
+    def test_help_imports(self):
+        modules = self.imported(['help'])
+        for module in ['aomi.vault', 'hvac', 'requests', 'yaml']:
+            assert module not in modules
+
+    def test_no_operation(self):
+        proc = subprocess.Popen([sys.executable, 'aomi.py'], cwd=ROOT,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        self.assertEqual(proc.returncode, 2)
+        assert b'usage' in out
+        assert b'Traceback' not in err
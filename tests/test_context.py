@@ -0,0 +1,137 @@
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+import aomi.cli
+import aomi.seed_action
+from aomi.vault import Client
+from aomi.model.context import Context, MODELS, SEED_KEYS, model_class, \
+    find_model
+from benchmark import generate
+from mock_vault import MockVault, ROOT_TOKEN, set_vault_addr
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ModelRegistryTest(unittest.TestCase):
+    def test_models(self):
+        for (config_key, resource_key), _model in MODELS.items():
+            assert config_key in SEED_KEYS
+            model = model_class((config_key, resource_key))
+            assert model.config_key == config_key
+            assert model.resource_key == resource_key
+
+    def test_find_model(self):
+        assert find_model('mounts', {'path': 'foo'}).__name__ == 'Mount'
+        assert find_model('secrets', {'var_file': 'foo'}).__name__ == \
+            'VarFile'
+        assert find_model('secrets', {'nope': 'foo'}) is None
+
+    def test_load(self):
+        opt = aomi.cli.parser_factory(['seed'])[1]
+        ctx = Context.load({'mounts': [{'path': 'foo'}],
+                            'secrets': [{'nope': 'foo'}],
+                            'policies': [{'name': 'foo', 'file': 'foo.hcl'}]},
+                           opt)
+        assert sorted([type(x).__name__ for x in ctx.resources()]) == \
+            ['Mount', 'Policy']
+
+    def test_lazy(self):
+        code = "import sys; import aomi.cli; from aomi.model import Context; " \
+               "opt = aomi.cli.parser_factory(['seed'])[1]; " \
+               "Context.load({'mounts': [{'path': 'foo'}]}, opt); " \
+               "print(' '.join(sorted(sys.modules.keys())))"
+        out = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+        modules = out.decode('utf-8').split()
+        assert 'aomi.model.resource' in modules
+        for module in ['aomi.model.auth', 'aomi.model.aws',
+                       'aomi.model.generic', 'aomi.model.ssh']:
+            assert module not in modules
+
+
+class CompactResourceTest(unittest.TestCase):
+    def test_slots(self):
+        opt = aomi.cli.parser_factory(['seed'])[1]
+        ctx = Context.load({
+            'mounts': [{'path': 'foo'}],
+            'policies': [{'name': 'foo', 'file': 'foo.hcl'}],
+            'secrets': [{'generated': {
+                'mount': 'foo', 'path': 'bar',
+                'keys': [{'name': 'baz', 'method': 'uuid'}]}}]
+        }, opt)
+        things = ctx.resources() + ctx.mounts()
+        assert len(things) == 4
+        for thing in things:
+            assert not hasattr(thing, '__dict__')
+
+        generated = [x for x in things
+                     if type(x).__name__ == 'Generated'][0]
+        assert generated.mount is ctx.mounts()[0].path
+
+
+class PruneTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.vault = MockVault().start()
+        self.addCleanup(set_vault_addr(self.vault.url))
+        self.client = Client()
+        self.client.use_tokens(ROOT_TOKEN, ROOT_TOKEN)
+        self.secretfile = generate(self.directory, 10)
+        self.seed([])
+        self.client.write('sys/mounts/stray', type='generic')
+        self.client.write('sys/auth/github', type='github')
+        self.client.write('sys/audit/stray', type='file')
+        self.client.set_policy('stray', 'path "stray/*" {}')
+        self.client.write('vars0/stray/deep/er', foo='bar')
+        self.client.write('vars0/stray2', foo='bar')
+
+    def tearDown(self):
+        self.vault.stop()
+        shutil.rmtree(self.directory)
+
+    def seed(self, args):
+        opt = aomi.cli.parser_factory(['seed'] + args + [
+            '--secretfile', self.secretfile,
+            '--secrets', os.path.join(self.directory, '.secrets'),
+            '--policies', os.path.join(self.directory, 'vault')
+        ])[1]
+        aomi.seed_action.seed(self.client, opt)
+
+    def test_remove_unknown(self):
+        self.seed(['--remove-unknown'])
+        assert 'stray' not in self.vault.mounts
+        assert 'vars0' in self.vault.mounts
+        assert 'github' not in self.vault.auths
+        assert 'userpass' in self.vault.auths
+        assert 'stray' not in self.vault.audits
+        assert 'stray' not in self.vault.policies
+        assert 'policy0' in self.vault.policies
+        assert 'vars0/stray2' in self.vault.secrets
+
+    def test_remove_unknown_secrets(self):
+        self.seed(['--remove-unknown-secrets'])
+        assert 'vars0/stray/deep/er' not in self.vault.secrets
+        assert 'vars0/stray2' not in self.vault.secrets
+        assert 'vars0/var0' in self.vault.secrets
+        assert 'stray' in self.vault.mounts
+
+    def test_filtered_are_known(self):
+        self.seed(['--remove-unknown', '--remove-unknown-secrets',
+                   '--exclude', 'policy0', '--exclude', 'vars0/var1'])
+        assert 'policy0' in self.vault.policies
+        assert 'vars0/var1' in self.vault.secrets
+        assert 'stray' not in self.vault.policies
+        assert 'vars0/stray2' not in self.vault.secrets
+
+    def test_token_auth_kept(self):
+        # the operational token is made from the one we logged in with
+        self.vault.tokens['initial'] = 'someone'
+        self.vault.token_paths['initial'] = 'auth/github/login/someone'
+        self.vault.tokens['operational'] = 'token'
+        self.vault.token_paths['operational'] = 'auth/token/create'
+        self.client.use_tokens('initial', 'operational')
+        self.seed(['--remove-unknown'])
+        assert 'github' in self.vault.auths
+        assert 'stray' not in self.vault.mounts
@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from io import StringIO
+from mock_vault import MockVault, ROOT_TOKEN, set_vault_addr
+from benchmark import generate
+import aomi.cli
+import aomi.seed_action
+from aomi.vault import Client
+from aomi.diff import Change, Fingerprint, changes, changed, differs, \
+    same, fingerprint, normalize_val, ADDED, REMOVED, CHANGED
+from aomi.model.resource import Resource
+from aomi.model.backend import NOOP, ADD, CHANGED as CHANGED_RESOURCE
+
+
+class SameTest(unittest.TestCase):
+    def test_nested(self):
+        assert same({'a': [1, {'b': u'c'}]}, {'a': [1, {'b': 'c'}]})
+        assert not same({'a': [1, 2]}, {'a': [1, 3]})
+        assert not same([1], (1,))
+        assert not same('1', 1)
+
+
+class DiffersTest(unittest.TestCase):
+    def test_differs(self):
+        assert not differs({'a': 1}, {'a': 1})
+        assert differs({'a': 1}, {'a': 2})
+        assert differs({'a': 1}, {'a': 1, 'b': 2})
+
+    def test_ignore_missing(self):
+        assert not differs({'a': 1}, {'a': 1, 'b': 2}, True)
+        assert differs({'a': 2}, {'a': 1, 'b': 2}, True)
+
+
+class ChangesTest(unittest.TestCase):
+    def test_changes(self):
+        found = list(changes({'a': 1, 'b': 2, 'd': 4},
+                             {'a': 1, 'b': 3, 'c': 3}))
+        assert found == [Change(CHANGED, 'b', 3, 2),
+                         Change(REMOVED, 'c', old=3),
+                         Change(ADDED, 'd', new=4)]
+
+    def test_ignore_missing(self):
+        assert list(changes({'a': 1}, {'a': 1, 'b': 2}, True)) == []
+
+    def test_normalized(self):
+        assert list(changes({'a': 300, 'b': ['c', 'd']},
+                            {'a': '300', 'b': 'c,d'},
+                            normalize=normalize_val)) == []
+        assert changed({'a': 300}, {'a': '300'})
+
+    def test_ignored_keys(self):
+        assert not changed({'a': 1}, {'a': 1, 'refresh_interval': 5},
+                           ignore=('refresh_interval',))
+        assert changed({'a': 1}, {'a': 2, 'refresh_interval': 5},
+                       ignore=('refresh_interval',))
+
+    def test_no_copies(self):
+        existing = dict([("key%s" % x, "value%s" % x * 100)
+                         for x in range(0, 1000)])
+        obj = dict(existing)
+        tracemalloc.start()
+        assert not changed(obj, existing)
+        allocated = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert allocated < 4096
+
+
+class FingerprintTest(unittest.TestCase):
+    def test_canonical(self):
+        assert fingerprint({'a': 1, 'b': [True, 'x']}) == \
+            fingerprint({'b': [1, u'x'], 'a': 1.0})
+        assert fingerprint({'a': 1}) != fingerprint({'a': '1'})
+        assert fingerprint(['a']) != fingerprint(('a',))
+        assert fingerprint({'a': 1, 'b': 2}, ('b',)) == \
+            fingerprint({'a': 1})
+
+    def test_discard(self):
+        opt = aomi.cli.parser_factory(['diff'])[1]
+        resource = Resource({}, opt)
+        resource._obj = {'a': 'b'}
+        resource.existing = {'a': 'b', 'refresh_interval': 60}
+        resource.discard()
+        assert isinstance(resource.existing, Fingerprint)
+        assert resource.diff() == NOOP
+        resource._obj = {'a': 'c'}
+        assert resource.diff() == CHANGED_RESOURCE
+        resource.existing = 'some policy'
+        resource.discard()
+        assert resource.existing.matches('some policy')
+
+    def test_discard_empty(self):
+        opt = aomi.cli.parser_factory(['diff'])[1]
+        resource = Resource({}, opt)
+        resource._obj = {'a': 'b'}
+        for empty in ({}, ''):
+            resource.existing = empty
+            resource.discard()
+            assert resource.existing == empty
+            assert resource.diff() == ADD
+
+
+class DiffActionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.vault = MockVault().start()
+        self.addCleanup(set_vault_addr(self.vault.url))
+        self.client = Client()
+        self.client.use_tokens(ROOT_TOKEN, ROOT_TOKEN)
+        self.secretfile = generate(self.directory, 10)
+
+    def tearDown(self):
+        self.vault.stop()
+        shutil.rmtree(self.directory)
+
+    def run_op(self, args):
+        opt = aomi.cli.parser_factory(args + [
+            '--secretfile', self.secretfile,
+            '--secrets', os.path.join(self.directory, '.secrets'),
+            '--policies', os.path.join(self.directory, 'vault')
+        ])[1]
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            if opt.operation == 'seed':
+                return aomi.seed_action.seed(self.client, opt)
+
+            return aomi.seed_action.diff(self.client, opt), \
+                sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_jsonl(self):
+        drift, output = self.run_op(['diff', '--format', 'jsonl'])
+        assert drift
+        records = [json.loads(x) for x in output.splitlines()]
+        var_file = [x for x in records if x['path'] == 'vars0/var0'][0]
+        assert var_file['action'] == 'add'
+        assert var_file['type'] == 'VarFile'
+        assert var_file['kind'] == 'resource'
+        assert sorted([x['key'] for x in var_file['changes']]) == \
+            ['password', 'user']
+        assert 'new' not in var_file['changes'][0]
+        assert [x for x in records
+                if x['kind'] == 'backend' and x['path'] == 'vars0']
+
+    def test_show_values(self):
+        output = self.run_op(['diff', '--format', 'jsonl',
+                              '--show-values'])[1]
+        records = [json.loads(x) for x in output.splitlines()]
+        var_file = [x for x in records if x['path'] == 'vars0/var0'][0]
+        assert 'user0' in [x.get('new') for x in var_file['changes']]
+
+    def test_no_drift(self):
+        self.run_op(['seed'])
+        drift, output = self.run_op(['diff', '--format', 'jsonl'])
+        records = [json.loads(x) for x in output.splitlines()]
+        changed = [x for x in records
+                   if x['action'] not in ('noop', 'overwrite')]
+        assert not changed, changed
+        assert not drift
+        assert [x for x in records if x['action'] == 'overwrite']
+        assert [x for x in records if x['action'] == 'noop']
+
+    def test_check(self):
+        drift, output = self.run_op(['diff', '--format', 'jsonl',
+                                     '--check'])
+        assert drift
+        records = [json.loads(x) for x in output.splitlines()]
+        assert len(records) == 1
+        assert records[0]['kind'] == 'backend'
+        assert records[0]['action'] == 'add'
+        assert not [x for x in self.vault.paths('GET')
+                    if x.startswith('vars')]
+
+    def test_check_cheapest_first(self):
+        self.run_op(['seed'])
+        self.client.set_policy('policy0', 'path "changed/*" {}')
+        drift, output = self.run_op(['diff', '--format', 'jsonl',
+                                     '--check'])
+        records = [json.loads(x) for x in output.splitlines()]
+        resources = [x for x in records if x['kind'] == 'resource']
+        assert resources[0]['type'] == 'Policy'
+        assert drift
+        assert records[-1]['path'] == 'policy0'
+        assert records[-1]['action'] == 'change'
+        assert not [x for x in records
+                    if x['type'] in ('VarFile', 'Files', 'Generated')]
+
+    def test_conflict(self):
+        self.run_op(['seed'])
+        self.vault.mounts['vars0']['description'] = 'someone elses'
+        for args in ([], ['--check']):
+            drift, output = self.run_op(['diff', '--format', 'jsonl'] +
+                                        args)
+            records = [json.loads(x) for x in output.splitlines()]
+            assert drift
+            assert [x for x in records if x['path'] == 'vars0' and
+                    x['action'] == 'conflict']
+
+    def test_check_no_drift(self):
+        self.run_op(['seed'])
+        drift, output = self.run_op(['diff', '--format', 'jsonl',
+                                     '--check'])
+        records = [json.loads(x) for x in output.splitlines()]
+        assert not drift
+        assert [x for x in records if x['type'] == 'VarFile']
@@ -0,0 +1,72 @@
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+import yaml
+from mock_vault import MockVault, ROOT_TOKEN, set_vault_addr
+from benchmark import generate
+import aomi.cli
+import aomi.seed_action
+from aomi.vault import Client
+from aomi.helpers import write_atomic
+
+
+class WriteAtomicTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write(self):
+        filename = os.path.join(self.directory, 'secret')
+        write_atomic(filename, 'foo')
+        write_atomic(filename, 'bar')
+        assert open(filename).read() == 'bar'
+        assert stat.S_IMODE(os.stat(filename).st_mode) == 0o600
+        assert os.listdir(self.directory) == ['secret']
+
+    def test_failed_write(self):
+        filename = os.path.join(self.directory, 'secret')
+        with self.assertRaises(TypeError):
+            write_atomic(filename, 42)
+
+        assert not os.listdir(self.directory)
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.vault = MockVault().start()
+        self.addCleanup(set_vault_addr(self.vault.url))
+        self.client = Client()
+        self.client.use_tokens(ROOT_TOKEN, ROOT_TOKEN)
+        self.secretfile = generate(self.directory, 50)
+
+    def tearDown(self):
+        self.vault.stop()
+        shutil.rmtree(self.directory)
+
+    def run_op(self, args):
+        opt = aomi.cli.parser_factory(args + [
+            '--secretfile', self.secretfile,
+            '--secrets', os.path.join(self.directory, '.secrets'),
+            '--policies', os.path.join(self.directory, 'vault')
+        ])[1]
+        getattr(aomi.seed_action, opt.operation)(self.client, opt)
+
+    def test_export(self):
+        self.run_op(['seed'])
+        export_dir = os.path.join(self.directory, 'export', 'nested')
+        self.run_op(['export', export_dir])
+        secrets_dir = os.path.join(self.directory, '.secrets')
+        var_file = os.path.join(export_dir, 'var0.yml')
+        assert yaml.safe_load(open(var_file).read()) == \
+            yaml.safe_load(open(os.path.join(secrets_dir, 'var0.yml')))
+        assert open(os.path.join(export_dir, 'file0.pem')).read() == \
+            open(os.path.join(secrets_dir, 'file0.pem')).read()
+        assert stat.S_IMODE(os.stat(var_file).st_mode) == 0o600
+        assert stat.S_IMODE(os.stat(export_dir).st_mode) == 0o700
+        assert not [x for x in os.listdir(export_dir)
+                    if x.startswith('.aomi')]
@@ -0,0 +1,280 @@
+import os
+import io
+import stat
+import shutil
+import zipfile
+import tempfile
+import threading
+import subprocess
+import unittest
+import yaml
+from mock_vault import MockVault, ROOT_TOKEN, set_vault_addr
+from benchmark import generate
+import aomi.cli
+import aomi.seed_action
+from aomi.vault import Client
+import aomi.filez
+import aomi.exceptions
+from aomi.filez import zip_archive, compression, archive_members
+from aomi.model import Context
+from aomi.helpers import extract_file
+from aomi.template import get_secretfile
+import cryptorito
+
+GPG = shutil.which('gpg') if hasattr(shutil, 'which') else None
+
+
+def usable_gpg():
+    """Whether gpg, and cryptorito on this Python, can be used"""
+    if GPG is None:
+        return False
+
+    try:
+        cryptorito.flatten(['gpg'])
+    except (AttributeError, RuntimeError):
+        return False
+
+    return True
+
+
+class ZipArchiveTest(unittest.TestCase):
+    def test_pipe(self):
+        read_fd, write_fd = os.pipe()
+        received = []
+
+        def read():
+            with os.fdopen(read_fd, 'rb') as handle:
+                received.append(handle.read())
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        with os.fdopen(write_fd, 'wb') as handle:
+            with zip_archive(handle) as archive:
+                archive.writestr('foo/bar.yml', 'bar: baz')
+
+        reader.join()
+        archive = zipfile.ZipFile(io.BytesIO(received[0]))
+        assert archive.read('foo/bar.yml') == b'bar: baz'
+
+
+class CompressionTest(unittest.TestCase):
+    def opt(self, args):
+        return aomi.cli.parser_factory(['freeze', 'foo'] + args)[1]
+
+    def test_default(self):
+        assert compression(self.opt([])) == (zipfile.ZIP_STORED, None)
+
+    def test_level(self):
+        assert compression(self.opt(['--compression', 'deflate',
+                                     '--compression-level', '9'])) == \
+            (zipfile.ZIP_DEFLATED, 9)
+
+    def test_bad_level(self):
+        with self.assertRaises(aomi.exceptions.AomiError):
+            compression(self.opt(['--compression', 'bzip2',
+                                  '--compression-level', '0']))
+
+        with self.assertRaises(aomi.exceptions.AomiError):
+            compression(self.opt(['--compression', 'lzma',
+                                  '--compression-level', '1']))
+
+    def test_thaw_needs_no_options(self):
+        handle = io.BytesIO()
+        kind, level = compression(self.opt(['--compression', 'deflate']))
+        with zip_archive(handle, kind, level) as archive:
+            archive.writestr('foo', 'a' * 4096)
+
+        assert len(handle.getvalue()) < 4096
+        archive = zipfile.ZipFile(io.BytesIO(handle.getvalue()))
+        assert archive.getinfo('foo').compress_type == zipfile.ZIP_DEFLATED
+        assert archive.read('foo') == b'a' * 4096
+
+
+class FrozenTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.secretfile = generate(self.directory, 50)
+        self.opt = aomi.cli.parser_factory([
+            'freeze', self.directory,
+            '--secretfile', self.secretfile,
+            '--secrets', os.path.join(self.directory, '.secrets'),
+            '--policies', os.path.join(self.directory, 'vault')
+        ])[1]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_frozen(self):
+        ctx = Context.load(get_secretfile(self.opt), self.opt)
+        frozen = ctx.frozen()
+        names = [x[0] for x in frozen]
+        assert len(names) == len(set(names))
+        assert 'var0.yml' in names
+        assert os.path.join(self.directory, '.secrets', 'var0.yml') in \
+            [x[1] for x in frozen]
+
+    def test_missing(self):
+        os.remove(os.path.join(self.directory, '.secrets', 'var0.yml'))
+        ctx = Context.load(get_secretfile(self.opt), self.opt)
+        with self.assertRaises(aomi.exceptions.IceFile):
+            ctx.frozen()
+
+
+class ThawedTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.secretfile = generate(self.directory, 50)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def context(self, args):
+        opt = aomi.cli.parser_factory([
+            'thaw', 'foo.ice',
+            '--secretfile', self.secretfile,
+            '--secrets', os.path.join(self.directory, '.secrets'),
+            '--policies', os.path.join(self.directory, 'vault')
+        ] + args)[1]
+        return Context.load(get_secretfile(opt), opt)
+
+    def test_only_needed(self):
+        ctx = self.context(['--include', 'vars0/var1'])
+        assert ctx.thawed(set(['var1.yml', 'var0.yml', 'file0.pem'])) == \
+            ['var1.yml']
+
+    def test_missing(self):
+        with self.assertRaises(aomi.exceptions.IceFile):
+            self.context([]).thawed(set(['var0.yml']))
+
+        assert self.context(['--ignore-missing']) \
+                   .thawed(set(['var0.yml'])) == ['var0.yml']
+
+    def test_old_member_names(self):
+        handle = io.BytesIO()
+        with zip_archive(handle) as archive:
+            archive.writestr('/var1.yml', 'foo: bar')
+            archive.writestr('sub/secret', 'foo')
+
+        archive = zipfile.ZipFile(io.BytesIO(handle.getvalue()))
+        members = archive_members(archive)
+        ctx = self.context(['--include', 'vars0/var1'])
+        thawed = ctx.thawed(members)
+        assert thawed == ['var1.yml']
+        filename = os.path.join(self.directory, 'thawed', 'var1.yml')
+        extract_file(archive, members[thawed[0]], filename)
+        assert open(filename).read() == 'foo: bar'
+
+    def test_extract_file(self):
+        handle = io.BytesIO()
+        with zip_archive(handle) as archive:
+            archive.writestr('sub/secret', 'foo')
+
+        archive = zipfile.ZipFile(io.BytesIO(handle.getvalue()))
+        filename = os.path.join(self.directory, 'thawed', 'sub', 'secret')
+        extract_file(archive, 'sub/secret', filename)
+        assert open(filename).read() == 'foo'
+        assert stat.S_IMODE(os.stat(filename).st_mode) == 0o640
+
+
+@unittest.skipIf(not usable_gpg(), 'requires gpg')
+class ExportIcefileTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gnupghome = tempfile.mkdtemp()
+        cls.old_gnupghome = os.environ.get('GNUPGHOME')
+        os.environ['GNUPGHOME'] = cls.gnupghome
+        subprocess.check_call([GPG, '--batch', '-q', '--passphrase', '',
+                               '--quick-gen-key', 'aomi <aomi@example.com>',
+                               'default', 'default', 'never'],
+                              stderr=open(os.devnull, 'w'))
+        colons = subprocess.check_output([GPG, '--list-keys',
+                                          '--with-colons'])
+        cls.fingerprint = [x.split(':')[9] for x in
+                           colons.decode('utf-8').splitlines()
+                           if x.startswith('fpr:')][0]
+
+    @classmethod
+    def tearDownClass(cls):
+        subprocess.call(['gpgconf', '--kill', 'gpg-agent'])
+        shutil.rmtree(cls.gnupghome, ignore_errors=True)
+        if cls.old_gnupghome is None:
+            del os.environ['GNUPGHOME']
+        else:
+            os.environ['GNUPGHOME'] = cls.old_gnupghome
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.vault = MockVault().start()
+        self.addCleanup(set_vault_addr(self.vault.url))
+        self.client = Client()
+        self.client.use_tokens(ROOT_TOKEN, ROOT_TOKEN)
+        self.secretfile = generate(self.directory, 10)
+        with open(self.secretfile, 'a') as handle:
+            handle.write(yaml.safe_dump({'pgp_keys': [self.fingerprint]}))
+
+    def tearDown(self):
+        self.vault.stop()
+        shutil.rmtree(self.directory)
+
+    def run_op(self, args):
+        opt = aomi.cli.parser_factory(args + [
+            '--secretfile', self.secretfile,
+            '--secrets', os.path.join(self.directory, '.secrets'),
+            '--policies', os.path.join(self.directory, 'vault')
+        ])[1]
+        getattr(aomi.seed_action, opt.operation)(self.client, opt)
+
+    def test_export_icefile(self):
+        self.run_op(['seed'])
+        ice_dir = os.path.join(self.directory, 'ice')
+        self.run_op(['export', ice_dir, '--icefile',
+                     '--icefile-prefix', 'exported'])
+        ice_files = os.listdir(ice_dir)
+        assert len(ice_files) == 1
+        assert ice_files[0].startswith('exported-')
+        plain = subprocess.check_output([GPG, '-q', '--batch', '--decrypt',
+                                         os.path.join(ice_dir,
+                                                      ice_files[0])],
+                                        stderr=open(os.devnull, 'w'))
+        archive = zipfile.ZipFile(io.BytesIO(plain))
+        secrets_dir = os.path.join(self.directory, '.secrets')
+        assert yaml.safe_load(archive.read('var0.yml')) == \
+            yaml.safe_load(open(os.path.join(secrets_dir, 'var0.yml')))
+        assert archive.read('file0.pem').decode('utf-8') == \
+            open(os.path.join(secrets_dir, 'file0.pem')).read()
+
+    def test_freeze(self):
+        ice_dir = os.path.join(self.directory, 'ice')
+        opt = aomi.cli.parser_factory([
+            'freeze', ice_dir,
+            '--secretfile', self.secretfile,
+            '--secrets', os.path.join(self.directory, '.secrets'),
+            '--policies', os.path.join(self.directory, 'vault')
+        ])[1]
+        aomi.filez.freeze(ice_dir, opt)
+        ice_files = os.listdir(ice_dir)
+        assert len(ice_files) == 1
+        plain = subprocess.check_output([GPG, '-q', '--batch', '--decrypt',
+                                         os.path.join(ice_dir,
+                                                      ice_files[0])],
+                                        stderr=open(os.devnull, 'w'))
+        archive = zipfile.ZipFile(io.BytesIO(plain))
+        secrets_dir = os.path.join(self.directory, '.secrets')
+        assert archive.read('password0').decode('utf-8') == \
+            open(os.path.join(secrets_dir, 'password0')).read()
+        assert len(archive.namelist()) == len(set(archive.namelist()))
+
+    def test_thaw_selected(self):
+        ice_dir = os.path.join(self.directory, 'ice')
+        args = ['--secretfile', self.secretfile,
+                '--secrets', os.path.join(self.directory, '.secrets'),
+                '--policies', os.path.join(self.directory, 'vault')]
+        opt = aomi.cli.parser_factory(['freeze', ice_dir] + args)[1]
+        aomi.filez.freeze(ice_dir, opt)
+        ice_file = os.path.join(ice_dir, os.listdir(ice_dir)[0])
+        shutil.rmtree(os.path.join(self.directory, '.secrets'))
+        opt = aomi.cli.parser_factory(['thaw', ice_file, '--include',
+                                       'vars0/var1'] + args)[1]
+        aomi.filez.thaw(None, ice_file, opt)
+        assert os.listdir(os.path.join(self.directory, '.secrets')) == \
+            ['var1.yml']
@@ -1,5 +1,6 @@
 import unittest
 import aomi.helpers
+import aomi.registry
 
 class IsTaggedTest(unittest.TestCase):
     def test_happy_path(self):
@@ -30,3 +31,18 @@ class FilePathTest(unittest.TestCase):
 
     def test_subdir_external(self):
         assert aomi.helpers.subdir_path("/a/b/c", "/d/e") is None
+
+class WordListTest(unittest.TestCase):
+    def test_indexing(self):
+        words = aomi.helpers.WordList("foo\n\n  bar \nbaz")
+        assert len(words) == 3
+        assert [words[i] for i in range(0, 3)] == ['foo', 'bar', 'baz']
+        assert words[-1] == 'baz'
+        self.assertRaises(IndexError, lambda: words[3])
+
+    def test_bundled(self):
+        words = aomi.helpers.word_list('animals.txt')
+        assert words is aomi.helpers.word_list('animals.txt')
+        assert list(words) == \
+            [x.strip() for x in
+             aomi.registry.words('animals.txt').splitlines() if x.strip()]
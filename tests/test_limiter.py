@@ -0,0 +1,77 @@
+import time
+import threading
+import unittest
+from aomi.limiter import Limit, Limiter, mount_key
+
+
+class MountKeyTest(unittest.TestCase):
+    def test_mount_key(self):
+        assert mount_key('secret/foo/bar') == 'secret'
+        assert mount_key('auth/userpass/users/bob') == 'auth/userpass'
+        assert mount_key('sys/mounts/foo') == 'sys'
+
+
+class LimitTest(unittest.TestCase):
+    def test_additive_increase(self):
+        limit = Limit(2, 1, 4)
+        for _i in range(20):
+            limit.acquire()
+            limit.release(0.01, 200)
+
+        assert limit.snapshot()['limit'] == 4
+
+    def test_multiplicative_decrease(self):
+        limit = Limit(8, 1, 8)
+        limit.acquire()
+        limit.release(0.01, 429)
+        assert limit.snapshot()['limit'] == 4
+        # a burst of failures within a round trip only counts once
+        limit.acquire()
+        limit.release(1.0, 503)
+        assert limit.snapshot()['limit'] == 4
+
+    def test_latency(self):
+        limit = Limit(8, 1, 8)
+        limit.acquire()
+        limit.release(0.01, 200)
+        limit.acquire()
+        limit.release(0.5, 200)
+        assert limit.snapshot()['limit'] == 4
+
+    def test_floor(self):
+        limit = Limit(1, 1, 8)
+        limit.acquire()
+        limit.release(0.01, 500)
+        assert limit.snapshot()['limit'] == 1
+
+
+class LimiterTest(unittest.TestCase):
+    def test_caps_in_flight(self):
+        limiter = Limiter(concurrency=4, mount_concurrency=2, initial=2)
+        lock = threading.Lock()
+        state = {'now': 0, 'peak': 0}
+
+        def work():
+            limits, _wait = limiter.acquire('secret/foo')
+            with lock:
+                state['now'] = state['now'] + 1
+                state['peak'] = max(state['peak'], state['now'])
+
+            time.sleep(0.01)
+            with lock:
+                state['now'] = state['now'] - 1
+
+            limiter.release(limits, 0.01, 200)
+
+        threads = [threading.Thread(target=work) for _i in range(8)]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert 1 <= state['peak'] <= 2
+        snapshot = limiter.snapshot()
+        assert snapshot['global']['in_flight'] == 0
+        assert snapshot['mounts']['secret']['in_flight'] == 0
+        assert snapshot['mounts']['secret']['queue_seconds'] > 0
@@ -0,0 +1,97 @@
+import unittest
+import requests
+from mock_vault import MockVault, ROOT_TOKEN, set_vault_addr
+from aomi.vault import Client
+
+
+class MockVaultTest(unittest.TestCase):
+    def setUp(self):
+        self.vault = MockVault(seed=42).start()
+        self.addCleanup(set_vault_addr(self.vault.url))
+        self.client = Client()
+        self.client.use_tokens(ROOT_TOKEN, ROOT_TOKEN)
+
+    def tearDown(self):
+        self.vault.stop()
+
+    def raw(self, method, path, token=ROOT_TOKEN, **kwargs):
+        return requests.request(method, "%s/v1/%s" % (self.vault.url, path),
+                                headers={'X-Vault-Token': token}, **kwargs)
+
+    def test_health(self):
+        resp = self.raw('GET', 'sys/health', token=None)
+        assert resp.json()['version'] == '0.7.3'
+
+    def test_permission_denied(self):
+        assert self.raw('GET', 'secret/foo', token='nope').status_code == 403
+
+    def test_kv(self):
+        assert self.client.read('secret/foo') is None
+        self.client.write('secret/foo', bar='baz')
+        self.client.write('secret/foo/bam', boo='bop')
+        assert self.client.read('secret/foo')['data'] == {'bar': 'baz'}
+        assert self.client.list('secret')['data']['keys'] == ['foo', 'foo/']
+        self.client.delete('secret/foo')
+        assert self.client.read('secret/foo') is None
+        assert self.raw('GET', 'nope/foo').status_code == 404
+
+    def test_mounts(self):
+        resp = self.raw('POST', 'sys/mounts/foo',
+                        json={'type': 'generic',
+                              'config': {'max_lease_ttl': 60}})
+        assert resp.status_code == 204
+        mounts = self.raw('GET', 'sys/mounts').json()
+        assert mounts['foo/']['type'] == 'generic'
+        assert mounts['data']['foo/']['config']['max_lease_ttl'] == 60
+        self.client.write('sys/mounts/foo/tune', default_lease_ttl=30)
+        tune = self.client.read('sys/mounts/foo/tune')['data']
+        assert tune['default_lease_ttl'] == 30
+        self.client.write('foo/bar', baz='bam')
+        assert self.client.read('foo/bar')['data'] == {'baz': 'bam'}
+        self.raw('DELETE', 'sys/mounts/foo')
+        assert 'foo/' not in self.raw('GET', 'sys/mounts').json()
+
+    def test_auth_and_policy(self):
+        self.raw('POST', 'sys/auth/userpass', json={'type': 'userpass'})
+        assert 'userpass/' in self.raw('GET', 'sys/auth').json()
+        self.client.write('auth/userpass/users/bob', password='x')
+        assert self.client.read('auth/userpass/users/bob')['data'] == \
+            {'password': 'x'}
+        self.raw('PUT', 'sys/policy/foo', json={'rules': 'path "*" {}'})
+        assert self.raw('GET', 'sys/policy/foo').json()['rules'] == \
+            'path "*" {}'
+        self.raw('PUT', 'sys/audit/file', json={'type': 'file'})
+        assert self.raw('GET', 'sys/audit').json()['file/']['type'] == 'file'
+
+    def test_tokens(self):
+        resp = self.raw('POST', 'auth/token/create',
+                        json={'display_name': 'aomi'})
+        token = resp.json()['auth']['client_token']
+        resp = self.raw('GET', 'auth/token/lookup-self', token=token)
+        assert resp.json()['data']['display_name'] == 'aomi'
+        self.raw('POST', 'auth/token/revoke-self', token=token)
+        resp = self.raw('GET', 'auth/token/lookup-self', token=token)
+        assert resp.status_code == 403
+
+    def test_cubbyhole(self):
+        self.client.write('cubbyhole/foo', bar='baz')
+        assert self.raw('GET', 'cubbyhole/foo').status_code == 200
+        assert self.raw('GET', 'cubbyhole/foo',
+                        token=self.raw('POST', 'auth/token/create')
+                        .json()['auth']['client_token']).status_code == 404
+
+    def test_faults(self):
+        self.vault.fault_rate = 0.5
+        self.vault.retry_after = 0
+        self.client.write('secret/foo', bar='baz')
+        for _i in range(10):
+            assert self.client.read('secret/foo')['data'] == {'bar': 'baz'}
+
+        statuses = [x[2] for x in self.vault.requests]
+        assert 429 in statuses or 503 in statuses
+
+    def test_latency(self):
+        self.vault.latency = 0.05
+        self.vault.jitter = 0.01
+        self.client.read('secret/foo')
+        assert self.vault.paths('GET') == ['secret/foo']
@@ -0,0 +1,43 @@
+import threading
+import unittest
+from aomi.pool import Pool
+
+
+class PoolTest(unittest.TestCase):
+    def test_every_task(self):
+        results = [None] * 50
+
+        def double(index):
+            results[index] = index * 2
+
+        with Pool(4) as pool:
+            for index in range(0, 50):
+                pool.submit(double, index)
+
+        assert results == [x * 2 for x in range(0, 50)]
+
+    def test_nested(self):
+        seen = []
+        lock = threading.Lock()
+        with Pool(3) as pool:
+            def task(depth):
+                with lock:
+                    seen.append(depth)
+
+                if depth < 4:
+                    pool.submit(task, depth + 1)
+                    pool.submit(task, depth + 1)
+
+            pool.submit(task, 0)
+
+        assert len(seen) == 31
+
+    def test_error(self):
+        def boom(item):
+            if item == 3:
+                raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            with Pool(2) as pool:
+                for item in range(0, 10):
+                    pool.submit(boom, item)
@@ -0,0 +1,119 @@
+import os
+import shutil
+import pstats
+import tempfile
+import unittest
+from io import StringIO
+from aomi.profile import CPUProfiler, MemoryProfiler, phase, \
+    resource_sizes, PROFILERS, OTHER
+
+
+def busy(count):
+    return sum([x * x for x in range(0, count)])
+
+
+class ProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profiler = CPUProfiler()
+        PROFILERS.append(self.profiler)
+
+    def tearDown(self):
+        PROFILERS.remove(self.profiler)
+        self.profiler.stop()
+        shutil.rmtree(self.directory)
+
+    def test_phases(self):
+        self.profiler.start(self.directory)
+        with phase('load'):
+            busy(1000)
+            with phase('fetch'):
+                busy(1000)
+
+            busy(1000)
+
+        self.profiler.stop()
+        filenames = self.profiler.dump()
+        assert sorted([os.path.basename(x) for x in filenames]) == \
+            ['fetch.pstats', 'load.pstats', "%s.pstats" % OTHER]
+        for filename in filenames:
+            stats = pstats.Stats(filename)
+            funs = [x[2] for x in stats.stats.keys()]
+            if filename.endswith('load.pstats'):
+                assert 'busy' in funs
+                assert stats.stats[[x for x in stats.stats.keys()
+                                    if x[2] == 'busy'][0]][0] == 2
+            elif filename.endswith('fetch.pstats'):
+                assert 'busy' in funs
+
+        out = StringIO()
+        self.profiler.summary(out)
+        assert 'load' in out.getvalue()
+        assert 'busy' in out.getvalue()
+
+    def test_disabled(self):
+        with phase('load'):
+            busy(10)
+
+        assert self.profiler.profiles == {}
+
+
+class Thing(object):
+    def __init__(self, size):
+        self.data = 'x' * size
+
+
+class FakeContext(object):
+    def __init__(self, things):
+        self.opt = Thing(100000)
+        self.things = things
+
+    def mounts(self):
+        return []
+
+    def auths(self):
+        return []
+
+    def logs(self):
+        return []
+
+    def resources(self):
+        return self.things
+
+
+class MemoryProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.profiler = MemoryProfiler()
+        PROFILERS.append(self.profiler)
+
+    def tearDown(self):
+        PROFILERS.remove(self.profiler)
+        if self.profiler.enabled:
+            self.profiler.stop()
+
+    def test_phases(self):
+        self.profiler.start()
+        keep = []
+        with phase('load'):
+            keep.append('y' * 100000)
+            with phase('fetch'):
+                keep.append('z' * 200000)
+
+        self.profiler.stop()
+        assert self.profiler.phases['load']['peak'] >= 300000
+        assert self.profiler.phases['fetch']['peak'] >= 200000
+        assert sum([x[1] for x in self.profiler.phases['load']['sites']]) \
+            >= 300000
+        out = StringIO()
+        self.profiler.summary(out)
+        assert 'test_profile.py' in out.getvalue()
+
+    def test_resource_sizes(self):
+        ctx = FakeContext([Thing(1000), Thing(2000)])
+        sizes = resource_sizes(ctx)
+        assert sizes['Thing'][0] == 2
+        assert 3000 < sizes['Thing'][1] < 10000
+        self.profiler.enabled = True
+        self.profiler.measure('load', ctx)
+        assert self.profiler.resources['load'] == sizes
+        self.profiler.enabled = False
@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+import aomi.registry
+from aomi.helpers import random_word
+from aomi.template import load_template_help
+
+
+class RegistryTest(unittest.TestCase):
+    def setUp(self):
+        aomi.registry._REGISTRY.clear()
+
+    def tearDown(self):
+        aomi.registry._REGISTRY.clear()
+
+    def test_templates(self):
+        templates = aomi.registry.templates()
+        assert 'shenv' in templates
+        assert templates['shenv']['name']
+        for builtin in templates.keys():
+            assert os.path.exists(aomi.registry.template_path(builtin))
+
+    def test_template_help(self):
+        help_obj = load_template_help('pip-conf')
+        assert help_obj['name'] == 'Python pip configuration'
+        assert 'user' in help_obj['args']
+        assert load_template_help('nope') == {}
+
+    def test_words(self):
+        assert 'wombat' in aomi.registry.words('animals.txt').splitlines()
+        assert len(random_word().split('-')) >= 2
+
+    def test_generated(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'builtins.py')
+            aomi.registry.write(filename)
+            generated = {}
+            exec(open(filename).read(), generated)
+            assert generated['TEMPLATES'] == aomi.registry.build()['templates']
+            assert generated['WORDS'] == aomi.registry.build()['words']
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,121 @@
+import time
+import unittest
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectTimeout, ReadTimeout
+from email.utils import formatdate
+from aomi.retry import RetryPolicy, retry_after
+from aomi.vault import InstrumentedAdapter
+
+
+def fake_request(method, path='secret/foo'):
+    return requests.Request(method,
+                            "http://127.0.0.1:8200/v1/%s" % path).prepare()
+
+
+def fake_response(status, headers=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    resp._content = b''
+    resp._content_consumed = True
+    return resp
+
+
+class ScriptedAdapter(HTTPAdapter):
+    def __init__(self, script, **kwargs):
+        self.script = list(script)
+        self.sent = 0
+        super(ScriptedAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.sent = self.sent + 1
+        outcome = self.script.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+
+        return fake_response(outcome)
+
+
+class RetryingAdapter(InstrumentedAdapter, ScriptedAdapter):
+    pass
+
+
+class RetryAfterTest(unittest.TestCase):
+    def test_seconds(self):
+        assert retry_after(fake_response(429, {'Retry-After': '3'})) == 3.0
+
+    def test_date(self):
+        header = formatdate(time.time() + 30, usegmt=True)
+        delay = retry_after(fake_response(429, {'Retry-After': header}))
+        assert 25 < delay <= 30
+
+    def test_missing(self):
+        assert retry_after(fake_response(429)) is None
+        assert retry_after(fake_response(429, {'Retry-After': 'soon'})) is None
+
+
+class RetryStateTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(reads=3, writes=1, budget=60,
+                                  base=0.5, cap=4)
+
+    def test_reads(self):
+        state = self.policy.state(fake_request('GET'))
+        for _i in range(3):
+            delay = state.next_delay(response=fake_response(503))
+            assert 0.5 <= delay <= 4
+
+        assert state.next_delay(response=fake_response(503)) is None
+        assert state.retries == 3
+
+    def test_not_retryable(self):
+        state = self.policy.state(fake_request('GET'))
+        assert state.next_delay(response=fake_response(200)) is None
+        assert state.next_delay(response=fake_response(403)) is None
+        assert state.next_delay(response=fake_response(429)) is not None
+
+    def test_writes(self):
+        state = self.policy.state(fake_request('PUT'))
+        assert state.next_delay(response=fake_response(500)) is None
+        assert state.next_delay(exception=ReadTimeout()) is None
+        assert state.next_delay(exception=ConnectTimeout()) is not None
+        assert state.next_delay(response=fake_response(429)) is None
+
+    def test_health(self):
+        state = self.policy.state(fake_request('GET', 'sys/health'))
+        assert state.next_delay(response=fake_response(429)) is None
+
+    def test_retry_after(self):
+        state = self.policy.state(fake_request('GET'))
+        resp = fake_response(429, {'Retry-After': '7'})
+        assert state.next_delay(response=resp) == 7.0
+        assert state.slept == 7.0
+
+    def test_budget(self):
+        self.policy.budget = 5
+        state = self.policy.state(fake_request('GET'))
+        resp = fake_response(429, {'Retry-After': '7'})
+        assert state.next_delay(response=resp) is None
+        assert state.retries == 0
+
+
+class AdapterTest(unittest.TestCase):
+    def adapter(self, script):
+        policy = RetryPolicy(reads=3, writes=1, base=0.001, cap=0.002)
+        return RetryingAdapter(script=script, policy=policy)
+
+    def test_eventual_success(self):
+        adapter = self.adapter([503, ConnectTimeout(), 429, 200])
+        assert adapter.send(fake_request('GET')).status_code == 200
+        assert adapter.sent == 4
+
+    def test_gives_up(self):
+        adapter = self.adapter([503, 503])
+        assert adapter.send(fake_request('PUT')).status_code == 503
+        assert adapter.sent == 2
+
+    def test_raises(self):
+        adapter = self.adapter([ReadTimeout()])
+        with self.assertRaises(ReadTimeout):
+            adapter.send(fake_request('PUT'))
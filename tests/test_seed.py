@@ -1,4 +1,6 @@
+import base64
 import unittest
+import aomi.exceptions
 import aomi.model.generic
 import aomi.cli
 
@@ -26,3 +28,53 @@ class GeneratedSecretTest(unittest.TestCase):
         secret2 = aomi.model.generic.generate_obj('foo/bar', og_obj, secret, aomi_opt)
         assert secret['user'] == secret2['user']
         assert secret['pass'] != secret2['pass']
+
+
+class GeneratorTest(unittest.TestCase):
+    def setUp(self):
+        self.opt = aomi.cli.parser_factory(['seed'])[1]
+
+    def generated(self, keys):
+        return aomi.model.generic.Generated({'generated': {
+            'mount': 'foo', 'path': 'bar', 'keys': keys}}, self.opt)
+
+    def test_methods(self):
+        secret = self.generated([
+            {'name': 'hex', 'method': 'hex:16'},
+            {'name': 'b64', 'method': 'base64:32'},
+            {'name': 'words', 'method': 'words'},
+            {'name': 'static', 'method': 'static', 'value': 'foo'}
+        ])
+        obj = secret.generate_obj()
+        assert len(obj['hex']) == 32
+        int(obj['hex'], 16)
+        assert len(base64.b64decode(obj['b64'])) == 32
+        assert len(obj['words'].split('-')) >= 2
+        assert obj['static'] == 'foo'
+
+    def test_bad_methods(self):
+        for method in ['nope', 'hex', 'hex:0', 'hex:foo', 'uuid:4']:
+            self.assertRaises(aomi.exceptions.AomiData, self.generated,
+                              [{'name': 'foo', 'method': method}])
+
+    def test_batch(self):
+        secrets = [self.generated([{'name': 'foo', 'method': 'hex:8'}])
+                   for _i in range(0, 10)]
+        secrets[0].existing = {'foo': 'bar'}
+        aomi.model.generic.generate_secrets(secrets)
+        assert secrets[0].obj() == {'foo': 'bar'}
+        assert len(set([x.obj()['foo'] for x in secrets[1:]])) == 9
+        assert all([x.generated for x in secrets])
+
+    def test_existing_untouched(self):
+        secret = self.generated([
+            {'name': 'foo', 'method': 'hex:8', 'overwrite': True},
+            {'name': 'bar', 'method': 'hex:8'}
+        ])
+        secret.existing = {'foo': 'old', 'bar': 'kept', 'baz': ['x']}
+        obj = secret.generate_obj()
+        assert obj['foo'] != 'old'
+        assert obj['bar'] == 'kept'
+        assert obj['baz'] == ['x']
+        assert secret.existing == {'foo': 'old', 'bar': 'kept',
+                                   'baz': ['x']}
@@ -0,0 +1,62 @@
+import unittest
+import requests
+import aomi.stats
+
+
+def fake_request(method, path, body=None):
+    return requests.Request(method, "http://127.0.0.1:8200/v1/%s" % path,
+                            data=body).prepare()
+
+
+class PathTest(unittest.TestCase):
+    def test_operation(self):
+        url = 'http://127.0.0.1:8200/v1/secret/foo'
+        assert aomi.stats.operation('GET', url) == 'read'
+        assert aomi.stats.operation('GET', url + '?list=true') == 'list'
+        assert aomi.stats.operation('GET', url + '?list=True') == 'list'
+        assert aomi.stats.operation('LIST', url) == 'list'
+        assert aomi.stats.operation('PUT', url) == 'write'
+        assert aomi.stats.operation('POST', url) == 'write'
+        assert aomi.stats.operation('DELETE', url) == 'delete'
+
+    def test_template(self):
+        assert aomi.stats.path_template('secret/foo/bar') == 'secret/*'
+        assert aomi.stats.path_template('secret') == 'secret'
+        assert aomi.stats.path_template('sys/mounts/foo/tune') == 'sys/mounts/*'
+        assert aomi.stats.path_template('sys/mounts') == 'sys/mounts'
+        assert aomi.stats.path_template('auth/userpass/users/bob') == 'auth/userpass/*'
+
+    def test_percentile(self):
+        values = [float(x) for x in range(1, 101)]
+        assert aomi.stats.percentile(values, 50) == 50.0
+        assert aomi.stats.percentile(values, 95) == 95.0
+        assert aomi.stats.percentile([], 95) == 0.0
+
+
+class StatsTest(unittest.TestCase):
+    def setUp(self):
+        self.stats = aomi.stats.Stats()
+        self.stats.enabled = True
+
+    def test_disabled(self):
+        self.stats.enabled = False
+        self.stats.record(fake_request('GET', 'secret/foo'), None, 1.0)
+        assert self.stats.calls() == []
+
+    def test_summary(self):
+        with self.stats.resource('Generic VarFile'):
+            self.stats.record(fake_request('GET', 'secret/foo'), None, 0.5)
+            self.stats.record(fake_request('PUT', 'secret/foo', 'abcd'),
+                              None, 0.25)
+
+        self.stats.record(fake_request('GET', 'sys/mounts'), None, 1.0)
+        summary = self.stats.summary(slowest=2)
+        assert summary['requests'] == 3
+        assert summary['bytes'] == 4
+        assert summary['operations']['read']['count'] == 2
+        assert summary['operations']['read']['max'] == 1.0
+        assert summary['resources']['Generic VarFile']['count'] == 2
+        assert summary['resources'][aomi.stats.UNKNOWN]['count'] == 1
+        assert summary['templates']['secret/*']['count'] == 2
+        assert [x['path'] for x in summary['slowest']] == \
+            ['sys/mounts', 'secret/foo']
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+from mock_vault import MockVault, ROOT_TOKEN, set_vault_addr
+from benchmark import generate
+import aomi.cli
+import aomi.seed_action
+from aomi.vault import Client
+from aomi.trace import TRACER, Span
+from aomi.timings import resource_times, report
+
+
+def a_span(span_id, parent, name, start, end, resource='r'):
+    span = Span(span_id, parent, name, {'resource': resource, 'type': 'T'})
+    span.start = start
+    span.end = end
+    return span
+
+
+class ResourceTimesTest(unittest.TestCase):
+    def test_exclusive(self):
+        spans = [a_span(1, None, 'sync', 0.0, 10.0),
+                 a_span(2, 1, 'diff', 1.0, 4.0),
+                 a_span(3, 2, 'obj', 2.0, 3.0),
+                 Span(4, 1, 'vault', {}),
+                 a_span(5, 4, 'obj', 5.0, 7.0)]
+        spans[3].start = 4.5
+        spans[3].end = 7.5
+        times = resource_times(spans)[('T', 'r')]
+        assert times == {'render': 3.0, 'read': 0.0,
+                         'diff': 2.0, 'write': 5.0}
+
+
+class TimingsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.vault = MockVault().start()
+        self.addCleanup(set_vault_addr(self.vault.url))
+        self.client = Client()
+        self.client.use_tokens(ROOT_TOKEN, ROOT_TOKEN)
+        TRACER.enabled = True
+
+    def tearDown(self):
+        TRACER.enabled = False
+        TRACER._spans = []
+        self.vault.stop()
+        shutil.rmtree(self.directory)
+
+    def test_seed(self):
+        secretfile = generate(self.directory, 10)
+        opt = aomi.cli.parser_factory([
+            'seed', '--timings',
+            '--secretfile', secretfile,
+            '--secrets', os.path.join(self.directory, '.secrets'),
+            '--policies', os.path.join(self.directory, 'vault')
+        ])[1]
+        aomi.seed_action.seed(self.client, opt)
+        out = StringIO()
+        report(out)
+        output = out.getvalue()
+        for phase in ['load', 'fetch', 'policies', 'mounts', 'resources']:
+            assert "  %s " % phase in output
+
+        assert 'VarFile (3)' in output
+        assert 'Generic VarFile vars0/var0' in output
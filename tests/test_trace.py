@@ -0,0 +1,62 @@
+import json
+import unittest
+import tempfile
+import aomi.trace
+
+
+class TracerTest(unittest.TestCase):
+    def setUp(self):
+        self.tracer = aomi.trace.Tracer()
+        self.tracer.enabled = True
+
+    def test_disabled(self):
+        self.tracer.enabled = False
+        with self.tracer.span('foo') as a_span:
+            assert a_span is None
+
+        assert self.tracer.spans() == []
+
+    def test_nesting(self):
+        with self.tracer.span('outer') as outer:
+            with self.tracer.span('inner', resource='foo') as inner:
+                inner.attrs['status'] = 200
+
+        with self.tracer.span('sibling'):
+            pass
+
+        spans = self.tracer.spans()
+        assert [x.name for x in spans] == ['outer', 'inner', 'sibling']
+        assert spans[0].parent is None
+        assert spans[1].parent == outer.span_id
+        assert spans[1].attrs == {'resource': 'foo', 'status': 200}
+        assert spans[2].parent is None
+        assert spans[0].end >= spans[1].end
+
+    def test_exception(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.span('boom'):
+                raise ValueError('boom')
+
+        assert [x.name for x in self.tracer.spans()] == ['boom']
+        with self.tracer.span('after'):
+            pass
+
+        assert self.tracer.spans()[1].parent is None
+
+    def test_export(self):
+        with self.tracer.span('outer'):
+            with self.tracer.span('inner'):
+                pass
+
+        handle = tempfile.TemporaryFile('w+')
+        aomi.trace.export_jsonl(self.tracer.spans(), handle)
+        handle.seek(0)
+        lines = [json.loads(x) for x in handle.read().splitlines()]
+        assert [x['name'] for x in lines] == ['outer', 'inner']
+        assert lines[1]['parent'] == lines[0]['id']
+
+        handle = tempfile.TemporaryFile('w+')
+        aomi.trace.export_chrome(self.tracer.spans(), handle)
+        handle.seek(0)
+        events = json.load(handle)['traceEvents']
+        assert [x['ph'] for x in events] == ['X', 'X']
@@ -1,5 +1,9 @@
+import json
+import threading
 import unittest
-from aomi.vault import grok_seconds, is_aws
+import requests
+from mock_vault import set_vault_addr
+from aomi.vault import grok_seconds, is_aws, Client
 
 class HelperTest(unittest.TestCase):
     def test_seconds_to_seconds(self):
@@ -22,3 +26,62 @@ class HelperTest(unittest.TestCase):
     def test_is_not_aws(self):
         assert not is_aws({'aaa': True})
 
+
+def fake_response(body):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.headers['Content-Type'] = 'application/json'
+    resp._content = json.dumps(body).encode('utf-8')
+    return resp
+
+
+class ClientTokenTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(set_vault_addr('http://127.0.0.1:8200'))
+        self.client = Client()
+        self.client.use_tokens('initial', 'operational')
+        self.mismatches = []
+        self.misreads = []
+        self.errors = []
+        self.client.session.request = self.fake_request
+
+    def fake_request(self, method, url, headers=None, **_kwargs):
+        path = url.split('/v1/', 1)[1]
+        expected = 'initial' if path.startswith('cubbyhole') \
+            else 'operational'
+        if headers.get('X-Vault-Token') != expected:
+            self.mismatches.append((method, path))
+
+        return fake_response({'data': {'path': path}})
+
+    def hammer(self, offset):
+        # failures are kept, as asserting in a thread is not noticed
+        try:
+            for i in range(200):
+                if (i + offset) % 2:
+                    path = 'cubbyhole/foo%s' % i
+                else:
+                    path = 'secret/foo%s' % i
+
+                if self.client.read(path)['data']['path'] != path:
+                    self.misreads.append(path)
+
+                self.client.write(path, foo='bar')
+                self.client.delete(path)
+        except Exception as exception:  # pylint: disable=broad-except
+            self.errors.append(exception)
+
+    def test_concurrent_tokens(self):
+        threads = [threading.Thread(target=self.hammer, args=(i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert self.errors == []
+        assert self.misreads == []
+        assert self.mismatches == []
+        assert self.client.token == 'operational'
+        assert self.client.cubbyhole.token == 'initial'